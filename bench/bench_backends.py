@@ -0,0 +1,102 @@
+# Холодный старт (импорт + загрузка + прогрев), RSS процесса и пропускная способность
+# бэкендов разметки. Каждая модель меряется в отдельном процессе.
+# Без аргументов меряется NumpyBackend на случайных весах сети из research.ipynb
+# (скорость от значений весов не зависит).
+# Запуск из корня репозитория: python bench/bench_backends.py [модель.keras] [модель.npz] ...
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEGMENT_SIZE = 12000
+
+
+# make_random_npz пишет сеть из research.ipynb (вход (12000, k)) со случайными весами
+# в формате convert_keras_model
+def make_random_npz(path: str, k: int = 1, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    layers, arrays = [], {}
+
+    def add(class_name, config, weights=()):
+        index = len(layers)
+        layers.append({'class_name': class_name, 'config': config, 'n_weights': len(weights)})
+        for j, weight in enumerate(weights):
+            arrays[f'{index}_{j}'] = np.asarray(weight, dtype=np.float32)
+
+    def conv(class_name, filters, kernel_size, strides, activation, channels):
+        shape = (kernel_size, channels, filters) if class_name == 'Conv1D' else (kernel_size, filters, channels)
+        add(class_name, {'filters': filters, 'kernel_size': [kernel_size], 'strides': [strides],
+                         'padding': 'same', 'activation': activation},
+            [rng.normal(0, 1 / np.sqrt(kernel_size * channels), shape), np.zeros(filters)])
+
+    def batch_norm(channels):
+        add('BatchNormalization', {'center': True, 'scale': False, 'epsilon': 1e-3},
+            [np.zeros(channels), np.zeros(channels), np.ones(channels)])
+
+    channels = k
+    for filters, pool in ((50, 2), (100, 2), (100, 3)):
+        conv('Conv1D', filters, 10, 2, 'relu', channels)
+        batch_norm(filters)
+        add('MaxPooling1D', {'pool_size': [pool], 'strides': [pool], 'padding': 'same'})
+        add('Dropout', {'rate': 0.2})
+        channels = filters
+    add('Flatten', {})
+    add('Dense', {'units': 300, 'activation': 'relu'}, [rng.normal(0, 0.01, (12500, 300)), np.zeros(300)])
+    add('Dense', {'units': 12500, 'activation': 'relu'}, [rng.normal(0, 0.06, (300, 12500)), np.zeros(12500)])
+    add('Reshape', {'target_shape': [125, 100]})
+    for strides in (3, 4):
+        conv('Conv1DTranspose', 100, 10, strides, 'relu', 100)
+        batch_norm(100)
+    conv('Conv1DTranspose', 100, 100, 4, 'sigmoid', 100)
+    conv('Conv1DTranspose', 4, 50, 2, 'sigmoid', 100)
+    np.savez(path, layers=json.dumps(layers), **arrays)
+
+
+def run(model_path: str, n_windows: int = 32, batch_size: int = 8) -> dict:
+    start = time.perf_counter()
+    from server.backends import load_backend
+    model = load_backend(model_path)
+    model.predict(np.zeros((1, SEGMENT_SIZE, 1), dtype=np.float32), verbose=0)
+    cold_start = time.perf_counter() - start
+
+    batch = np.random.default_rng(0).normal(0, 1, (batch_size, SEGMENT_SIZE, 1)).astype(np.float32)
+    start = time.perf_counter()
+    for _ in range(n_windows // batch_size):
+        model.predict(batch, verbose=0)
+    elapsed = time.perf_counter() - start
+    return {
+        'model': model_path,
+        'backend': model.__class__.__name__,
+        'cold_start_s': cold_start,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'samples_per_second': n_windows // batch_size * batch_size * SEGMENT_SIZE / elapsed,
+    }
+
+
+def main(*model_paths: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        if not model_paths:
+            model_paths = (os.path.join(tmp, 'random.npz'),)
+            make_random_npz(model_paths[0])
+        for path in model_paths:
+            out = subprocess.run([sys.executable, __file__, '--run', path], capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{path}: failed\n{out.stderr.strip().splitlines()[-1]}")
+                continue
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{result['backend']} ({os.path.basename(path)}): cold start {result['cold_start_s']:.2f}s, "
+                  f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['samples_per_second'] / 1e3:.0f}k samples/s")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        print(json.dumps(run(sys.argv[2])))
+    else:
+        main(*sys.argv[1:])
@@ -0,0 +1,72 @@
+# Сверка и замер compute_features против расчёта признаков циклом по аномалиям (scipy.signal.welch
+# и статистики numpy на каждую аномалию). Время в зависимости от числа аномалий.
+# Запуск из корня репозитория: python bench/bench_features.py [число аномалий ...]
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parser.features import (FEATURE_BANDS, FEATURE_FREQUENCY_RANGE, FEATURE_SEGMENT, FEATURE_MIN_SAMPLES,
+                             compute_features)
+
+SAMPLING_FREQUENCY = 400
+
+
+# Признаки каждой аномалии по отдельности
+def loop_features(signals: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> tuple:
+    dominant_frequency = np.full(len(starts), np.nan)
+    band_power = np.full((len(starts), len(FEATURE_BANDS)), np.nan)
+    channel_stats = np.zeros((len(starts), signals.shape[0], 4))
+    low, high = FEATURE_FREQUENCY_RANGE
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        part = signals[:, start:end].astype(np.float64)
+        channel_stats[i] = np.stack((part.mean(axis=1), part.std(axis=1), np.ptp(part, axis=1),
+                                     np.sqrt(np.mean(part ** 2, axis=1))), axis=1)
+        if end - start < FEATURE_MIN_SAMPLES:
+            continue
+        nperseg = min(end - start, FEATURE_SEGMENT)
+        frequencies, psd = signal.welch(part, SAMPLING_FREQUENCY, window='hann', nperseg=nperseg,
+                                        noverlap=nperseg // 2, nfft=FEATURE_SEGMENT, axis=1)
+        psd = psd.mean(axis=0)
+        search = (frequencies >= low) & (frequencies <= high)
+        dominant_frequency[i] = frequencies[search][np.argmax(psd[search])]
+        band_power[i] = [psd[(frequencies >= band_low) & (frequencies <= band_high)].sum()
+                         * SAMPLING_FREQUENCY / FEATURE_SEGMENT for band_low, band_high in FEATURE_BANDS.values()]
+    return dominant_frequency, band_power, channel_stats
+
+
+# Шесть часов шума с аномалиями длиной от 0.25 до 20 секунд: swd 7 Гц, остальные 2.5 Гц
+def synthetic(n_events: int, n_samples: int = SAMPLING_FREQUENCY * 3600 * 6, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    signals = rng.normal(0, 1e-5, (3, n_samples)).astype(np.float32)
+    gap = n_samples // n_events
+    starts = np.arange(n_events) * gap + rng.integers(0, gap // 4, n_events)
+    ends = starts + np.minimum(rng.integers(100, 8000, n_events), gap // 2)
+    frequencies = np.where(rng.random(n_events) < 0.5, 7.0, 2.5)
+    for start, end, frequency in zip(starts, ends, frequencies):
+        t = np.arange(end - start) / SAMPLING_FREQUENCY
+        signals[:, start:end] += (1e-4 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+    return signals, starts, ends
+
+
+if __name__ == '__main__':
+    sizes = [int(value) for value in sys.argv[1:]] or [100, 1000, 5000, 20000]
+    for n_events in sizes:
+        signals, starts, ends = synthetic(n_events)
+
+        start = time.perf_counter()
+        expected = loop_features(signals, starts, ends)
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = compute_features(signals, starts, ends, SAMPLING_FREQUENCY)
+        vectorized_time = time.perf_counter() - start
+
+        assert np.array_equal(expected[0], actual.dominant_frequency, equal_nan=True), 'dominant frequency differs'
+        assert np.allclose(expected[1], actual.band_power, rtol=1e-4, equal_nan=True), 'band power differs'
+        assert np.allclose(expected[2], actual.channel_stats, rtol=1e-4, atol=1e-9), 'channel stats differ'
+        print(f"{n_events:6} anomalies: loop {loop_time:6.2f}s, compute_features {vectorized_time:6.2f}s "
+              f"({vectorized_time / n_events * 1e6:.0f} us/anomaly), speedup {loop_time / vectorized_time:.1f}x")
@@ -0,0 +1,40 @@
+# Пропускная способность разметки (точек в секунду) и пик памяти numpy
+# для разных размеров батча и перекрытия окон.
+# Без пути к модели используется заглушка той же формы входа/выхода, тогда
+# измеряется только накладной расход самого скользящего окна.
+# Запуск из корня репозитория: python bench/bench_inference.py [модель.keras] [n_samples]
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server.inference import benchmark_batch_sizes
+from server.scaler import StreamingScaler
+
+
+class StubModel:
+    def predict(self, batch, verbose=0):
+        # Четыре "вероятности" классов по порогам амплитуды
+        x = batch[:, :, :1]
+        return np.concatenate((np.abs(x) < 1, x > 1, x < -1, np.abs(x) > 3), axis=2).astype(np.float32)
+
+
+def main(model_path: str = '', n_samples: int = 8640000) -> None:
+    if model_path:
+        from server.ai import load_model
+        model = load_model(model_path)
+    else:
+        model = StubModel()
+    signals = np.random.default_rng(0).normal(0, 1, (1, n_samples)).astype(np.float32)
+    scaler = StreamingScaler(1).fit([signals.T])
+
+    for overlap in (0.0, 0.5):
+        for result in benchmark_batch_sizes(model, signals, scaler, overlap=overlap):
+            print(f"overlap {overlap:.2f} batch {result['batch_size']:>2}: {result['windows']} windows, "
+                  f"{result['samples_per_second'] / 1e6:.1f}M samples/s, "
+                  f"peak {result['peak_memory_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else '', *map(int, sys.argv[2:]))
@@ -0,0 +1,89 @@
+# Пиковый RSS пайплайна (без модели и экспорта edf) для старой раскладки данных
+# (float64 матрица + pandas + StandardScaler) и для Recording (float32 + int8 представления).
+# Каждый вариант запускается в отдельном процессе, чтобы пики не смешивались.
+# Запуск из корня репозитория: python bench/bench_memory.py [длительность, сек]
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAX_SAMPLES = 8640000
+
+
+# Прежняя prepare_data: DataFrame и StandardScaler поверх всей матрицы
+def legacy_prepare_data(path: str, k: int = 3):
+    import pandas as pd
+    from sklearn.preprocessing import StandardScaler
+    from parser.parser import parse_file
+
+    data_test = parse_file(path)
+    data_df = pd.DataFrame(data_test[0])[[0, 1, 2]]
+    data_df.columns = ['1', '2', '3']
+    if k == 3:
+        x_data = StandardScaler().fit_transform(np.array(data_df[['1', '2', '3']]))
+    else:
+        x_data = StandardScaler().fit_transform(np.array(data_df['1']).reshape(-1, 1))
+    num_segments = len(x_data) // 12000
+    return data_test, x_data[:num_segments * 12000].reshape(-1, 12000, k)
+
+
+def run_legacy(path: str) -> None:
+    from parser.parser import find_runs
+    from visual.visual import plot_channel
+
+    data_test, x_data = legacy_prepare_data(path, k=1)
+    data = data_test[0][:MAX_SAMPLES]
+    data[:, -1] = 0
+    find_runs(data[:, 3], data[:, :3].T)
+    for channel_index in range(3):
+        plot_channel(data, 'channel', channel_index)
+
+
+def run_recording(path: str) -> None:
+    from server.ai import fit_scaler, SEGMENT_SIZE
+    from parser.parser import find_runs, read_recording
+    from visual.visual import plot_channel
+
+    recording = read_recording(path, max_samples=MAX_SAMPLES)
+    # Нормированные окна входа модели, как в InferenceEngine: по 8 окон за раз
+    scaler = fit_scaler(recording, k=1)
+    batch = []
+    for index, window in enumerate(recording.iter_windows(SEGMENT_SIZE, picks=[0])):
+        batch.append(scaler.transform(window, index * SEGMENT_SIZE, out=np.empty_like(window)))
+        if len(batch) == 8:
+            np.stack(batch)
+            batch = []
+    recording.labels[:] = 0
+    find_runs(recording.labels, recording.signals)
+    for channel_index in range(3):
+        plot_channel(recording, 'channel', channel_index)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(duration: float = MAX_SAMPLES / 400) -> None:
+    bench_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        # Генерация тоже в отдельном процессе: ru_maxrss наследуется дочерними процессами
+        path = os.path.join(tmp, 'bench.edf')
+        subprocess.run([sys.executable, os.path.join(bench_dir, 'synthetic.py'), path, str(duration), '200'],
+                       capture_output=True, check=True)
+        for variant in ('legacy', 'recording'):
+            out = subprocess.run([sys.executable, __file__, '--variant', variant, path],
+                                 capture_output=True, text=True, check=True)
+            print(f"{variant}: peak RSS {out.stdout.strip().splitlines()[-1]} MB")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--variant']:
+        {'legacy': run_legacy, 'recording': run_recording}[sys.argv[2]](sys.argv[3])
+        print(f"{peak_rss_mb():.0f}")
+    else:
+        main(*map(float, sys.argv[1:]))
@@ -0,0 +1,95 @@
+# Размер json и время построения графика канала: прежний plot_channel
+# (по трассе на каждую границу аномалии) против слоя из одной трассы на класс.
+# Запуск из корня репозитория: python bench/bench_plot.py [n_samples] [n_events]
+import os
+import sys
+import time
+import json
+
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parser.parser import Recording
+from visual.visual import downsample, plot_channel, decode_array
+
+
+# Прежняя реализация plot_channel
+def legacy_plot_channel(recording: Recording, channel_name: str, channel_index: int, resample_factor: int = 400) -> str:
+    channel_data, time_axis, classes = downsample(recording, channel_index, resample_factor)
+    fig = go.Figure()
+    class_colors = {
+        0: 'rgba(169, 169, 169, 1)',
+        1: 'rgba(255, 0, 0, 0.8)',
+        2: 'rgba(0, 255, 0, 0.8)',
+        3: 'rgba(0, 0, 255, 0.8)'
+    }
+    fig.add_trace(go.Scatter(x=time_axis, y=channel_data, mode='lines', name=channel_name,
+                             line=dict(color=class_colors[0])))
+    class_labels = {0: 'Аномалия отсутствует', 1: 'SWD', 2: 'IS', 3: 'DS'}
+    class_exists = {0: False, 1: False, 2: False, 3: False}
+    for i in range(1, len(classes)):
+        if classes[i] != classes[i-1]:
+            if classes[i-1] != 0:
+                class_exists[classes[i]] = True
+                fig.add_trace(go.Scatter(
+                    x=[time_axis[i], time_axis[i]], y=[min(channel_data), max(channel_data)], mode='lines',
+                    line=dict(color=class_colors[classes[i-1]], dash='dot'), showlegend=True,
+                    legendgroup=class_labels[classes[i-1]], name=class_labels[classes[i-1]]))
+            if classes[i] != 0:
+                class_exists[classes[i]] = True
+                fig.add_trace(go.Scatter(
+                    x=[time_axis[i], time_axis[i]], y=[min(channel_data), max(channel_data)], mode='lines',
+                    line=dict(color=class_colors[classes[i]], dash='dot'), showlegend=True,
+                    name=class_labels[classes[i]], legendgroup=class_labels[classes[i]]))
+    for class_type in class_labels:
+        if class_exists[class_type]:
+            fig.add_trace(go.Scatter(x=[None], y=[None], mode='markers',
+                                     marker=dict(color=class_colors[class_type], size=10),
+                                     name=class_labels[class_type], showlegend=True,
+                                     legendgroup=class_labels[classes[i]]))
+    fig.update_layout(title=f"График канала: {channel_name}", xaxis_title="Время (секунды)",
+                      yaxis_title="Амплитуда", legend_title="Тип аномалии")
+    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def synthetic_recording(n_samples: int, n_events: int, seed: int = 0) -> Recording:
+    rng = np.random.default_rng(seed)
+    labels = np.zeros(n_samples, dtype=np.int8)
+    cell = n_samples // n_events
+    starts = np.arange(n_events) * cell + rng.integers(0, cell // 2, n_events)
+    lengths = rng.integers(400, max(cell // 2, 401), n_events)
+    for start, length, label in zip(starts, lengths, rng.integers(1, 4, n_events)):
+        labels[start:start + length] = label
+    return Recording(rng.normal(0, 1e-4, (3, n_samples)), labels)
+
+
+def boundaries(fig_json: str) -> list:
+    # Все x границ аномалий из трасс с пунктиром, без разделителей
+    x = []
+    for trace in json.loads(fig_json)['data']:
+        if trace.get('line', {}).get('dash') == 'dot':
+            x += [value for value in decode_array(trace['x']).tolist() if value == value]
+    return sorted(set(x))
+
+
+def main(n_samples: int = 8640000, n_events: int = 3000) -> None:
+    recording = synthetic_recording(n_samples, n_events)
+    results = {}
+    for name, plot in (('legacy', legacy_plot_channel), ('layer', plot_channel)):
+        start = time.perf_counter()
+        fig_json = plot(recording, 'FrL', 0)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        n_traces = len(json.loads(fig_json)['data'])
+        parse_time = time.perf_counter() - start
+        results[name] = fig_json
+        print(f"{name}: {len(fig_json) / 1e6:.2f} MB, {n_traces} traces, "
+              f"build {build_time:.2f}s, json parse {parse_time * 1000:.0f}ms")
+
+    assert boundaries(results['legacy']) == boundaries(results['layer'])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
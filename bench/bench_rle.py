@@ -0,0 +1,96 @@
+# Сверка и замер find_runs против прежнего цикла по точкам из save_to_edf.
+# Запуск из корня репозитория: python bench/bench_rle.py [n_samples] [n_events]
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parser.parser import Analytics, find_runs
+
+
+# Прежняя реализация разметки из save_to_edf (без записи edf)
+def legacy_analytics(signals: np.ndarray, classes: np.ndarray, sampling_frequency: int = 400) -> Analytics:
+    analytics = Analytics(sampling_frequency)
+    analytics.total_time = len(classes) / sampling_frequency
+    i = 0
+    last_end = 0
+    while i < len(classes):
+        class_label = classes[i]
+        if class_label != 0:
+            start = i
+            while i < len(classes) and classes[i] == class_label:
+                i += 1
+            end = i
+
+            onset_start = start / sampling_frequency
+            onset_end = end / sampling_frequency
+            duration = onset_end - onset_start
+
+            analytics.anomaly_count += 1
+            analytics.total_duration += duration
+            analytics.durations.append(duration)
+            analytics.anomalies_by_type[class_label].append((onset_start, onset_end))
+
+            if last_end > 0:
+                analytics.intervals.append(onset_start - last_end)
+            last_end = onset_end
+
+            peak_amplitude = np.exp(np.abs(np.max(signals[:, start:end])))
+            analytics.peak_amplitudes[class_label].append(peak_amplitude)
+        else:
+            i += 1
+
+    analytics.calculate_average_duration()
+    analytics.calculate_percentage_with_anomalies()
+    analytics.calculate_average_interval()
+    return analytics
+
+
+def synthetic_classes(n_samples: int, n_events: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    classes = np.zeros(n_samples, dtype=np.int8)
+    starts = np.sort(rng.choice(n_samples - 4000, n_events, replace=False))
+    lengths = rng.integers(1, 4000, n_events)
+    labels = rng.integers(1, 4, n_events)
+    for start, length, label in zip(starts, lengths, labels):
+        classes[start:start + length] = label
+    # Аномалии у самого начала и конца записи - граничные случаи
+    classes[:5] = 2
+    classes[-3:] = 1
+    return classes
+
+
+def assert_equivalent(expected: Analytics, actual: Analytics) -> None:
+    assert expected.anomaly_count == actual.anomaly_count
+    for name in ('total_time', 'total_duration', 'average_duration', 'average_interval', 'time_with_anomalies'):
+        assert np.isclose(getattr(expected, name), getattr(actual, name)), name
+    assert np.allclose(expected.durations, actual.durations)
+    assert np.allclose(expected.intervals, actual.intervals)
+    for label in expected.anomalies_by_type:
+        assert np.allclose(expected.anomalies_by_type[label], actual.anomalies_by_type[label]) \
+            if expected.anomalies_by_type[label] else not actual.anomalies_by_type[label]
+        assert np.allclose(expected.peak_amplitudes[label], actual.peak_amplitudes[label])
+
+
+def main(n_samples: int = 8640000, n_events: int = 3000) -> None:
+    rng = np.random.default_rng(1)
+    signals = rng.normal(0, 1e-4, (3, n_samples))
+    classes = synthetic_classes(n_samples, n_events)
+
+    start = time.perf_counter()
+    expected = legacy_analytics(signals, classes)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = Analytics.from_runs(find_runs(classes, signals), len(classes))
+    vectorized_time = time.perf_counter() - start
+
+    assert_equivalent(expected, actual)
+    print(f"samples={n_samples} anomalies={actual.anomaly_count}")
+    print(f"loop: {legacy_time:.3f}s  find_runs: {vectorized_time:.3f}s  speedup: {legacy_time / vectorized_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,66 @@
+# Время сериализации графика канала и размер ответа: json.dumps с PlotlyJSONEncoder (прежний путь)
+# против figure_to_json со списками чисел и с base64 типизированными массивами,
+# без сжатия и заранее сжатыми gzip/brotli копиями (write_artifact).
+# Запуск из корня репозитория: python bench/bench_serialize.py [длительность записи, часов ...]
+import os
+import sys
+import json
+import gzip
+import time
+
+import numpy as np
+import plotly
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from visual.visual import channel_figure, figure_to_json, decode_array
+from server.artifacts import ARTIFACT_GZIP_LEVEL, ARTIFACT_BROTLI_QUALITY, brotli
+from bench_plot import synthetic_recording
+
+
+def timed(function, repeat: int = 3) -> tuple:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+# traces - массивы x, y каждой трассы графика (для сверки разных сериализаций)
+def traces(fig_json: str) -> list:
+    return [(decode_array(trace['x']), decode_array(trace['y'])) for trace in json.loads(fig_json)['data']]
+
+
+def assert_same(expected: list, actual: list) -> None:
+    assert len(expected) == len(actual), 'trace count differs'
+    for (expected_x, expected_y), (actual_x, actual_y) in zip(expected, actual):
+        assert np.array_equal(expected_x, actual_x, equal_nan=True), 'x differs'
+        assert np.array_equal(expected_y, actual_y, equal_nan=True), 'y differs'
+
+
+def main(hours: list) -> None:
+    for duration in hours:
+        recording = synthetic_recording(int(duration * 3600 * 400), max(int(duration * 30), 1))
+        fig = channel_figure(recording, 'FrL', 0)
+        variants = {
+            'PlotlyJSONEncoder': lambda: json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder),
+            'figure_to_json list': lambda: figure_to_json(fig, 'list'),
+            'figure_to_json base64': lambda: figure_to_json(fig, 'base64'),
+        }
+        print(f"{duration}h, {len(fig.data[0].x)} points:")
+        expected = None
+        for name, encode in variants.items():
+            encode_time, fig_json = timed(encode)
+            expected = expected or traces(fig_json)
+            assert_same(expected, traces(fig_json))
+            data = fig_json.encode()
+            gzip_time, gzipped = timed(lambda: gzip.compress(data, ARTIFACT_GZIP_LEVEL, mtime=0), 1)
+            sizes = f"raw {len(data) / 1e6:6.2f}MB, gzip {len(gzipped) / 1e6:5.2f}MB ({gzip_time * 1000:.0f}ms)"
+            if brotli is not None:
+                brotli_time, compressed = timed(lambda: brotli.compress(data, quality=ARTIFACT_BROTLI_QUALITY), 1)
+                sizes += f", br {len(compressed) / 1e6:5.2f}MB ({brotli_time * 1000:.0f}ms)"
+            print(f"  {name:22} encode {encode_time * 1000:6.1f}ms, {sizes}")
+
+
+if __name__ == '__main__':
+    main([float(value) for value in sys.argv[1:]] or [1, 6, 24])
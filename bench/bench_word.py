@@ -0,0 +1,103 @@
+# Сверка и замер save_analytics_to_word против прежней сборки таблицы через add_row.
+# Запуск из корня репозитория: python bench/bench_word.py [число аномалий ...]
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parser.parser import Analytics
+from server.word import save_analytics_to_word
+
+from docx import Document
+from docx.shared import Pt
+from docx.oxml.ns import nsdecls
+from docx.oxml import parse_xml
+from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from docx.enum.table import WD_ALIGN_VERTICAL
+
+
+# Прежняя таблица деталей: add_row и parse_xml заливки на каждую ячейку
+def legacy_save_analytics_to_word(analytics: Analytics, output_file: str) -> None:
+    doc = Document()
+    doc.add_heading('Отчет по анализу кортикограмм', level=1)
+    doc.add_heading('Детали аномалий', level=2)
+    table = doc.add_table(rows=1, cols=4)
+    table.style = 'Table Grid'
+    hdr_cells = table.rows[0].cells
+    for i, header in enumerate(['Тип аномалии', 'Начало (сек)', 'Конец (сек)', 'Пиковая амплитуда']):
+        hdr_cells[i].text = header
+        hdr_cells[i].paragraphs[0].runs[0].font.bold = True
+        hdr_cells[i].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+        hdr_cells[i].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+        hdr_cells[i]._element.get_or_add_tcPr().append(parse_xml(r'<w:shd {} w:fill="BFBFBF"/>'.format(nsdecls('w'))))
+
+    sorted_anomalies = []
+    for anomaly_type, intervals in analytics.anomalies_by_type.items():
+        for i, (start, end) in enumerate(intervals):
+            anomaly_name = 'SWD' if anomaly_type == 1 else 'IS' if anomaly_type == 2 else 'DS'
+            sorted_anomalies.append((anomaly_name, start, end, analytics.peak_amplitudes[anomaly_type][i]))
+    sorted_anomalies.sort(key=lambda x: x[1])
+
+    for i, (anomaly_name, start, end, peak_amplitude) in enumerate(sorted_anomalies):
+        row_cells = table.add_row().cells
+        row_cells[0].text = anomaly_name
+        row_cells[1].text = f'{start:.2f}'
+        row_cells[2].text = f'{end:.2f}'
+        row_cells[3].text = f'{peak_amplitude:.10e}'
+        for cell in row_cells:
+            cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+            for run in cell.paragraphs[0].runs:
+                run.font.size = Pt(10)
+        shading_color = "D3D3D3" if i % 2 == 0 else "FFFFFF"
+        for cell in row_cells:
+            cell._element.get_or_add_tcPr().append(parse_xml(r'<w:shd {} w:fill="{}"/>'.format(nsdecls('w'), shading_color)))
+    doc.save(output_file)
+
+
+def synthetic_analytics(n_events: int, seed: int = 0) -> Analytics:
+    rng = np.random.default_rng(seed)
+    analytics = Analytics(400)
+    starts = np.sort(rng.uniform(0, n_events * 60, n_events))
+    ends = starts + rng.uniform(1, 30, n_events)
+    labels = rng.integers(1, 4, n_events)
+    for label in analytics.anomalies_by_type:
+        mask = labels == label
+        analytics.anomalies_by_type[label] = list(zip(starts[mask].tolist(), ends[mask].tolist()))
+        analytics.peak_amplitudes[label] = rng.uniform(1, 3, mask.sum()).tolist()
+    analytics.anomaly_count = n_events
+    analytics.total_time = n_events * 60.0
+    analytics.total_duration = float((ends - starts).sum())
+    return analytics
+
+
+def measure(function, *args) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+# table_rows - текст первых columns столбцов таблицы деталей (признаки аномалий прежняя таблица не содержала)
+def table_rows(path: str, columns: int = 4) -> list:
+    return [[cell.text for cell in row.cells[:columns]] for row in Document(path).tables[-1].rows]
+
+
+if __name__ == '__main__':
+    sizes = [int(value) for value in sys.argv[1:]] or [100, 1000, 5000, 20000]
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_events in sizes:
+            analytics = synthetic_analytics(n_events)
+            legacy_path, path = os.path.join(tmp, 'legacy.docx'), os.path.join(tmp, 'new.docx')
+            legacy_time, legacy_peak = measure(legacy_save_analytics_to_word, analytics, legacy_path)
+            new_time, new_peak = measure(save_analytics_to_word, analytics, path, 0)
+            assert table_rows(legacy_path) == table_rows(path), 'detail tables differ'
+            print(f"{n_events:6} anomalies: legacy {legacy_time:7.2f}s {legacy_peak / 1e6:7.1f}MB, "
+                  f"new {new_time:6.2f}s {new_peak / 1e6:6.1f}MB ({new_time / n_events * 1e6:.0f} us/row)")
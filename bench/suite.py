@@ -0,0 +1,196 @@
+# Набор замеров для отслеживания регрессий производительности.
+# Генерирует синтетическую запись (bench/synthetic.py), замеряет публичные функции пайплайна
+# и /upload целиком через TestClient с крошечной моделью-заглушкой (.npz для NumpyBackend,
+# без tensorflow и сети) и пишет результаты в json.
+# Запуск из корня репозитория:
+#   python bench/suite.py [--duration 1h] [--density swd=30,is=10,ds=5] [--repeat 3] [--output файл.json]
+#   python bench/suite.py --compare старый.json новый.json
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+BENCH_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIRECTORY)
+sys.path.append(ROOT)
+sys.path.append(BENCH_DIRECTORY)
+
+from synthetic import make_edf, parse_density, parse_duration
+
+
+# make_stub_model пишет модель из одного Conv1D с ядром 1: класс точки определяется
+# порогами нормированной амплитуды. Формат тот же, что у convert_keras_model
+def make_stub_model(path: str) -> str:
+    layers = [{'class_name': 'Conv1D', 'n_weights': 2,
+               'config': {'filters': 4, 'kernel_size': [1], 'strides': [1], 'padding': 'same',
+                          'activation': 'linear'}}]
+    kernel = np.array([[[0.0, 1.0, -1.0, 0.5]]], dtype=np.float32)
+    bias = np.array([2.0, -1.0, -1.0, 0.0], dtype=np.float32)
+    np.savez(path, layers=json.dumps(layers), **{'0_0': kernel, '0_1': bias})
+    return path
+
+
+def summarize(times: list) -> dict:
+    return {'min_s': min(times), 'mean_s': sum(times) / len(times), 'runs': len(times)}
+
+
+def timed(function, repeat: int, setup=None) -> dict:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def bench_functions(path: str, tmp: str, repeat: int) -> dict:
+    from parser.parser import parse_file, read_recording, save_to_edf, compute_analytics
+    from visual.visual import plot_channel, simple_plot_channel
+    from server.ai import prepare_data
+    from server.word import save_analytics_to_word
+
+    recording = read_recording(path)
+    analytics = compute_analytics(recording)
+    edf_path = os.path.join(tmp, 'out.edf')
+
+    def export():
+        if os.path.exists(edf_path):
+            os.remove(edf_path)
+        save_to_edf(recording, edf_path)
+
+    functions = {
+        'parse_file': lambda: parse_file(path),
+        'read_recording': lambda: read_recording(path),
+        'prepare_data': lambda: prepare_data(path, k=1),
+        'save_to_edf': export,
+        'plot_channel': lambda: plot_channel(recording, 'FrL', 0),
+        'simple_plot_channel': lambda: simple_plot_channel(recording, 'FrL', 0),
+        'save_analytics_to_word': lambda: save_analytics_to_word(analytics, os.path.join(tmp, 'out.docx')),
+    }
+    results = {}
+    for name, function in functions.items():
+        results[name] = timed(function, repeat)
+        print(f"{name}: {results[name]['min_s']:.3f}s")
+    return results
+
+
+def bench_upload(path: str, model_path: str, repeat: int) -> dict:
+    # Переменные окружения читаются при импорте сервера, поэтому замер идёт в отдельном процессе.
+    # Артефакты, кэш результатов и индекс событий - во временном каталоге, не в server/static
+    with tempfile.TemporaryDirectory() as static:
+        env = dict(os.environ, MODEL_PATH=model_path, JOB_WORKERS='1', METRICS_ENABLED='0',
+                   STATIC_DIRECTORY=static, EVENTS_DB=os.path.join(static, 'events.db'))
+        out = subprocess.run([sys.executable, __file__, '--upload', path, str(repeat)],
+                             cwd=ROOT, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    print(f"upload: {result['upload']['min_s']:.3f}s, cached upload: {result['upload_cached']['min_s']:.3f}s")
+    return result
+
+
+def run_upload(path: str, repeat: int) -> None:
+    import hashlib
+    from fastapi.testclient import TestClient
+    from server.main import app
+    from server.cache import cache_key
+    from server.jobs import job_manager
+    from server.ai import STATIC_DIRECTORY
+
+    with open(path, 'rb') as f:
+        hash = cache_key(hashlib.sha256(f.read()).hexdigest(), job_manager.model_path)
+
+    def upload(client):
+        with open(path, 'rb') as f:
+            job = client.post('/upload', files={'file': (os.path.basename(path), f)}).json()
+        job_id = job['job']
+        while job['status'] not in ('done', 'failed'):
+            time.sleep(0.05)
+            job = client.get(f"/jobs/{job_id}").json()
+        if job['status'] != 'done':
+            raise RuntimeError(job['error'])
+
+    # Перед каждой полной загрузкой артефакты этого файла удаляются, чтобы она шла через весь пайплайн
+    def clear():
+        for name in os.listdir(STATIC_DIRECTORY):
+            if name.startswith(hash):
+                full = os.path.join(STATIC_DIRECTORY, name)
+                shutil.rmtree(full) if os.path.isdir(full) else os.remove(full)
+
+    with TestClient(app) as client:
+        result = {'upload': timed(lambda: upload(client), repeat, setup=clear)}
+        result['upload_cached'] = timed(lambda: upload(client), repeat)
+        clear()
+    print(json.dumps(result))
+
+
+def environment() -> dict:
+    commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit or None,
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as f:
+        old = json.load(f)['results']
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    for name in sorted(set(old) & set(new)):
+        ratio = new[name]['min_s'] / old[name]['min_s'] if old[name]['min_s'] else float('inf')
+        print(f"{name:24} {old[name]['min_s']:9.3f}s {new[name]['min_s']:9.3f}s  x{ratio:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Замеры производительности пайплайна')
+    parser.add_argument('--duration', type=parse_duration, default=3600.0)
+    parser.add_argument('--density', type=parse_density, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--skip-upload', action='store_true')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--upload', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+    if args.upload:
+        return run_upload(args.upload[0], int(args.upload[1]))
+
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_edf(os.path.join(tmp, 'bench.edf'), args.duration, seed=args.seed, density=args.density)
+        results = bench_functions(path, tmp, args.repeat)
+        if not args.skip_upload:
+            results.update(bench_upload(path, make_stub_model(os.path.join(tmp, 'stub.npz')), args.repeat))
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'parameters': {'duration_s': args.duration, 'density': args.density, 'seed': args.seed,
+                       'repeat': args.repeat},
+        'results': results,
+    }
+    output = args.output or os.path.join(BENCH_DIRECTORY, 'results', f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to', output)
+
+
+if __name__ == '__main__':
+    main()
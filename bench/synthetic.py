@@ -0,0 +1,156 @@
+# Генератор синтетических edf файлов: 3 канала (FrL, FrR, OcR), 400Гц, с разметкой swd/is/ds.
+# Файл пишется потоково по часу сигнала, поэтому можно генерировать записи длиной в сутки и больше.
+# Запуск из корня репозитория:
+#   python bench/synthetic.py <путь.edf> <длительность: сек или 90m / 6h / 2d> [число аномалий]
+#                             [--density swd=30,is=10,ds=5] [--seed N]
+# --density - число аномалий каждого класса в час (вместо общего числа аномалий)
+import os
+import sys
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parser.parser import ANNOTATION_NAMES, CHANNEL_NAMES
+
+SAMPLING_FREQUENCY = 400
+CLASS_NAMES = {'swd': 1, 'is': 2, 'ds': 3}
+# Аномалий каждого класса в час по умолчанию
+DEFAULT_DENSITY = {'swd': 30, 'is': 10, 'ds': 5}
+# Длительность аномалии (сек) и всплеск, который добавляется к шуму: частота (Гц) и амплитуда (мкВ)
+EVENT_DURATION = {1: (1, 10), 2: (5, 30), 3: (10, 60)}
+EVENT_BURST = {1: (8.0, 400.0), 2: (4.0, 200.0), 3: (1.5, 300.0)}
+
+NOISE_UV = 100.0
+PHYSICAL_RANGE_UV = 2000.0
+# Отсчётов канала аннотаций в записи длиной 1 сек: 128 байт, хватает на 5-6 меток в секунду
+ANNOTATION_SAMPLES = 64
+CHUNK_SECONDS = 3600
+
+
+def parse_duration(value: str) -> float:
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def parse_density(value: str) -> dict:
+    density = {}
+    for item in value.split(','):
+        name, rate = item.split('=')
+        density[name.strip()] = float(rate)
+    return density
+
+
+# make_events раскладывает аномалии по равномерной сетке, так что они не пересекаются.
+# Возвращает массивы начал, концов (сек) и классов в порядке времени
+def make_events(duration: float, n_events: int = None, density: dict = None, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    if n_events is not None:
+        labels = rng.integers(1, 4, n_events)
+    else:
+        density = density or DEFAULT_DENSITY
+        counts = {CLASS_NAMES[name]: int(round(rate * duration / 3600)) for name, rate in density.items()}
+        labels = np.concatenate([np.full(count, label) for label, count in counts.items()] + [np.zeros(0, int)])
+        rng.shuffle(labels)
+    n_events = len(labels)
+
+    cell = duration / max(n_events, 1)
+    starts = np.arange(n_events) * cell + rng.uniform(0, cell / 2, n_events)
+    low = np.array([EVENT_DURATION[label][0] for label in labels])
+    high = np.array([EVENT_DURATION[label][1] for label in labels])
+    lengths = np.minimum(rng.uniform(low, high) if n_events else np.zeros(0), cell / 2)
+    return starts, starts + lengths, labels.astype(np.int8)
+
+
+def _field(value, width: int) -> bytes:
+    return str(value).ljust(width)[:width].encode('ascii')
+
+
+def _header(n_records: int) -> bytes:
+    labels = list(CHANNEL_NAMES) + ['EDF Annotations']
+    n_signals = len(labels)
+    n_eeg = len(CHANNEL_NAMES)
+    header = b''.join([
+        _field('0', 8), _field('X X X X', 80), _field('Startdate 01-JAN-2024 X X X', 80),
+        _field('01.01.24', 8), _field('00.00.00', 8), _field(256 * (n_signals + 1), 8),
+        _field('EDF+C', 44), _field(n_records, 8), _field(1, 8), _field(n_signals, 4),
+    ])
+    columns = [
+        (labels, 16),
+        (['EEG'] * n_eeg + [''], 80),
+        (['uV'] * n_eeg + [''], 8),
+        ([-PHYSICAL_RANGE_UV] * n_eeg + [-1], 8),
+        ([PHYSICAL_RANGE_UV] * n_eeg + [1], 8),
+        ([-32768] * n_signals, 8),
+        ([32767] * n_signals, 8),
+        ([''] * n_signals, 80),
+        ([SAMPLING_FREQUENCY] * n_eeg + [ANNOTATION_SAMPLES], 8),
+        ([''] * n_signals, 32),
+    ]
+    return header + b''.join(_field(value, width) for values, width in columns for value in values)
+
+
+def _bursts(chunk: np.ndarray, chunk_start: float, starts, ends, labels) -> None:
+    chunk_end = chunk_start + chunk.shape[1] / SAMPLING_FREQUENCY
+    for index in np.flatnonzero((ends > chunk_start) & (starts < chunk_end)):
+        first = max(int((starts[index] - chunk_start) * SAMPLING_FREQUENCY), 0)
+        last = min(int((ends[index] - chunk_start) * SAMPLING_FREQUENCY), chunk.shape[1])
+        frequency, amplitude = EVENT_BURST[labels[index]]
+        t = chunk_start + np.arange(first, last) / SAMPLING_FREQUENCY
+        chunk[:, first:last] += amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+# make_edf пишет edf+ файл длиной duration секунд. Аномалии задаются либо общим числом
+# n_events (классы случайны), либо density - числом аномалий каждого класса в час
+def make_edf(path: str, duration: float, n_events: int = None, seed: int = 0, density: dict = None) -> str:
+    rng = np.random.default_rng(seed + 1)
+    starts, ends, labels = make_events(duration, n_events, density, seed)
+    onsets = np.column_stack((starts, ends)).ravel()
+    descriptions = [name for label in labels for name in ANNOTATION_NAMES[label]]
+
+    n_records = int(np.ceil(duration))
+    n_samples = int(duration * SAMPLING_FREQUENCY)
+    scale = 32767 / PHYSICAL_RANGE_UV
+    pending = 0
+    with open(path, 'wb') as f:
+        f.write(_header(n_records))
+        for chunk_record in range(0, n_records, CHUNK_SECONDS):
+            records = min(CHUNK_SECONDS, n_records - chunk_record)
+            chunk = rng.normal(0, NOISE_UV, (len(CHANNEL_NAMES), records * SAMPLING_FREQUENCY))
+            # Хвост последней записи (если длительность не целая) заполняется нулями
+            tail = chunk_record * SAMPLING_FREQUENCY + chunk.shape[1] - n_samples
+            if tail > 0:
+                chunk[:, -tail:] = 0
+            _bursts(chunk, chunk_record, starts, ends, labels)
+            digital = np.clip(np.round(chunk * scale), -32768, 32767).astype('<i2')
+            # (каналы, записи, отсчёты) -> (записи, каналы, отсчёты): в edf данные идут по записям
+            digital = digital.reshape(len(CHANNEL_NAMES), records, SAMPLING_FREQUENCY).transpose(1, 0, 2)
+
+            for record in range(records):
+                second = chunk_record + record
+                annotations = f'+{second}\x14\x14\x00'.encode()
+                # Метки пишутся в запись своей секунды, а если в неё не влезают - в следующие
+                while pending < len(onsets) and onsets[pending] < second + 1:
+                    tal = f'+{onsets[pending]:.4f}\x14{descriptions[pending]}\x14\x00'.encode()
+                    if len(annotations) + len(tal) > 2 * ANNOTATION_SAMPLES:
+                        break
+                    annotations += tal
+                    pending += 1
+                f.write(digital[record].tobytes())
+                f.write(annotations.ljust(2 * ANNOTATION_SAMPLES, b'\x00'))
+    if pending < len(onsets):
+        raise ValueError(f'{len(onsets) - pending} annotations did not fit, lower the density')
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Синтетический edf с разметкой swd/is/ds')
+    parser.add_argument('path')
+    parser.add_argument('duration', type=parse_duration)
+    parser.add_argument('n_events', type=int, nargs='?', default=None)
+    parser.add_argument('--density', type=parse_density, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    make_edf(args.path, args.duration, args.n_events, args.seed, args.density)
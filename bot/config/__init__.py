@@ -1 +1 @@
-from .config import token, api, dp, bot, storage
\ No newline at end of file
+from .config import token, api, dp, bot, storage, api_client, limiter, answer_cache
\ No newline at end of file
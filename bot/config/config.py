@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from aiogram import Bot
 from aiogram.dispatcher import Dispatcher
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from services import ApiClient, UserLimiter, TTLCache
 
 load_dotenv()
 
@@ -10,4 +11,15 @@ storage = MemoryStorage()
 token = os.getenv("TOKEN")
 api = os.getenv("API")
 bot = Bot(token=token)
-dp = Dispatcher(bot, storage=storage)
\ No newline at end of file
+dp = Dispatcher(bot, storage=storage)
+
+# Обращения к api: таймаут запроса (сек), число повторов и размер пула соединений
+api_client = ApiClient(f"http://{api}", timeout=float(os.getenv("API_TIMEOUT", "60")),
+                       retries=int(os.getenv("API_RETRIES", "3")),
+                       pool_size=int(os.getenv("API_POOL_SIZE", "20")))
+# На пользователя: одновременных запросов и запросов в минуту
+limiter = UserLimiter(concurrency=int(os.getenv("USER_CONCURRENCY", "1")),
+                      rate=int(os.getenv("USER_RATE", "10")))
+# Ответы на одинаковые вопросы: время жизни (сек) и число хранимых ответов
+answer_cache = TTLCache(ttl=float(os.getenv("ANSWER_CACHE_TTL", "600")),
+                        max_size=int(os.getenv("ANSWER_CACHE_SIZE", "1000")))
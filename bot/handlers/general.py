@@ -1,23 +1,40 @@
-import os
-import requests
 from aiogram import types, Dispatcher
-from config import bot, api
+from config import bot, api_client, limiter, answer_cache
+from services import UserBusy, RateLimited
 from static import messages
 
 
+def question_key(text: str) -> str:
+    """
+        Ключ кэша: вопросы, отличающиеся регистром и пробелами, считаются одинаковыми
+    """
+    return " ".join(text.split()).casefold()
+
+
 async def api_predict(message: types.message, **kwargs):
     """
         Обращение к api с целью получения ответа на вопрос
     """
     data_json = {"question": f"{message.text}"}
-    mesg = await bot.send_message(message.from_user.id, messages.process_mesg)
-    
+    key = question_key(message.text or "")
+
+    answer_json = answer_cache.get(key)
+    if answer_json is not None:
+        await bot.send_message(message.from_user.id, f"{answer_json['answer']}")
+        return
+
     try:
-        resp = requests.post(f"http://{api}/predict", json=data_json)
-        answer_json = resp.json()
-        await mesg.edit_text(f"{answer_json['answer']}")
-    except:
-        await mesg.edit_text(messages.went_wrong)
+        async with limiter.limit(message.from_user.id):
+            mesg = await bot.send_message(message.from_user.id, messages.process_mesg)
+            try:
+                answer_json = await answer_cache.get_or_set(key, lambda: api_client.post_json("/predict", data_json))
+                await mesg.edit_text(f"{answer_json['answer']}")
+            except Exception:
+                await mesg.edit_text(messages.went_wrong)
+    except UserBusy:
+        await message.reply(messages.user_busy)
+    except RateLimited:
+        await message.reply(messages.rate_limited)
 
 def register_handlers_general(_dp: Dispatcher):
-    _dp.register_message_handler(api_predict)
\ No newline at end of file
+    _dp.register_message_handler(api_predict)
@@ -0,0 +1,3 @@
+from .api_client import ApiClient, ApiError
+from .limiter import UserLimiter, UserBusy, RateLimited
+from .cache import TTLCache
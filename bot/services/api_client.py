@@ -0,0 +1,57 @@
+import asyncio
+import random
+from typing import Optional
+
+import aiohttp
+
+
+class ApiError(Exception):
+    pass
+
+
+class ApiClient:
+    """
+        Асинхронный клиент api: одна сессия aiohttp с пулом соединений на весь бот,
+        общий таймаут запроса и повторы с экспоненциальной задержкой при сетевых
+        ошибках, таймаутах и ответах 429/5xx
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str, timeout: float = 60, retries: int = 3,
+                 pool_size: int = 20, backoff: float = 0.5):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.pool_size = pool_size
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия создаётся внутри работающего event loop при первом запросе
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def post_json(self, path: str, data: dict) -> dict:
+        """
+            POST с json телом, возвращает json ответа
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._get_session().post(url, json=data) as resp:
+                    if resp.status in self.RETRY_STATUSES and attempt < self.retries:
+                        raise ApiError(f"{url} answered {resp.status}")
+                    resp.raise_for_status()
+                    return await resp.json()
+            except (ApiError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            # 0.5, 1, 2, ... сек со случайной добавкой, чтобы повторы разных чатов не совпадали
+            await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random() / 2))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
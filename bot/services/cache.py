@@ -0,0 +1,50 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable
+
+
+class TTLCache:
+    """
+        Кэш в памяти: max_size последних записей, каждая живёт ttl секунд.
+        get_or_set сводит одновременные одинаковые промахи к одному вызову factory
+    """
+
+    def __init__(self, ttl: float = 600, max_size: int = 1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._pending = {}
+
+    def get(self, key: Hashable):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if time.monotonic() > expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def get_or_set(self, key: Hashable, factory: Callable[[], Awaitable]):
+        value = self.get(key)
+        if value is not None:
+            return value
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+        # Ошибка factory не кэшируется, её получают все ждущие этот ключ
+        future = asyncio.ensure_future(factory())
+        self._pending[key] = future
+        try:
+            value = await asyncio.shield(future)
+            self.set(key, value)
+            return value
+        finally:
+            del self._pending[key]
@@ -0,0 +1,57 @@
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class UserBusy(Exception):
+    pass
+
+
+class RateLimited(Exception):
+    pass
+
+
+class UserLimiter:
+    """
+        Ограничения на пользователя: не больше concurrency запросов одновременно
+        и не больше rate запросов за period секунд. Лишний запрос сразу отклоняется,
+        а не ждёт в очереди, так что обработчик не висит
+    """
+
+    def __init__(self, concurrency: int = 1, rate: int = 10, period: float = 60):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.period = period
+        self._active = {}
+        self._history = {}
+        self._swept_at = time.monotonic()
+
+    @asynccontextmanager
+    async def limit(self, user_id: int):
+        now = time.monotonic()
+        self._sweep(now)
+        if self._active.get(user_id, 0) >= self.concurrency:
+            raise UserBusy()
+        history = self._history.setdefault(user_id, deque())
+        while history and now - history[0] > self.period:
+            history.popleft()
+        if len(history) >= self.rate:
+            raise RateLimited()
+
+        history.append(now)
+        self._active[user_id] = self._active.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._active[user_id] -= 1
+            if not self._active[user_id]:
+                del self._active[user_id]
+
+    def _sweep(self, now: float) -> None:
+        # Раз в period забываем пользователей без запросов за последний period
+        if now - self._swept_at < self.period:
+            return
+        self._swept_at = now
+        for user_id in [user_id for user_id, history in self._history.items()
+                        if user_id not in self._active and (not history or now - history[-1] > self.period)]:
+            del self._history[user_id]
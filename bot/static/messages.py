@@ -11,4 +11,6 @@ process_mesg = "Выполняется запрос, пожалуйста под
 cant_initiate_conversation = '''Для начала работы со мной напишите мне в ЛС!'''
 bot_blocked = "Разблокируйте меня, чтобы продолжить диалог!"
 unauthorized = 'Не удалось написать вам!'
-went_wrong = 'Произошла неизвестная ошибка, пожалуйста повторите попытку или воспользуйтесь ботом позже!'
\ No newline at end of file
+went_wrong = 'Произошла неизвестная ошибка, пожалуйста повторите попытку или воспользуйтесь ботом позже!'
+user_busy = 'Подождите ответа на предыдущий запрос.'
+rate_limited = 'Слишком много запросов, пожалуйста повторите попытку через минуту.'
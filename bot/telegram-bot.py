@@ -1,4 +1,4 @@
-from config import dp
+from config import dp, api_client
 from aiogram.utils import executor
 from handlers import start, general
 
@@ -9,4 +9,9 @@ async def on_startup(_):
     print("Бот запущен")
 
 
-executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
\ No newline at end of file
+async def on_shutdown(_):
+    # Закрываем общий пул соединений с api
+    await api_client.close()
+
+
+executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -4,11 +4,30 @@ import FileList from './components/FileList/FileList'
 import { useState } from 'react'
 import LoadingData from './components/LoadingData/LoadingData'
 
+const API_URL = 'http://vpn.v0d14ka.ru:8005'
+
+interface JobStatus {
+  status: 'queued' | 'running' | 'done' | 'failed'
+  progress: number
+  result: { file: string; word: string; frl: string; frr: string; ocr: string } | null
+  error: string | null
+}
+
+// Сервер обрабатывает файл в фоне, поэтому опрашиваем статус задачи до завершения
+const waitForJob = async (jobId: string): Promise<JobStatus> => {
+  for (;;) {
+    const { data } = await axios.get<JobStatus>(`${API_URL}/jobs/${jobId}`)
+    if (data.status === 'done' || data.status === 'failed') return data
+    await new Promise((resolve) => setTimeout(resolve, 1000))
+  }
+}
+
 interface FileWithProgress {
   file: File
   progress: number
   name: string
   word: string
+  edf: string
   frl: string
   frr: string
   ocr: string
@@ -27,6 +46,7 @@ function App(): JSX.Element {
       progress: 0,
       name: file.name,
       word: '',
+      edf: '',
       frl: '',
       frr: '',
       ocr: ''
@@ -49,7 +69,7 @@ function App(): JSX.Element {
       formData.append('file', fileWithProgress.file)
 
       try {
-        const response = await axios.post('http://vpn.v0d14ka.ru:8005/upload', formData, {
+        const response = await axios.post(`${API_URL}/upload`, formData, {
           onUploadProgress: (progressEvent) => {
             const total = progressEvent.total ?? 1
             const progress = Math.round((progressEvent.loaded * 100) / total)
@@ -58,13 +78,15 @@ function App(): JSX.Element {
             )
           }
         })
-        const { word, frl, frr, ocr } = response.data // Извлекаем данные из ответа сервера
+        const job = await waitForJob(response.data.job)
+        if (job.status === 'failed' || !job.result) throw new Error(job.error ?? 'job failed')
+        const { file: edf, word, frl, frr, ocr } = job.result // Извлекаем данные из ответа сервера
 
         // Обновляем файл с новыми данными
         setFiles((prevFiles) =>
           prevFiles.map((f) =>
             f.name === fileWithProgress.name
-              ? { ...f, word, frl, frr, ocr, progress: 100 } // обновляем прогресс до 100% и добавляем полученные данные
+              ? { ...f, word, edf, frl, frr, ocr, progress: 100 } // обновляем прогресс до 100% и добавляем полученные данные
               : f
           )
         )
@@ -12,6 +12,7 @@ interface FileWithProgress {
   progress: number
   name: string
   word: string
+  edf: string // ссылка на размеченный edf (/recordings/{hash}/edf), собирается сервером при скачивании
   frl: string
   frr: string
   ocr: string
@@ -68,7 +69,7 @@ const FileList: React.FC<FileListProps> = ({ files }) => {
                         <div className="icons">
                           <img className="imgIcon" src={logoDownload} alt="" />
                           <a
-                            href={`http://vpn.v0d14ka.ru:8005/${file?.frl.slice(0, -8) + 'marked.edf'}`}
+                            href={`http://vpn.v0d14ka.ru:8005/${file?.edf}`}
                             download={`Отчёт_по_${selectedFile?.name.slice(0, -4)}.edf`}
                           >
                             <button className="buttonDownMore">Скачать файл</button>
@@ -141,7 +142,7 @@ const FileList: React.FC<FileListProps> = ({ files }) => {
               <div className="icons-wrap">
                 <img className="imgIconMore" src={logoDownloadWhite} alt="" />
                 <a
-                  href={`http://vpn.v0d14ka.ru:8005/${selectedFile?.file}`}
+                  href={`http://vpn.v0d14ka.ru:8005/${selectedFile?.edf}`}
                   download={`Отчёт_по_${selectedFile?.name.slice(0, -4)}.edf`}
                 >
                   <button className="buttonDownMore">Скачать файл</button>
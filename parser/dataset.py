@@ -0,0 +1,278 @@
+# Обучающий набор из каталога размеченных edf файлов.
+# Каждый файл размечается как в parse_file (rasterize_annotations) и пишется частями (шардами)
+# по shard_size точек плюс перекрытие в одно окно со следующим шардом: сигналы float32 (n, n_channels),
+# классы int8 (n,). Их можно открыть через np.memmap, так что набор может быть намного больше памяти.
+# Рядом лежат индекс окон segments.npy (шард, файл, смещение, число точек каждого класса)
+# и описание dataset.json.
+# Сборка (файлы обрабатываются параллельно):
+#   python -m parser.dataset <каталог с edf> <каталог набора> [--workers N] [--pattern "*marked*.edf"]
+#                              [--segment-size 12000] [--stride 12000] [--shard-size 34560000]
+import os
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parser.parser import open_edf, read_signals, read_labels
+from server.scaler import StreamingScaler
+
+DATASET_HEADER = 'dataset.json'
+DATASET_SEGMENTS = 'segments.npy'
+N_CLASSES = 4
+# Сутки записи при 400Гц: около 415MB сигналов трёх каналов на шард
+SHARD_SIZE = 400 * 3600 * 24
+
+SEGMENT_DTYPE = np.dtype([
+    ('shard', '<i4'),
+    ('file', '<i4'),
+    ('offset', '<i8'),               # первая точка окна внутри шарда
+    ('counts', '<i4', (N_CLASSES,)),  # число точек каждого класса в окне
+    ('label', 'i1'),                  # преобладающая аномалия окна (0 - аномалий нет)
+])
+
+
+def segment_offsets(n_samples: int, segment_size: int, stride: int) -> np.ndarray:
+    # Последнее окно выравнивается по концу, как в InferenceEngine, чтобы хвост не терялся
+    if n_samples < segment_size:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.arange(0, n_samples - segment_size + 1, stride)
+    if offsets[-1] + segment_size < n_samples:
+        offsets = np.append(offsets, n_samples - segment_size)
+    return offsets
+
+
+def _segments(labels: np.ndarray, segment_size: int, stride: int) -> np.ndarray:
+    offsets = segment_offsets(len(labels), segment_size, stride)
+    segments = np.zeros(len(offsets), dtype=SEGMENT_DTYPE)
+    segments['offset'] = offsets
+    # Число точек каждого класса в окнах через накопленные суммы индикаторов
+    for label in range(N_CLASSES):
+        cumulative = np.concatenate(([0], np.cumsum(labels == label, dtype=np.int64)))
+        segments['counts'][:, label] = cumulative[offsets + segment_size] - cumulative[offsets]
+    anomalies = segments['counts'][:, 1:]
+    segments['label'] = np.where(anomalies.max(axis=1) > 0, anomalies.argmax(axis=1) + 1, 0)
+    return segments
+
+
+# _build_file выполняется в процессе пула: размечает файл и пишет его шарды в directory.
+# Окна считаются по всей записи, окно хранится в шарде, где оно начинается. Чтобы окна на границе
+# шардов не терялись, шард дополнительно хранит segment_size точек следующего за ним (перекрытие)
+def _build_file(file_index: int, path: str, directory: str, shard_size: int, segment_size: int,
+                stride: int, chunk_size: int = 400 * 600) -> dict:
+    edf = open_edf(path)
+    n_samples = int(edf.n_times)
+    n_channels = len(edf.ch_names)
+    labels = read_labels(edf, n_samples)
+    # Статистики нормировки файла одним потоковым проходом (по формуле Чана, как на сервере)
+    scaler = StreamingScaler(n_channels)
+    file_segments = _segments(labels, segment_size, stride)
+
+    shards, segments = [], []
+    for part, shard_start in enumerate(range(0, n_samples, shard_size)):
+        shard_end = min(shard_start + shard_size, n_samples)
+        shard_stop = min(shard_end + segment_size, n_samples)
+        name = f'{file_index:05d}_{part:03d}'
+        signals = np.lib.format.open_memmap(os.path.join(directory, f'{name}.signals.npy'), mode='w+',
+                                            dtype='<f4', shape=(shard_stop - shard_start, n_channels))
+        for chunk_start in range(shard_start, shard_stop, chunk_size):
+            chunk = read_signals(edf, chunk_start, min(chunk_start + chunk_size, shard_stop))
+            signals[chunk_start - shard_start:chunk_start - shard_start + chunk.shape[1]] = chunk.T
+            # Точки перекрытия учитываются в статистиках один раз - в своём шарде
+            scaler.partial_fit(chunk[:, :max(shard_end - chunk_start, 0)].T)
+        signals.flush()
+        del signals
+        np.save(os.path.join(directory, f'{name}.labels.npy'), labels[shard_start:shard_stop])
+
+        offsets = file_segments['offset']
+        shard_segments = file_segments[(offsets >= shard_start) & (offsets < shard_end)].copy()
+        shard_segments['offset'] -= shard_start
+        segments.append(shard_segments)
+        shards.append({'name': name, 'start': shard_start, 'n_samples': shard_stop - shard_start,
+                       'segments': len(shard_segments)})
+
+    mean, std = scaler.global_stats()
+    return {
+        'path': path,
+        'n_samples': n_samples,
+        'channels': list(edf.ch_names),
+        'sampling_frequency': int(edf.info['sfreq']),
+        'class_samples': np.bincount(labels, minlength=N_CLASSES).tolist(),
+        # Статистики нормировки файла (по всей записи, как NORMALIZATION=global на сервере)
+        'mean': mean.tolist(),
+        'std': std.tolist(),
+        'shards': shards,
+        'segments': np.concatenate(segments) if segments else np.zeros(0, dtype=SEGMENT_DTYPE),
+    }
+
+
+def find_edf_files(directory: str, pattern: str = '*.edf') -> list:
+    paths = []
+    for root, _, names in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in names if fnmatch.fnmatch(name.lower(), pattern.lower()))
+    return sorted(paths)
+
+
+# build_dataset собирает набор из списка edf файлов в directory, файлы размечаются в workers процессах
+def build_dataset(paths: Sequence[str], directory: str, workers: int = 1, segment_size: int = 12000,
+                  stride: Optional[int] = None, shard_size: int = SHARD_SIZE) -> dict:
+    stride = stride or segment_size
+    # Шард - целое число шагов, чтобы каждый шард начинался с окна сетки
+    shard_size = max(shard_size // stride, 1) * stride
+    os.makedirs(directory, exist_ok=True)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(workers, 1), mp_context=mp.get_context('spawn')) as executor:
+        futures = [executor.submit(_build_file, index, path, directory, shard_size, segment_size, stride)
+                   for index, path in enumerate(paths)]
+        files = [future.result() for future in futures]
+
+    shards, segments = [], []
+    for file_index, file in enumerate(files):
+        file_segments = file.pop('segments')
+        # Номера шардов сквозные по всему набору, в порядке файлов
+        boundaries = np.cumsum([0] + [shard['segments'] for shard in file['shards']])
+        for shard_index, shard in enumerate(file['shards']):
+            file_segments['shard'][boundaries[shard_index]:boundaries[shard_index + 1]] = len(shards)
+            shards.append({'file': file_index, **shard})
+        file_segments['file'] = file_index
+        segments.append(file_segments)
+    segments = np.concatenate(segments) if segments else np.zeros(0, dtype=SEGMENT_DTYPE)
+    np.save(os.path.join(directory, DATASET_SEGMENTS), segments)
+
+    header = {
+        'version': 1,
+        'segment_size': segment_size,
+        'stride': stride,
+        'classes': {0: 'none', 1: 'swd', 2: 'is', 3: 'ds'},
+        'files': files,
+        'shards': shards,
+        'class_samples': np.sum([file['class_samples'] for file in files], axis=0).tolist() if files else [],
+        'segment_labels': np.bincount(segments['label'], minlength=N_CLASSES).tolist(),
+        'build_seconds': time.perf_counter() - start,
+    }
+    with open(os.path.join(directory, DATASET_HEADER), 'w') as f:
+        json.dump(header, f, indent=2)
+    return header
+
+
+class Dataset:
+    """
+        Набор, собранный build_dataset. Шарды открываются через np.memmap по первому
+        обращению, окно читается с диска только когда его берут в батч.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, DATASET_HEADER)) as f:
+            self.header = json.load(f)
+        self.segments = np.load(os.path.join(directory, DATASET_SEGMENTS))
+        self.segment_size = self.header['segment_size']
+        self.files = self.header['files']
+        self.shards = self.header['shards']
+        self._mean = np.array([file['mean'] for file in self.files], dtype=np.float32)
+        self._std = np.array([file['std'] for file in self.files], dtype=np.float32)
+        self._memmaps = {}
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def _shard(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        if index not in self._memmaps:
+            name = self.shards[index]['name']
+            self._memmaps[index] = (np.load(os.path.join(self.directory, f'{name}.signals.npy'), mmap_mode='r'),
+                                    np.load(os.path.join(self.directory, f'{name}.labels.npy'), mmap_mode='r'))
+        return self._memmaps[index]
+
+    # file_indices - номера окон из файлов files (для разбиения на обучение и проверку по файлам)
+    def file_indices(self, files: Sequence[int]) -> np.ndarray:
+        return np.flatnonzero(np.isin(self.segments['file'], files))
+
+    # batch читает окна indices: x (len, segment_size, len(channels)) float32, y (len, segment_size) int8.
+    # normalize - нормировка по статистикам файла окна (как на сервере при NORMALIZATION=global)
+    def batch(self, indices: Sequence[int], channels: Sequence[int] = (0,),
+              normalize: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        channels = list(channels)
+        x = np.empty((len(indices), self.segment_size, len(channels)), dtype=np.float32)
+        y = np.empty((len(indices), self.segment_size), dtype=np.int8)
+        for i, index in enumerate(indices):
+            segment = self.segments[index]
+            signals, labels = self._shard(int(segment['shard']))
+            offset = int(segment['offset'])
+            x[i] = signals[offset:offset + self.segment_size, channels]
+            y[i] = labels[offset:offset + self.segment_size]
+            if normalize:
+                file = int(segment['file'])
+                x[i] -= self._mean[file, channels]
+                x[i] /= self._std[file, channels]
+        return x, y
+
+    # iter_batches - все окна indices (по умолчанию весь набор) по порядку, для проверки модели
+    def iter_batches(self, batch_size: int = 30, indices: Optional[np.ndarray] = None,
+                     **kwargs) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        for start in range(0, len(indices), batch_size):
+            yield self.batch(indices[start:start + batch_size], **kwargs)
+
+
+def one_hot(labels: np.ndarray, n_classes: int = N_CLASSES) -> np.ndarray:
+    return np.eye(n_classes, dtype=np.float32)[labels]
+
+
+class BalancedSampler:
+    """
+        Бесконечный поток батчей с равной долей окон каждого класса: класс окна -
+        преобладающая в нём аномалия (0 - окно без аномалий). Сначала выбирается класс,
+        потом случайное окно этого класса, так что редкие swd попадают в батч так же часто,
+        как окна без аномалий. Классы без окон пропускаются.
+    """
+
+    def __init__(self, dataset: Dataset, batch_size: int = 30, indices: Optional[np.ndarray] = None,
+                 channels: Sequence[int] = (0,), normalize: bool = True, categorical: bool = True,
+                 seed: Optional[int] = None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.channels = channels
+        self.normalize = normalize
+        self.categorical = categorical
+        self.rng = np.random.default_rng(seed)
+        indices = np.arange(len(dataset)) if indices is None else np.asarray(indices)
+        labels = dataset.segments['label'][indices]
+        self.by_class = [indices[labels == label] for label in range(N_CLASSES)]
+        self.by_class = [members for members in self.by_class if len(members)]
+        if not self.by_class:
+            raise ValueError('No segments to sample from')
+
+    def sample_indices(self) -> np.ndarray:
+        classes = self.rng.integers(0, len(self.by_class), self.batch_size)
+        indices = np.array([self.by_class[c][self.rng.integers(len(self.by_class[c]))] for c in classes])
+        # Чтение по возрастанию номеров окон идёт по шардам подряд
+        return np.sort(indices)
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        while True:
+            x, y = self.dataset.batch(self.sample_indices(), self.channels, self.normalize)
+            yield x, one_hot(y) if self.categorical else y
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сборка обучающего набора из размеченных edf файлов')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--pattern', default='*.edf')
+    parser.add_argument('--segment-size', type=int, default=12000)
+    parser.add_argument('--stride', type=int, default=None)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    args = parser.parse_args()
+
+    paths = find_edf_files(args.input, args.pattern)
+    header = build_dataset(paths, args.output, args.workers, args.segment_size, args.stride, args.shard_size)
+    print(f"[DEBUG] {len(paths)} files, {len(header['shards'])} shards, "
+          f"{sum(header['segment_labels'])} segments {header['segment_labels']} in {header['build_seconds']:.1f}s")
@@ -0,0 +1,149 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
+from scipy import fft
+
+# Полосы частот (Гц), мощность в которых считается для каждой аномалии; swd - основная частота разрядов
+FEATURE_BANDS = {
+    'delta': (1.0, 4.0),
+    'swd': (5.0, 9.0),
+    'beta': (13.0, 30.0),
+}
+# Диапазон поиска доминантной частоты (Гц)
+FEATURE_FREQUENCY_RANGE = (1.0, 40.0)
+# Длина сегмента спектра в точках: аномалии короче дополняются нулями,
+# длинные усредняются по сегментам с перекрытием в половину (метод Уэлча)
+FEATURE_SEGMENT = int(os.getenv('FEATURE_SEGMENT', '1024'))
+# У аномалий короче этого спектральные признаки не считаются (nan)
+FEATURE_MIN_SAMPLES = int(os.getenv('FEATURE_MIN_SAMPLES', '64'))
+# Сколько сегментов обрабатывается одним вызовом fft (ограничивает память)
+FEATURE_BATCH = int(os.getenv('FEATURE_BATCH', '1024'))
+
+# Статистики каждого канала внутри аномалии
+CHANNEL_STATS = ('mean', 'std', 'ptp', 'rms')
+
+
+class EventFeatures(NamedTuple):
+    dominant_frequency: np.ndarray  # (n_events,) частота максимума спектра, Гц
+    band_power: np.ndarray          # (n_events, len(FEATURE_BANDS)) мощность в полосах, среднее по каналам
+    channel_stats: np.ndarray       # (n_events, n_channels, len(CHANNEL_STATS))
+
+
+# channel_stats - среднее, отклонение, размах и RMS каждого канала внутри непустых непересекающихся
+# отрезков [starts, ends), упорядоченных по началу.
+# Суммы и экстремумы всех отрезков считаются через reduceat: если отрезки покрывают малую часть записи,
+# их точки сначала собираются подряд, иначе reduceat идёт по всей записи с границами отрезков
+def channel_stats(signals: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    stats = np.zeros((len(starts), signals.shape[0], len(CHANNEL_STATS)))
+    if not len(starts):
+        return stats
+    lengths = ends - starts
+    if lengths.sum() * 4 < signals.shape[1]:
+        bounds = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        values = signals[:, np.repeat(starts - bounds, lengths) + np.arange(lengths.sum())]
+        index = np.arange(len(starts))
+    else:
+        bounds = np.unique(np.concatenate((starts, ends[ends < signals.shape[1]])))
+        values = signals
+        index = np.searchsorted(bounds, starts)
+    counts = lengths[:, None]
+    sums = np.add.reduceat(values, bounds, axis=1, dtype=np.float64)[:, index].T
+    squares = np.add.reduceat(np.square(values, dtype=np.float64), bounds, axis=1)[:, index].T
+    maxima = np.maximum.reduceat(values, bounds, axis=1)[:, index].T
+    minima = np.minimum.reduceat(values, bounds, axis=1)[:, index].T
+    mean = sums / counts
+    stats[..., 0] = mean
+    stats[..., 1] = np.sqrt(np.maximum(squares / counts - mean ** 2, 0))
+    stats[..., 2] = maxima - minima
+    stats[..., 3] = np.sqrt(squares / counts)
+    return stats
+
+
+# _segments раскладывает аномалии на сегменты спектра: первая точка и длина каждого сегмента
+# и номер первого сегмента каждой аномалии (последний элемент - общее число сегментов)
+def _segments(starts: np.ndarray, ends: np.ndarray, segment: int) -> tuple:
+    step = segment // 2
+    lengths = ends - starts
+    counts = np.where(lengths > segment, 1 + (lengths - segment) // step, 1)
+    first = np.concatenate(([0], np.cumsum(counts)))
+    events = np.repeat(np.arange(len(starts)), counts)
+    offsets = starts[events] + (np.arange(first[-1]) - first[events]) * step
+    return offsets, np.minimum(lengths[events], segment), first
+
+
+# _event_spectra - спектральная плотность мощности (n_events, segment // 2 + 1), средняя по каналам,
+# нескольких аномалий одним fft по всем их сегментам: каждый сегмент центрируется и умножается
+# на окно Ханна своей длины, плотности сегментов одной аномалии (first - как в _segments) усредняются
+def _event_spectra(signals: np.ndarray, offsets: np.ndarray, lengths: np.ndarray, first: np.ndarray,
+                   segment: int, sampling_frequency: int) -> np.ndarray:
+    positions = np.arange(segment)
+    n_samples = signals.shape[1]
+    # Сегменты берутся из представления-скользящего окна; у сегментов, которые выходят за конец записи,
+    # точки за концом повторяют последнюю (они всё равно обнуляются окном)
+    edge = np.flatnonzero(offsets > n_samples - segment)
+    if n_samples >= segment:
+        view = np.lib.stride_tricks.sliding_window_view(signals, segment, axis=1)
+        x = view[:, np.minimum(offsets, n_samples - segment)]
+    else:
+        x = np.empty((signals.shape[0], len(offsets), segment), dtype=signals.dtype)
+    if len(edge):
+        x[:, edge] = signals[:, np.minimum(offsets[edge, None] + positions, n_samples - 1)]
+    # Окно Ханна длины сегмента, нули за его концом; полные сегменты делят одно окно
+    window = np.empty((len(offsets), segment), dtype=np.float32)
+    window[:] = 0.5 - 0.5 * np.cos(2 * np.pi * positions / segment)
+    short = np.flatnonzero(lengths < segment)
+    if len(short):
+        part = 0.5 - 0.5 * np.cos(2 * np.pi * positions / lengths[short, None])
+        window[short] = np.where(positions < lengths[short, None], part, 0.0)
+    # Нормировка плотности (fs * сумма квадратов окна) сразу входит в окно
+    window /= np.sqrt(sampling_frequency * np.einsum('rs,rs->r', window, window))[:, None]
+    # (n_channels, n_segments, segment) в float32: среднее вычитается по точкам сегмента
+    x = x.astype(np.float32, copy=False)
+    mask = (positions < lengths[:, None]).astype(np.float32)
+    x -= (np.einsum('crs,rs->cr', x, mask) / lengths)[..., None]
+    x *= window
+    spectrum = fft.rfft(x, axis=2, workers=-1)
+    # |X|^2, сразу просуммированный по каналам: (n_segments, частоты)
+    psd = np.einsum('crf,crf->rf', spectrum.real, spectrum.real)
+    psd += np.einsum('crf,crf->rf', spectrum.imag, spectrum.imag)
+    psd = np.add.reduceat(psd, first[:-1], axis=0, dtype=np.float64) / (np.diff(first) * signals.shape[0])[:, None]
+    # Односторонний спектр: все частоты, кроме 0 и Найквиста, учитываются дважды
+    psd[:, 1:(segment + 1) // 2] *= 2
+    return psd
+
+
+# compute_features считает признаки аномалий [starts, ends) записи signals (n_channels, n_samples):
+# статистики каналов по всей аномалии, мощность в полосах FEATURE_BANDS и доминантную частоту.
+# Сегменты всех аномалий обрабатываются пачками по batch сегментов, аномалия не делится между пачками
+def compute_features(signals: np.ndarray, starts: np.ndarray, ends: np.ndarray, sampling_frequency: int = 400,
+                     segment: int = FEATURE_SEGMENT, batch: int = FEATURE_BATCH,
+                     min_samples: int = FEATURE_MIN_SAMPLES) -> EventFeatures:
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    n_events = len(starts)
+    dominant_frequency = np.full(n_events, np.nan)
+    band_power = np.full((n_events, len(FEATURE_BANDS)), np.nan)
+
+    frequencies = fft.rfftfreq(segment, 1 / sampling_frequency)
+    bands = np.array([(frequencies >= low) & (frequencies <= high) for low, high in FEATURE_BANDS.values()])
+    low, high = FEATURE_FREQUENCY_RANGE
+    search = np.flatnonzero((frequencies >= low) & (frequencies <= high))
+    resolution = sampling_frequency / segment
+
+    # Слишком короткие аномалии пропускаются
+    spectral = np.flatnonzero(ends - starts >= min_samples)
+    offsets, lengths, first = _segments(starts[spectral], ends[spectral], segment)
+    event_start = 0
+    while event_start < len(spectral):
+        event_stop = np.searchsorted(first, first[event_start] + batch, side='right') - 1
+        event_stop = min(max(event_stop, event_start + 1), len(spectral))
+        rows = slice(first[event_start], first[event_stop])
+        psd = _event_spectra(signals, offsets[rows], lengths[rows],
+                             first[event_start:event_stop + 1] - first[event_start], segment, sampling_frequency)
+        selected = spectral[event_start:event_stop]
+        band_power[selected] = psd @ bands.T * resolution
+        dominant_frequency[selected] = frequencies[search[np.argmax(psd[:, search], axis=1)]]
+        event_start = event_stop
+
+    return EventFeatures(dominant_frequency, band_power, channel_stats(signals, starts, ends))
+
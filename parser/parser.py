@@ -1,6 +1,22 @@
+import os
+import json
+import warnings
+
 import numpy as np
 import mne
-from typing import Tuple
+from typing import Iterator, NamedTuple, Optional, Sequence, Tuple
+
+from parser.features import FEATURE_BANDS, CHANNEL_STATS, EventFeatures, compute_features
+
+CHANNEL_NAMES = ['FrL', 'FrR', 'OcR']
+
+# Имена меток начала/конца аномалии в edf для каждого класса
+ANNOTATION_NAMES = {
+    1: ('swd1', 'swd2'),
+    2: ('is1', 'is2'),
+    3: ('ds1', 'ds2'),
+}
+
 
 # parse_file принимает на вход путь к edf файлу и возвращает:
 # - data_with_classes: матрица(np.ndarray) в которой хранятся 3 сигнала (FrL, FrR, OcR) + класс.
@@ -17,52 +33,159 @@ def parse_file(file_path: str) -> Tuple[np.ndarray, list, list, list]:
     
     data = edf.get_data().T
 
-    # Для каждого сигнала добавляем класс
-    # Класс 0 - нет класса
-    # Класс 1 - swd
-    # Класс 2 - is
-    # Класс 3 - ds
-    classes = np.zeros((data.shape[0],), dtype=int)
-
-    # Аннотации - это метки, которые ставятся на временные отрезки сигнала
-    # У нас есть: 
-    # - swd1, swd2 - начало и конец эпи-разрядов
-    # - is1, is2 - начало и конец промежуточной фазы сна
-    # - ds1, ds2 - начало и конец глубокой фазы сна
-    # Они идут по порядку, то есть swd1 - начало значит сразу после него будет swd2 - конец
-
     annotations = edf.annotations
-    swd_annotation, is_annotation, ds_annotation = [], [], []
-    
-    # Обрабатываем аннотации и устанавливаем классы точкам
-    # Не уверен что классы у точек определяются правильно но пока так
-    i = 0
-    while i < len(annotations):
-        onset = int(annotations[i]['onset'] * sampling_frequency)
-        description = annotations[i]['description']
-
-        if description == 'swd1':
-            offset = int(annotations[i + 1]['onset'] * sampling_frequency)
-            swd_annotation.append((onset, offset))
-            classes[onset:offset] = 1
-            i += 2 
-        elif description == 'is1':
-            offset = int(annotations[i + 1]['onset'] * sampling_frequency)
-            is_annotation.append((onset, offset))
-            classes[onset:offset] = 2
-            i += 2
-        elif description == 'ds1':
-            offset = int(annotations[i + 1]['onset'] * sampling_frequency)
-            ds_annotation.append((onset, offset))
-            classes[onset:offset] = 3
-            i += 2
-        else:
-            i += 1  
+    classes, intervals = rasterize_annotations(annotations.onset, annotations.description,
+                                               data.shape[0], sampling_frequency)
     
     data_with_classes = np.column_stack((data, classes))
     
 
-    return data_with_classes, swd_annotation, is_annotation, ds_annotation
+    return data_with_classes, intervals[1], intervals[2], intervals[3]
+
+
+# rasterize_annotations превращает метки edf в класс для каждой точки сигнала.
+# Класс 0 - нет класса
+# Класс 1 - swd
+# Класс 2 - is
+# Класс 3 - ds
+# У нас есть:
+# - swd1, swd2 - начало и конец эпи-разрядов
+# - is1, is2 - начало и конец промежуточной фазы сна
+# - ds1, ds2 - начало и конец глубокой фазы сна
+# Они идут по порядку, то есть swd1 - начало значит сразу после него будет swd2 - конец.
+# Метка начала без парной метки конца сразу за ней (и наоборот) пропускается с предупреждением.
+# Отрезки закрашиваются через разностный массив и cumsum, при пересечении
+# отрезков разных классов побеждает больший класс (ds > is > swd).
+# Возвращает массив классов int8 длины n_samples и словарь {класс: [(начало, конец), ...]} в точках.
+def rasterize_annotations(onsets: np.ndarray, descriptions: Sequence[str], n_samples: int,
+                          sampling_frequency: float = 400) -> Tuple[np.ndarray, dict]:
+    onsets = (np.asarray(onsets, dtype=np.float64) * sampling_frequency).astype(np.int64)
+    descriptions = np.asarray(descriptions)
+    classes = np.zeros(n_samples, dtype=np.int8)
+    diff = np.zeros(n_samples + 1, dtype=np.int32)
+    intervals = {}
+
+    for class_label, (start_name, end_name) in ANNOTATION_NAMES.items():
+        start_idx = np.flatnonzero(descriptions == start_name)
+        end_idx = np.flatnonzero(descriptions == end_name)
+
+        next_idx = start_idx + 1
+        paired = next_idx < len(descriptions)
+        paired[paired] = descriptions[next_idx[paired]] == end_name
+        unpaired_ends = np.setdiff1d(end_idx, start_idx[paired] + 1)
+        if not paired.all() or len(unpaired_ends):
+            warnings.warn(f'Skipped {np.count_nonzero(~paired)} unpaired {start_name} and '
+                          f'{len(unpaired_ends)} unpaired {end_name} markers')
+
+        starts = onsets[start_idx[paired]]
+        ends = onsets[start_idx[paired] + 1]
+        intervals[class_label] = list(zip(starts.tolist(), ends.tolist()))
+
+        starts = np.clip(starts, 0, n_samples)
+        ends = np.clip(ends, 0, n_samples)
+        keep = ends > starts
+        # Разностный массив: +1 в начале отрезка, -1 после конца, cumsum даёт покрытие
+        diff[:] = 0
+        np.add.at(diff, starts[keep], 1)
+        np.add.at(diff, ends[keep], -1)
+        np.cumsum(diff, out=diff)
+        classes[diff[:n_samples] > 0] = class_label
+
+    return classes, intervals
+
+
+# Recording - запись, которая передаётся между этапами пайплайна.
+# Сигналы хранятся непрерывным float32 массивом (n_channels, n_samples),
+# классы - отдельным int8 массивом, поэтому канал или отрезок записи
+# берётся срезом-представлением без копирования.
+class Recording:
+    __slots__ = ('signals', 'labels', 'sampling_frequency', 'ch_names')
+
+    def __init__(self, signals: np.ndarray, labels: Optional[np.ndarray] = None,
+                 sampling_frequency: int = 400, ch_names: Optional[Sequence[str]] = None):
+        # asarray не копирует данные, если тип уже нужный, поэтому срезы остаются представлениями
+        self.signals = np.asarray(signals, dtype=np.float32)
+        if labels is None:
+            labels = np.zeros(self.signals.shape[1], dtype=np.int8)
+        self.labels = np.asarray(labels, dtype=np.int8)
+        self.sampling_frequency = sampling_frequency
+        self.ch_names = list(ch_names or CHANNEL_NAMES[:self.signals.shape[0]])
+
+    @property
+    def n_samples(self) -> int:
+        return self.signals.shape[1]
+
+    def channel(self, index: int) -> np.ndarray:
+        return self.signals[index]
+
+    def slice(self, start: int, stop: int) -> 'Recording':
+        return Recording(self.signals[:, start:stop], self.labels[start:stop], self.sampling_frequency, self.ch_names)
+
+    # iter_windows отдаёт окна (window_size, len(picks)) - представления сигналов, не копии
+    def iter_windows(self, window_size: int = 12000, picks: Optional[Sequence[int]] = None,
+                     drop_tail: bool = True) -> Iterator[np.ndarray]:
+        signals = self.signals if picks is None else self.signals[list(picks)]
+        n_samples = self.n_samples // window_size * window_size if drop_tail else self.n_samples
+        for start in range(0, n_samples, window_size):
+            yield signals[:, start:start + window_size].T
+
+    # Матрица в старом формате parse_file: сигналы + класс последним столбцом (копия)
+    def to_matrix(self) -> np.ndarray:
+        return np.column_stack((self.signals.T, self.labels))
+
+    @classmethod
+    def from_matrix(cls, data_with_classes: np.ndarray, sampling_frequency: int = 400) -> 'Recording':
+        signals = np.ascontiguousarray(data_with_classes[:, :-1].T, dtype=np.float32)
+        return cls(signals, data_with_classes[:, -1], sampling_frequency)
+
+
+# as_recording позволяет этапам пайплайна принимать и Recording, и матрицу из parse_file
+def as_recording(data) -> Recording:
+    if isinstance(data, Recording):
+        return data
+    return Recording.from_matrix(data)
+
+
+# open_edf открывает edf без предзагрузки сигналов и проверяет частоту дискретизации
+def open_edf(file_path: str):
+    edf = mne.io.read_raw_edf(file_path, preload=False, verbose=False)
+    if edf.info['sfreq'] != 400:
+        raise ValueError('Sampling frequency is not 400Hz')
+    return edf
+
+
+# read_signals читает отрезок [start, stop) всех каналов кусками по chunk_size точек
+# в out (float32 (n_channels, stop - start)) или в новый массив
+def read_signals(edf, start: int, stop: int, chunk_size: int = 400 * 600,
+                 out: Optional[np.ndarray] = None) -> np.ndarray:
+    if isinstance(edf, str):
+        edf = open_edf(edf)
+    if out is None:
+        out = np.empty((len(edf.ch_names), stop - start), dtype=np.float32)
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        out[:, chunk_start - start:chunk_stop - start] = edf.get_data(start=chunk_start, stop=chunk_stop)
+    return out
+
+
+# read_labels растеризует аннотации edf в классы первых n_samples точек
+def read_labels(edf, n_samples: int) -> np.ndarray:
+    annotations = edf.annotations
+    labels, _ = rasterize_annotations(annotations.onset, annotations.description, n_samples, edf.info['sfreq'])
+    return labels
+
+
+# read_recording читает edf кусками по chunk_size точек прямо в заранее выделенный
+# float32 массив, не создавая полную float64 копию как edf.get_data()
+def read_recording(file_path: str, max_samples: Optional[int] = None, chunk_size: int = 400 * 600) -> Recording:
+    edf = open_edf(file_path)
+
+    n_samples = edf.n_times
+    if max_samples is not None:
+        n_samples = min(n_samples, max_samples)
+
+    signals = read_signals(edf, 0, n_samples, chunk_size)
+    return Recording(signals, read_labels(edf, n_samples), int(edf.info['sfreq']), edf.ch_names)
 
 
 class Analytics:
@@ -87,6 +210,13 @@ class Analytics:
             2: [], 
             3: []
         }
+        # признаки аномалий каждого типа (compute_features): {имя признака: список значений}
+        # - dominant_frequency, мощность в полосах FEATURE_BANDS ({полоса}_power), RMS каналов ({канал}_rms)
+        self.features = {
+            1: {},
+            2: {},
+            3: {}
+        }
 
     def calculate_average_duration(self):
         if self.anomaly_count > 0:
@@ -100,70 +230,168 @@ class Analytics:
         if len(self.intervals) > 0:
             self.average_interval = sum(self.intervals) / len(self.intervals)
 
+    # from_runs заполняет аналитику по отрезкам, найденным find_runs
+    @classmethod
+    def from_runs(cls, runs: 'Runs', n_samples: int, sampling_frequency: int = 400,
+                  features: Optional[EventFeatures] = None) -> 'Analytics':
+        analytics = cls(sampling_frequency)
+        analytics.total_time = n_samples / sampling_frequency # Время записи в секундах
+        analytics.anomaly_count = len(runs.starts)
+        analytics.total_duration = float(runs.durations.sum())
+        analytics.durations = runs.durations.tolist()
+        analytics.intervals = runs.intervals.tolist()
+
+        onsets_start = runs.starts / sampling_frequency
+        onsets_end = runs.ends / sampling_frequency
+        for label in analytics.anomalies_by_type:
+            mask = runs.labels == label
+            analytics.anomalies_by_type[label] = list(zip(onsets_start[mask].tolist(), onsets_end[mask].tolist()))
+            if len(runs.peak_amplitudes):
+                analytics.peak_amplitudes[label] = runs.peak_amplitudes[mask].tolist()
+            if features is not None:
+                analytics.features[label] = _features_by_label(features, mask)
+
+        analytics.calculate_average_duration()
+        analytics.calculate_percentage_with_anomalies()
+        analytics.calculate_average_interval()
+        return analytics
+
+
+# _features_by_label - признаки аномалий mask по именам столбцов. Каналы называются по позиции
+# (CHANNEL_NAMES, как в export_edf), а не по меткам каналов edf, которые в разных файлах разные
+def _features_by_label(features: EventFeatures, mask: np.ndarray) -> dict:
+    result = {'dominant_frequency': features.dominant_frequency[mask].tolist()}
+    for i, band in enumerate(FEATURE_BANDS):
+        result[f'{band}_power'] = features.band_power[mask, i].tolist()
+    rms = CHANNEL_STATS.index('rms')
+    for i, name in enumerate(CHANNEL_NAMES[:features.channel_stats.shape[1]]):
+        result[f'{name.lower()}_rms'] = features.channel_stats[mask, i, rms].tolist()
+    return result
+
+
+class Runs(NamedTuple):
+    starts: np.ndarray           # индекс первой точки аномалии
+    ends: np.ndarray             # индекс точки сразу после аномалии
+    labels: np.ndarray           # класс аномалии
+    durations: np.ndarray        # длительность, сек
+    intervals: np.ndarray        # промежуток от конца предыдущей аномалии до начала следующей, сек
+    peak_amplitudes: np.ndarray  # exp(|max|) сигнала внутри аномалии (пусто, если signals не переданы)
+
+
+# find_runs за один проход numpy находит все непрерывные отрезки с ненулевым классом.
+# Границы отрезков - точки, где класс меняется (np.diff), пиковые амплитуды
+# считаются по всем отрезкам сразу через np.maximum.reduceat.
+# - classes : массив классов длины n_samples
+# - signals : матрица (n_channels, n_samples) для расчёта пиковых амплитуд
+def find_runs(classes: np.ndarray, signals: Optional[np.ndarray] = None,
+              sampling_frequency: int = 400) -> Runs:
+    classes = np.asarray(classes)
+    n_samples = len(classes)
+    if n_samples == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return Runs(empty, empty, empty, np.zeros(0), np.zeros(0), np.zeros(0))
+
+    # Начала всех отрезков постоянного класса, включая отрезки без аномалий
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(classes)) + 1))
+    run_ends = np.append(run_starts[1:], n_samples)
+    anomaly = classes[run_starts] != 0
 
-# save_to_edf принимает на вход матрицу сигналов и классов и путь к файлу, в который нужно сохранить данные
-def save_to_edf(data_with_classes: np.ndarray, output_file: str) -> Analytics:
-    signals = data_with_classes[:, :3].T  
-    classes = data_with_classes[:, 3] 
+    starts = run_starts[anomaly]
+    ends = run_ends[anomaly]
+    labels = classes[starts].astype(np.int64)
+    onsets_start = starts / sampling_frequency
+    onsets_end = ends / sampling_frequency
+    durations = onsets_end - onsets_start
+    intervals = onsets_start[1:] - onsets_end[:-1]
 
-    sampling_frequency = 400  
-    ch_names = ['FrL', 'FrR', 'OcR']
+    if signals is not None:
+        run_max = np.maximum.reduceat(signals, run_starts, axis=1).max(axis=0)
+        peak_amplitudes = np.exp(np.abs(run_max[anomaly]))
+    else:
+        peak_amplitudes = np.zeros(0)
+
+    return Runs(starts, ends, labels, durations, intervals, peak_amplitudes)
+
+
+# compute_analytics считает аналитику и признаки аномалий записи без экспорта в edf
+def compute_analytics(recording: Recording) -> Analytics:
+    recording = as_recording(recording)
+    signals = recording.signals[:3]
+    runs = find_runs(recording.labels, signals, recording.sampling_frequency)
+    features = compute_features(signals, runs.starts, runs.ends, recording.sampling_frequency)
+    return Analytics.from_runs(runs, recording.n_samples, recording.sampling_frequency, features)
+
+
+# export_edf сохраняет сигналы записи в edf с метками начала/конца каждой аномалии
+def export_edf(recording: Recording, output_file: str) -> None:
+    recording = as_recording(recording)
+    sampling_frequency = recording.sampling_frequency
+    ch_names = CHANNEL_NAMES
     info = mne.create_info(ch_names, sfreq=sampling_frequency, ch_types=['eeg'] * 3)
 
-    raw = mne.io.RawArray(signals, info)
-    annotations = mne.Annotations(onset=[], duration=[], description=[])
-    
-    analytics = Analytics(sampling_frequency) 
-    analytics.total_time = len(classes) / sampling_frequency # Время записи в секундах
-
-    i = 0
-    last_end = 0  # Для вычисления интервалов между аномалиями
-    while i < len(classes):
-        class_label = classes[i]
-        if class_label != 0:
-            start = i
-            while i < len(classes) and classes[i] == class_label:
-                i += 1
-            end = i
-
-            onset_start = start / sampling_frequency
-            onset_end = end / sampling_frequency
-            duration = onset_end - onset_start
-
-            analytics.anomaly_count += 1
-            analytics.total_duration += duration
-            analytics.durations.append(duration)
-            analytics.anomalies_by_type[class_label].append((onset_start, onset_end))
-
-            if last_end > 0:
-                interval = onset_start - last_end
-                analytics.intervals.append(interval)
-            last_end = onset_end
-
-            peak_amplitude = np.abs(np.max(signals[:, start:end]))
-            peak_amplitude = np.exp(peak_amplitude)
-            analytics.peak_amplitudes[class_label].append(peak_amplitude)
-
-            if class_label == 1:
-                description_start, description_end = 'swd1', 'swd2'
-            elif class_label == 2:
-                description_start, description_end = 'is1', 'is2'
-            elif class_label == 3:
-                description_start, description_end = 'ds1', 'ds2'
-
-            annotations.append(onset_start, 0, description_start)
-            annotations.append(onset_end, 0, description_end)
-        else:
-            i += 1
+    raw = mne.io.RawArray(recording.signals[:3], info)
+
+    runs = find_runs(recording.labels, sampling_frequency=sampling_frequency)
+    # Каждой аномалии соответствуют две метки: начало и конец
+    onsets = np.column_stack((runs.starts, runs.ends)).ravel() / sampling_frequency
+    descriptions = [name for label in runs.labels for name in ANNOTATION_NAMES[label]]
+    annotations = mne.Annotations(onset=onsets, duration=np.zeros(len(onsets)), description=descriptions)
 
     raw.set_annotations(annotations)
     raw.export(output_file, fmt='edf')
 
-    analytics.calculate_average_duration()
-    analytics.calculate_percentage_with_anomalies()
-    analytics.calculate_average_interval()
-    
-    return analytics 
+
+# save_to_edf принимает на вход запись (Recording или матрицу сигналов и классов) и путь к файлу, в который нужно сохранить данные
+def save_to_edf(recording: Recording, output_file: str) -> Analytics:
+    recording = as_recording(recording)
+    export_edf(recording, output_file)
+    return compute_analytics(recording)
+
+
+# Бинарный формат размеченной записи - каталог из трёх файлов:
+# - header.json : частота, число точек, имена каналов и раскладка файлов
+# - signals.f32 : сигналы little-endian float32, матрица (n_channels, n_samples) по строкам,
+#                 то есть отрезок [start, stop) канала c лежит в байтах
+#                 [(c * n_samples + start) * 4, (c * n_samples + stop) * 4)
+# - labels.i8   : класс каждой точки, int8
+# Файлы можно читать через np.memmap или HTTP Range запросами без разбора edf.
+BIN_HEADER = 'header.json'
+BIN_SIGNALS = 'signals.f32'
+BIN_LABELS = 'labels.i8'
+
+
+# save_to_bin сохраняет запись в бинарном формате в каталог directory
+def save_to_bin(recording: Recording, directory: str) -> dict:
+    recording = as_recording(recording)
+    os.makedirs(directory, exist_ok=True)
+    recording.signals.astype('<f4', copy=False).tofile(os.path.join(directory, BIN_SIGNALS))
+    recording.labels.tofile(os.path.join(directory, BIN_LABELS))
+
+    n_channels, n_samples = recording.signals.shape
+    header = {
+        'version': 1,
+        'sampling_frequency': recording.sampling_frequency,
+        'n_samples': n_samples,
+        'channels': recording.ch_names,
+        'classes': {0: 'none', 1: 'swd', 2: 'is', 3: 'ds'},
+        'signals': {'file': BIN_SIGNALS, 'dtype': '<f4', 'shape': [n_channels, n_samples], 'order': 'C'},
+        'labels': {'file': BIN_LABELS, 'dtype': '|i1', 'shape': [n_samples]},
+    }
+    with open(os.path.join(directory, BIN_HEADER), 'w') as f:
+        json.dump(header, f)
+    return header
+
+
+# load_bin открывает запись из бинарного формата через np.memmap:
+# данные читаются с диска только при обращении к нужному отрезку
+def load_bin(directory: str) -> Recording:
+    with open(os.path.join(directory, BIN_HEADER)) as f:
+        header = json.load(f)
+    signals = np.memmap(os.path.join(directory, header['signals']['file']), dtype=header['signals']['dtype'],
+                        mode='r', shape=tuple(header['signals']['shape']))
+    labels = np.memmap(os.path.join(directory, header['labels']['file']), dtype=header['labels']['dtype'],
+                       mode='r', shape=tuple(header['labels']['shape']))
+    return Recording(signals, labels, header['sampling_frequency'], header['channels'])
 
 
 # save_to_csv сохраняет 3 сигнала (FrL, FrR, OcR) вместе с классами в csv файл
@@ -1,47 +1,140 @@
 import sys, os
+import uuid
+from functools import partial
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from parser.parser import parse_file, save_to_edf
+from parser.parser import parse_file, read_recording, as_recording, Analytics, find_runs, export_edf, save_to_bin, load_bin
+from parser.features import compute_features
 from .word import save_analytics_to_word
-def get_marked_edf(unmarked_filename, hash):
+from .events import event_index, EventIndex
+from .registry import ModelRegistry
+from .inference import InferenceEngine
+from .scaler import StreamingScaler
+from .backends import load_backend
+from .pipeline import run_stages, read_recording_sharded, PARSE_WORKERS
+from . import metrics
+# get_marked_edf размечает запись и сохраняет артефакты в directory.
+# Этапы после разметки (бинарный формат, docx, индекс событий, edf при EAGER_EDF_EXPORT и дополнительные
+# stages - {имя: функция(recording)}) выполняются одновременно через run_stages.
+# filename - исходное имя файла для индекса событий, events_db - файл индекса событий
+# (по умолчанию общий индекс сервера event_index), eager_edf - собрать edf сразу (по умолчанию EAGER_EDF_EXPORT)
+def get_marked_edf(unmarked_filename, hash, progress=None, stages=None, directory=None, filename=None,
+                   events_db=None, eager_edf=None):
     #data, swd, is_, ds = parse_file(unmarked_filename) 
+    # progress(stage, fraction) - необязательный колбэк для отчёта о ходе обработки
+    progress = progress or (lambda stage, fraction: None)
+    directory = directory or STATIC_DIRECTORY
+    index = EventIndex(events_db) if events_db else event_index
 
-    model = load_model("clown-net-new-finak-one.keras")    
-    data, x_data = prepare_data(unmarked_filename, k=1)
-    data = data[0]
-    data = data[:8640000]
-    classes = predict_model(model, x_data)
-    data[:, -1] = classes
+    model = model_registry.get()
+    progress("parse", 0.05)
+    # Запись читается один раз в float32, дальше этапы работают с её представлениями.
+    # Целиком в памяти она нужна и после разметки (бинарный формат, признаки, графики, пирамида),
+    # поэтому пик памяти ограничен не окном, а MAX_SAMPLES: около MAX_SAMPLES * (4 * число каналов + 1) байт.
+    # Окнами идут только нормировка и модель (InferenceEngine держит batch_size окон)
+    if PARSE_WORKERS > 1:
+        with metrics.stage("parse_file"):
+            recording, scaler = read_recording_sharded(unmarked_filename, (1, NORMALIZATION, NORMALIZATION_BLOCK),
+                                                       max_samples=MAX_SAMPLES)
+    else:
+        with metrics.stage("parse_file"):
+            recording = read_recording(unmarked_filename, max_samples=MAX_SAMPLES)
+        with metrics.stage("prepare_data"):
+            scaler = fit_scaler(recording, k=1)
+
+    progress("predict", 0.2)
+    # Последнее окно выравнивается по концу записи, так что хвост тоже размечается
+    signals = recording.signals[:1]
+    engine = InferenceEngine(model, SEGMENT_SIZE, batch_size=INFERENCE_BATCH_SIZE,
+                             overlap=INFERENCE_OVERLAP, blend=INFERENCE_BLEND)
+    with metrics.stage("predict_model"):
+        recording.labels[:] = engine.predict(signals, scaler)
+    metrics.log_event("inference", windows=engine.stats['windows'], seconds=round(engine.stats['seconds'], 3))
+
+    # Размеченная запись сохраняется в бинарном формате, edf собирается из него
+    # только при первом скачивании (или сразу, если включён EAGER_EDF_EXPORT)
+    marked_filename = f"recordings/{hash}/edf"
+
+    # Аномалии и их признаки считаются один раз для docx и индекса событий
+    sampling_frequency = recording.sampling_frequency
+    with metrics.stage("compute_features"):
+        channels = recording.signals[:3]
+        runs = find_runs(recording.labels, channels, sampling_frequency)
+        features = compute_features(channels, runs.starts, runs.ends, sampling_frequency)
+    analytics = Analytics.from_runs(runs, recording.n_samples, sampling_frequency, features)
+
+    post_stages = {
+        "save_to_bin": lambda: save_to_bin(recording, recording_directory(hash, directory)),
+        "save_analytics_to_word": lambda: save_analytics_to_word(analytics, f"{directory}/{hash}.docx"),
+        "index_events": lambda: index.store(hash, recording, runs, features, filename=filename,
+                                            model=os.path.basename(model_registry.path)),
+    }
+    if EAGER_EDF_EXPORT if eager_edf is None else eager_edf:
+        post_stages["save_to_edf"] = lambda: export_edf(recording, marked_edf_path(hash, directory))
+    for name, stage in (stages or {}).items():
+        post_stages[name] = partial(stage, recording)
+    run_stages(post_stages, progress, 0.55, 0.95)
+
+    return marked_filename, recording
+
+
+# Каталог артефактов, который раздаётся как /static
+STATIC_DIRECTORY = os.getenv("STATIC_DIRECTORY", "server/static")
 
-    marked_filename = f"static/{hash}_marked.edf"
-    analytics = save_to_edf(data, "server/"+marked_filename)
-    save_analytics_to_word(analytics, f"server/static/{hash}.docx")
 
-    return marked_filename, data
-    
+def recording_directory(hash, directory=STATIC_DIRECTORY):
+    return f"{directory}/{hash}_rec"
+
+
+def marked_edf_path(hash, directory=STATIC_DIRECTORY):
+    return f"{directory}/{hash}_marked.edf"
+
+
+# get_marked_edf_file возвращает путь к размеченному edf, при необходимости собирая его из бинарного формата
+def get_marked_edf_file(hash):
+    path = marked_edf_path(hash)
+    if not os.path.isfile(path):
+        tmp_path = f"{path[:-4]}.{uuid.uuid4().hex}.edf"
+        with metrics.stage("save_to_edf"):
+            export_edf(load_bin(recording_directory(hash)), tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
 
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
 
+# load_model возвращает бэкенд разметки: .keras через tensorflow, .npz (convert_keras_model) на numpy
 def load_model(path_for_model):
-    from tensorflow.keras.models import load_model
-    return load_model(path_for_model)
+    return load_backend(path_for_model)
+
+# Модель грузится один раз на процесс и переиспользуется между запросами
+MODEL_PATH = os.getenv("MODEL_PATH", "clown-net-new-finak-one.keras")
+model_registry = ModelRegistry(MODEL_PATH, loader=load_model, k=1)
+EAGER_EDF_EXPORT = os.getenv("EAGER_EDF_EXPORT", "0") == "1"
+# Больше 6 часов записи (при 400Гц) не размечаем
+MAX_SAMPLES = 8640000
+SEGMENT_SIZE = 12000
+# Окон в одном вызове модели и доля перекрытия соседних окон (0 - окна встык)
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+INFERENCE_OVERLAP = float(os.getenv("INFERENCE_OVERLAP", "0"))
+INFERENCE_BLEND = os.getenv("INFERENCE_BLEND", "mean")
+# Нормировка входа модели: global - по всей записи, window - по каждому окну,
+# rolling - по блокам NORMALIZATION_BLOCK точек (для длинных записей с дрейфом)
+NORMALIZATION = os.getenv("NORMALIZATION", "global")
+NORMALIZATION_BLOCK = int(os.getenv("NORMALIZATION_BLOCK", str(400 * 600)))
 
 def prepare_data(path_for_edf, k=3):
     data_test = parse_file(path_for_edf)
-    data_df = pd.DataFrame(data_test[0])[[0, 1, 2]]
-    data_df.columns = ['1', '2', '3']
-    standard_scaler = StandardScaler()
-    if k == 3:
-        X_data = standard_scaler.fit_transform(np.array(data_df[['1', '2', '3']]))
-    else:
-        X_data = standard_scaler.fit_transform(np.array(data_df['1']).reshape(-1, 1))
-    X_data_total = X_data  
-    segment_size = 12000
-    num_segments = len(X_data_total) // segment_size
-    X_data_total = X_data_total[:num_segments * segment_size].reshape(-1, segment_size, k)
+    X_data = data_test[0][:, :k].astype(np.float32)
+    StreamingScaler(k).fit([X_data]).transform(X_data)
+    num_segments = len(X_data) // SEGMENT_SIZE
+    X_data_total = X_data[:num_segments * SEGMENT_SIZE].reshape(-1, SEGMENT_SIZE, k)
     return data_test, X_data_total
 
-def predict_model(model, X_data):
-    pred = model.predict(X_data)
-    return np.argmax(pred, axis=2).flatten()
\ No newline at end of file
+
+# fit_scaler одним проходом по записи (кусками по chunk_size точек, без копии всей записи)
+# считает статистики нормировки первых k каналов
+def fit_scaler(recording, k=3, mode=None, block_size=None, chunk_size=400 * 600):
+    scaler = StreamingScaler(k, mode or NORMALIZATION, block_size or NORMALIZATION_BLOCK)
+    if scaler.mode == 'window':
+        return scaler
+    return scaler.fit(as_recording(recording).iter_windows(chunk_size, picks=list(range(k)), drop_tail=False))
@@ -0,0 +1,105 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+from functools import lru_cache
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .cache import KEY_PATTERN
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета Brotli артефакты сжимаются только gzip
+    brotli = None
+
+# Степень сжатия артефактов при записи (сжимаются один раз, поэтому можно сильнее, чем на лету)
+ARTIFACT_GZIP_LEVEL = int(os.getenv("ARTIFACT_GZIP_LEVEL", "9"))
+ARTIFACT_BROTLI_QUALITY = int(os.getenv("ARTIFACT_BROTLI_QUALITY", "9"))
+# Артефакты с именем от ключа кэша не меняются, браузер может не перепроверять их
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Расширения заранее сжатых копий в порядке предпочтения и их Content-Encoding
+ENCODINGS = ((".br", "br"), (".gz", "gzip"))
+
+
+# write_artifact записывает data в path и рядом сжатые копии path.gz и path.br
+# (через временные файлы, чтобы static не отдал недописанный файл)
+def write_artifact(path: str, data) -> None:
+    if isinstance(data, str):
+        data = data.encode()
+    variants = {path: data, f"{path}.gz": gzip.compress(data, ARTIFACT_GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants[f"{path}.br"] = brotli.compress(data, quality=ARTIFACT_BROTLI_QUALITY)
+    # Несжатый файл пишется последним: когда он есть, сжатые копии уже готовы
+    for variant_path in sorted(variants, key=lambda name: name == path):
+        tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(variants[variant_path])
+        os.replace(tmp_path, variant_path)
+
+
+@lru_cache(maxsize=256)
+def _content_digest(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# accepted_encodings - кодировки из Accept-Encoding с ненулевым q
+def accepted_encodings(header: Optional[str]) -> set:
+    accepted = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip().removeprefix("q=") if params.strip().startswith("q=") else "1"
+        try:
+            if float(q) > 0:
+                accepted.add(name.strip().lower())
+        except ValueError:
+            continue
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+        StaticFiles, который отдаёт заранее сжатую копию файла (path.br, path.gz от write_artifact),
+        если клиент её принимает, с сильным ETag от содержимого несжатого файла и Vary: Accept-Encoding.
+        Файлы с именем от ключа кэша отдаются с Cache-Control immutable, остальные - с перепроверкой.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        variants = [(suffix, encoding) for suffix, encoding in ENCODINGS if os.path.isfile(full_path + suffix)]
+
+        served_path, served_stat, encoding = full_path, stat_result, None
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        for suffix, name in variants:
+            if name in accepted:
+                served_path, encoding = full_path + suffix, name
+                served_stat = os.stat(served_path)
+                break
+
+        # Сжатые копии, запрошенные напрямую (file.json.gz), отдаются как есть, без типа несжатого файла
+        media_type, file_encoding = mimetypes.guess_type(full_path)
+        media_type = "application/octet-stream" if file_encoding else media_type or "text/plain"
+        response = FileResponse(served_path, status_code=status_code, stat_result=served_stat, media_type=media_type)
+        if variants:
+            digest = _content_digest(full_path, stat_result.st_mtime_ns, stat_result.st_size)[:32]
+            response.headers["etag"] = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+            response.headers["vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["content-encoding"] = encoding
+        # Ключ кэша - начало имени файла или каталога записи ({key}_rec/signals.f32)
+        relative_path = os.path.relpath(full_path, os.path.realpath(self.directory))
+        response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL if KEY_PATTERN.match(relative_path) else "no-cache"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
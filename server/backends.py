@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+from typing import Callable, List
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Бэкенд разметки - любой объект с методом predict(batch, verbose=0), который по батчу
+# (B, segment_size, k) float32 возвращает вероятности классов (B, segment_size, n_classes).
+# KerasBackend грузит .keras модель через tensorflow, NumpyBackend выполняет ту же сеть
+# на numpy по весам, сконвертированным в .npz (convert_keras_model), без импорта tensorflow.
+
+
+class KerasBackend:
+    def __init__(self, path: str):
+        from tensorflow.keras.models import load_model
+        self.path = path
+        self.model = load_model(path)
+
+    def predict(self, batch: np.ndarray, verbose: int = 0) -> np.ndarray:
+        return self.model.predict(batch, verbose=verbose)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    # exp переполняется до inf на больших отрицательных x, сигмоида там честно даёт 0
+    with np.errstate(over='ignore'):
+        np.exp(np.negative(x, out=x), out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': _sigmoid,
+}
+
+
+# Отступы padding='same' как в tensorflow: лишняя точка уходит вправо
+def _same_padding(n: int, kernel_size: int, stride: int, out: int) -> tuple:
+    total = max((out - 1) * stride + kernel_size - n, 0)
+    return total // 2, total - total // 2
+
+
+def _conv1d(x: np.ndarray, kernel: np.ndarray, bias: np.ndarray, stride: int) -> np.ndarray:
+    kernel_size = kernel.shape[0]
+    n = x.shape[1]
+    out = -(-n // stride)
+    left, right = _same_padding(n, kernel_size, stride, out)
+    x = np.pad(x, ((0, 0), (left, right), (0, 0)))
+    # Окна (B, out, C, kernel_size) - представление, свёртка сводится к одному умножению матриц
+    columns = sliding_window_view(x, kernel_size, axis=1)[:, ::stride][:, :out]
+    return np.tensordot(columns, kernel, axes=([2, 3], [1, 0])) + bias
+
+
+def _conv1d_transpose(x: np.ndarray, kernel: np.ndarray, bias: np.ndarray, stride: int) -> np.ndarray:
+    # Ядро keras Conv1DTranspose: (kernel_size, filters, in_channels)
+    kernel_size, filters, _ = kernel.shape
+    batch, n, _ = x.shape
+    out = n * stride
+    left = max(kernel_size - stride, 0) // 2
+    full = np.zeros((batch, max((n - 1) * stride + kernel_size, left + out), filters), dtype=np.float32)
+    for offset in range(kernel_size):
+        full[:, offset:offset + (n - 1) * stride + 1:stride] += x @ kernel[offset].T
+    result = full[:, left:left + out]
+    result += bias
+    return result
+
+
+def _max_pool1d(x: np.ndarray, pool_size: int, stride: int) -> np.ndarray:
+    n = x.shape[1]
+    out = -(-n // stride)
+    left, right = _same_padding(n, pool_size, stride, out)
+    if left or right:
+        x = np.pad(x, ((0, 0), (left, right), (0, 0)), constant_values=-np.inf)
+    if stride == pool_size:
+        return x[:, :out * stride].reshape(x.shape[0], out, pool_size, x.shape[2]).max(axis=2)
+    return sliding_window_view(x, pool_size, axis=1)[:, ::stride][:, :out].max(axis=3)
+
+
+def _scalar(value) -> int:
+    return value[0] if isinstance(value, (list, tuple)) else value
+
+
+# _build_layer возвращает функцию слоя по его конфигу keras и весам (get_weights)
+def _build_layer(class_name: str, config: dict, weights: List[np.ndarray]) -> Callable:
+    activation = ACTIVATIONS[config.get('activation', 'linear')]
+    if class_name == 'Conv1D':
+        kernel, bias = weights
+        stride = _scalar(config['strides'])
+        return lambda x: activation(_conv1d(x, kernel, bias, stride))
+    if class_name == 'Conv1DTranspose':
+        kernel, bias = weights
+        stride = _scalar(config['strides'])
+        return lambda x: activation(_conv1d_transpose(x, kernel, bias, stride))
+    if class_name == 'Dense':
+        kernel, bias = weights
+        return lambda x: activation(x @ kernel + bias)
+    if class_name == 'BatchNormalization':
+        weights = list(weights)
+        gamma = weights.pop(0) if config.get('scale', True) else 1.0
+        beta = weights.pop(0) if config.get('center', True) else 0.0
+        moving_mean, moving_variance = weights
+        # В режиме вывода нормировка - это одно умножение и сложение на канал
+        multiplier = (gamma / np.sqrt(moving_variance + config.get('epsilon', 1e-3))).astype(np.float32)
+        offset = (beta - moving_mean * multiplier).astype(np.float32)
+        return lambda x: np.add(np.multiply(x, multiplier, out=x), offset, out=x)
+    if class_name in ('MaxPooling1D', 'MaxPool1D'):
+        pool_size = _scalar(config['pool_size'])
+        stride = _scalar(config.get('strides') or pool_size)
+        return lambda x: _max_pool1d(x, pool_size, stride)
+    if class_name == 'Flatten':
+        return lambda x: x.reshape(x.shape[0], -1)
+    if class_name == 'Reshape':
+        shape = tuple(config['target_shape'])
+        return lambda x: x.reshape((x.shape[0],) + shape)
+    if class_name in ('Dropout', 'InputLayer'):
+        return lambda x: x
+    raise ValueError(f'Unsupported layer {class_name}')
+
+
+class NumpyBackend:
+    """
+        Прямой проход последовательной сети (Conv1D, Conv1DTranspose, Dense,
+        BatchNormalization, MaxPooling1D, Flatten, Reshape, Dropout) на numpy в float32.
+        Веса и конфиг слоёв берутся из .npz, который пишет convert_keras_model,
+        поэтому процессу не нужен tensorflow.
+    """
+
+    def __init__(self, layers: List[dict], weights: List[List[np.ndarray]]):
+        self.layers = [
+            _build_layer(layer['class_name'], layer['config'], [w.astype(np.float32) for w in layer_weights])
+            for layer, layer_weights in zip(layers, weights)
+        ]
+
+    @classmethod
+    def load(cls, path: str) -> 'NumpyBackend':
+        with np.load(path) as data:
+            layers = json.loads(str(data['layers']))
+            weights = [[data[f'{i}_{j}'] for j in range(layer['n_weights'])] for i, layer in enumerate(layers)]
+        return cls(layers, weights)
+
+    def predict(self, batch: np.ndarray, verbose: int = 0) -> np.ndarray:
+        x = np.array(batch, dtype=np.float32)
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+
+# convert_keras_model сохраняет конфиг слоёв и веса keras модели в .npz для NumpyBackend.
+# Нужен tensorflow, поэтому запускается один раз там, где модель обучалась
+def convert_keras_model(keras_path: str, output_path: str) -> None:
+    from tensorflow.keras.models import load_model
+
+    model = load_model(keras_path)
+    layers, arrays = [], {}
+    for i, layer in enumerate(model.layers):
+        weights = layer.get_weights()
+        layers.append({'class_name': layer.__class__.__name__, 'config': layer.get_config(),
+                       'n_weights': len(weights)})
+        for j, weight in enumerate(weights):
+            arrays[f'{i}_{j}'] = weight
+    np.savez(output_path, layers=json.dumps(layers, default=str), **arrays)
+
+
+# load_backend выбирает бэкенд по расширению файла модели
+def load_backend(path: str):
+    if os.path.splitext(path)[1] == '.npz':
+        return NumpyBackend.load(path)
+    return KerasBackend(path)
+
+
+if __name__ == '__main__':
+    # python server/backends.py model.keras model.npz
+    convert_keras_model(sys.argv[1], sys.argv[2])
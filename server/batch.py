@@ -0,0 +1,76 @@
+# Пакетная разметка каталога edf файлов без сервера.
+# Файлы распределяются по workers процессам (в каждом модель грузится один раз),
+# артефакты каждого файла (размеченный edf, docx, графики, манифест {имя}_result.json с путями
+# относительно output) пишутся в output под именем файла без расширения,
+# сводка по времени и пропускной способности - в output/summary.json,
+# индекс найденных событий - в output/events.db (не в общий индекс сервера).
+# Запуск из корня репозитория:
+#   python -m server.batch <каталог с edf> [--output каталог] [--workers N] [--model файл]
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .ai import MODEL_PATH
+from .jobs import _init_worker, run_pipeline
+
+
+def process_file(path: str, output: str, model_path: str) -> dict:
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        result = run_pipeline(name, path, name, model_path, directory=output,
+                              filename=os.path.basename(path), events_db=os.path.join(output, "events.db"),
+                              offline=True)
+    except Exception as e:
+        return {"file": path, "status": "failed", "error": repr(e)}
+    return {"file": path, "status": "done", "samples": result["samples"], "seconds": result["seconds"]}
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Разметка всех edf файлов каталога")
+    parser.add_argument("input")
+    parser.add_argument("--output", default=None, help="каталог артефактов (по умолчанию <input>/marked)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--model", default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(args.input, "marked")
+    os.makedirs(output, exist_ok=True)
+    paths = sorted(os.path.join(args.input, name) for name in os.listdir(args.input)
+                   if name.lower().endswith(".edf"))
+
+    start = time.perf_counter()
+    files = []
+    context = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(args.workers, 1), mp_context=context,
+                             initializer=_init_worker, initargs=(None, args.model)) as executor:
+        futures = [executor.submit(process_file, path, output, args.model) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            files.append(result)
+            print(f"[DEBUG] {result['file']}: {result['status']}", result.get("error", ""))
+    elapsed = time.perf_counter() - start
+
+    samples = sum(result.get("samples", 0) for result in files)
+    summary = {
+        "files": len(files),
+        "failed": sum(result["status"] == "failed" for result in files),
+        "workers": args.workers,
+        "seconds": elapsed,
+        "samples": samples,
+        "samples_per_second": samples / elapsed if elapsed > 0 else None,
+        "files_per_minute": len(files) / elapsed * 60 if elapsed > 0 else None,
+        "results": sorted(files, key=lambda result: result["file"]),
+    }
+    with open(os.path.join(output, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"[DEBUG] {len(files)} files in {elapsed:.1f}s, {summary['samples_per_second'] or 0:.0f} samples/s")
+    return summary
+
+
+if __name__ == "__main__":
+    summary = main()
+    sys.exit(1 if summary["failed"] else 0)
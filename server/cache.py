@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from . import metrics
+
+# Предел размера кэша результатов и время жизни результата без обращений
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", str(30 * 24 * 3600)))
+
+# Все артефакты загрузки называются с ключа кэша: {key}.edf, {key}_rec/, {key}.docx, ...
+KEY_PATTERN = re.compile(r'^([0-9a-f]{64})')
+
+
+@lru_cache(maxsize=16)
+def _file_digest(path: str, mtime: float) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# model_version - sha256 файла модели, пересчитывается только при изменении файла
+def model_version(path: str) -> str:
+    if not os.path.isfile(path):
+        return path
+    return _file_digest(path, os.path.getmtime(path))
+
+
+# cache_key - ключ результата: содержимое загруженного файла плюс версия модели
+def cache_key(content_digest: str, model_path: str) -> str:
+    return hashlib.sha256(f"{content_digest}:{model_version(model_path)}".encode()).hexdigest()
+
+
+class ResultCache:
+    """
+        Кэш результатов обработки по содержимому загруженного файла.
+        Для каждого ключа хранится манифест {key}_result.json со ссылками на артефакты,
+        время изменения манифеста служит временем последнего обращения для LRU.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = CACHE_MAX_BYTES, max_age: int = CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def manifest_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}_result.json")
+
+    def lookup(self, key: str) -> Optional[dict]:
+        path = self.manifest_path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return result
+
+    def store(self, key: str, result: dict) -> None:
+        # Пишем через временный файл, чтобы lookup не увидел недописанный манифест
+        path = self.manifest_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+    def _entries(self) -> dict:
+        entries = {}
+        for name in os.listdir(self.directory):
+            match = KEY_PATTERN.match(name)
+            # Временные файлы недописанных артефактов (write_artifact, store) не входят в кэш
+            if match is None or name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.directory, name)
+            # Файл может исчезнуть между listdir и stat (os.replace или eviction в другом воркере)
+            try:
+                size, mtime = _tree_size(path), os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            entry = entries.setdefault(match.group(1), {"paths": [], "size": 0, "atime": 0.0})
+            entry["paths"].append(path)
+            entry["size"] += size
+            entry["atime"] = max(entry["atime"], mtime)
+        return entries
+
+    # evict удаляет результаты старше max_age, затем самые давно использованные,
+    # пока кэш не уложится в max_bytes. Ключи из protected (задачи в работе) не трогаются
+    def evict(self, protected: Iterable[str] = ()) -> list:
+        protected = set(protected)
+        with self._lock:
+            entries = self._entries()
+            total = sum(entry["size"] for entry in entries.values())
+            now = time.time()
+            evicted = []
+            for key, entry in sorted(entries.items(), key=lambda item: item[1]["atime"]):
+                if key in protected:
+                    continue
+                if now - entry["atime"] <= self.max_age and total <= self.max_bytes:
+                    break
+                for path in entry["paths"]:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                total -= entry["size"]
+                evicted.append(key)
+        if evicted:
+            metrics.log_event("cache_evicted", results=len(evicted), cache_bytes=total)
+        return evicted
+
+
+def _tree_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import sqlite3
+from contextlib import closing
+from typing import Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from parser.parser import CHANNEL_NAMES, Recording, Runs
+from parser.features import FEATURE_BANDS, CHANNEL_STATS, EventFeatures, compute_features
+from . import metrics
+
+# Индекс найденных аномалий всех обработанных записей (SQLite, вне static - не раздаётся наружу)
+EVENTS_DB = os.getenv("EVENTS_DB", "server/events.db")
+EVENT_TYPES = {1: "swd", 2: "is", 3: "ds"}
+# Признаки аномалии (parser.features): статистики каналов, доминантная частота и мощность в полосах
+CHANNEL_COLUMNS = [f"{channel.lower()}_{stat}" for channel in CHANNEL_NAMES for stat in CHANNEL_STATS]
+BAND_COLUMNS = [f"{band}_power" for band in FEATURE_BANDS]
+FEATURE_COLUMNS = ["dominant_frequency"] + BAND_COLUMNS + CHANNEL_COLUMNS
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS recordings (
+    hash TEXT PRIMARY KEY,
+    filename TEXT,
+    model TEXT,
+    processed_at REAL NOT NULL,
+    n_samples INTEGER NOT NULL,
+    sampling_frequency INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    event_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL REFERENCES recordings(hash) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    duration REAL NOT NULL,
+    peak_amplitude REAL,
+    processed_at REAL NOT NULL,
+    {", ".join(f"{column} REAL" for column in FEATURE_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS events_type_duration ON events(type, duration);
+CREATE INDEX IF NOT EXISTS events_processed_at ON events(processed_at);
+CREATE INDEX IF NOT EXISTS events_hash_start ON events(hash, start);
+"""
+
+
+def _filters(types: Optional[Sequence[str]] = None, hash: Optional[str] = None,
+             min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             min_peak: Optional[float] = None, min_frequency: Optional[float] = None,
+             max_frequency: Optional[float] = None) -> tuple:
+    clauses, params = [], []
+    if types:
+        clauses.append(f"type IN ({', '.join('?' * len(types))})")
+        params.extend(types)
+    for clause, value in (("hash = ?", hash), ("duration >= ?", min_duration), ("duration <= ?", max_duration),
+                          ("processed_at >= ?", since), ("processed_at < ?", until),
+                          ("peak_amplitude >= ?", min_peak), ("dominant_frequency >= ?", min_frequency),
+                          ("dominant_frequency <= ?", max_frequency)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+class EventIndex:
+    """
+        Постоянный индекс аномалий: записи и их события в SQLite с индексами по типу,
+        длительности, времени обработки и записи. Пишут процессы-воркеры после разметки,
+        читают эндпоинты /events и /recordings/{hash}/summary - без edf и без модели.
+        Соединение открывается на каждую операцию, WAL позволяет читать во время записи.
+    """
+
+    def __init__(self, path: str = EVENTS_DB):
+        self.path = path
+        self._ready = False
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        if not self._ready:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.executescript(SCHEMA)
+            self._migrate(connection)
+            self._ready = True
+        return connection
+
+    # _migrate добавляет столбцы признаков, которых нет в индексе, созданном прежней версией
+    def _migrate(self, connection: sqlite3.Connection) -> None:
+        existing = {row["name"] for row in connection.execute("PRAGMA table_info(events)")}
+        for column in FEATURE_COLUMNS:
+            if column not in existing:
+                connection.execute(f"ALTER TABLE events ADD COLUMN {column} REAL")
+
+    # store заменяет события записи hash найденными в runs (повторная разметка перезаписывает их).
+    # features - признаки тех же аномалий, если уже посчитаны
+    def store(self, hash: str, recording: Recording, runs: Runs, features: Optional[EventFeatures] = None,
+              filename: Optional[str] = None, model: Optional[str] = None) -> int:
+        processed_at = time.time()
+        sampling_frequency = recording.sampling_frequency
+        n_events = len(runs.starts)
+        if features is None:
+            features = compute_features(recording.signals[:len(CHANNEL_NAMES)], runs.starts, runs.ends,
+                                        sampling_frequency)
+        values = np.column_stack((features.dominant_frequency, features.band_power,
+                                  features.channel_stats.reshape(n_events, len(CHANNEL_COLUMNS))))
+        peaks = runs.peak_amplitudes if len(runs.peak_amplitudes) else np.full(n_events, np.nan)
+        # nan (признак не посчитан) SQLite сохраняет как NULL
+        rows = zip([hash] * n_events, [EVENT_TYPES[label] for label in runs.labels.tolist()],
+                   (runs.starts / sampling_frequency).tolist(), (runs.ends / sampling_frequency).tolist(),
+                   runs.durations.tolist(), peaks.tolist(), [processed_at] * n_events, *values.T.tolist())
+        columns = ["hash", "type", "start", "end", "duration", "peak_amplitude", "processed_at"] + FEATURE_COLUMNS
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute("DELETE FROM recordings WHERE hash = ?", (hash,))
+            connection.execute(
+                "INSERT INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (hash, filename, model, processed_at, recording.n_samples, sampling_frequency,
+                 recording.n_samples / sampling_frequency, len(runs.starts)))
+            connection.executemany(
+                f"INSERT INTO events ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+        metrics.log_event("events_indexed", hash=hash, events=n_events)
+        return n_events
+
+    # events - события по фильтрам (см. _filters), по времени обработки и началу события
+    def events(self, limit: int = 1000, offset: int = 0, **filters) -> list:
+        where, params = _filters(**filters)
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                f"SELECT * FROM events{where} ORDER BY processed_at, hash, start LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    # summary - сводка по типам событий, подходящих под фильтры
+    def summary(self, **filters) -> dict:
+        where, params = _filters(**filters)
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                f"SELECT type, COUNT(*) AS count, COUNT(DISTINCT hash) AS recordings, "
+                f"SUM(duration) AS total_duration, AVG(duration) AS mean_duration, "
+                f"MIN(duration) AS min_duration, MAX(duration) AS max_duration, "
+                f"MAX(peak_amplitude) AS max_peak_amplitude, AVG(dominant_frequency) AS mean_dominant_frequency, "
+                f"{', '.join(f'AVG({column}) AS mean_{column}' for column in BAND_COLUMNS)} "
+                f"FROM events{where} GROUP BY type",
+                params).fetchall()
+        return {row["type"]: {key: row[key] for key in row.keys() if key != "type"} for row in rows}
+
+    def recording(self, hash: str) -> Optional[dict]:
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT * FROM recordings WHERE hash = ?", (hash,)).fetchone()
+        return dict(row) if row is not None else None
+
+    # recording_summary - запись, сводка по типам и средние статистики каналов её событий
+    def recording_summary(self, hash: str) -> Optional[dict]:
+        recording = self.recording(hash)
+        if recording is None:
+            return None
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                f"SELECT type, {', '.join(f'AVG({column}) AS {column}' for column in CHANNEL_COLUMNS)} "
+                f"FROM events WHERE hash = ? GROUP BY type", (hash,)).fetchall()
+        channels = {row["type"]: {column: row[column] for column in CHANNEL_COLUMNS} for row in rows}
+        types = self.summary(hash=hash)
+        for name, stats in types.items():
+            stats["time_share"] = stats["total_duration"] / recording["duration"] if recording["duration"] else 0.0
+            stats["channels"] = channels.get(name, {})
+        return {"recording": recording, "types": types}
+
+
+event_index = EventIndex()
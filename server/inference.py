@@ -0,0 +1,121 @@
+import time
+from typing import Iterator
+
+import numpy as np
+
+
+class InferenceEngine:
+    """
+        Разметка записи скользящим окном модели.
+        Окна идут с шагом segment_size * (1 - overlap) и подаются в модель батчами
+        по batch_size. Вероятности классов перекрывающихся окон усредняются по каждой
+        точке (с весом, спадающим к краям окна, если blend='taper'), последнее окно
+        выравнивается по концу записи, так что хвост тоже размечается.
+        В памяти держится только текущий батч и буфер на одно окно вперёд,
+        поэтому расход памяти не зависит от длины записи.
+    """
+
+    def __init__(self, model, segment_size: int = 12000, batch_size: int = 8,
+                 overlap: float = 0.0, blend: str = 'mean'):
+        if not 0 <= overlap < 1:
+            raise ValueError('overlap must be in [0, 1)')
+        self.model = model
+        self.segment_size = segment_size
+        self.batch_size = batch_size
+        self.step = max(int(round(segment_size * (1 - overlap))), 1)
+        if blend == 'taper':
+            # Вес около нуля у краёв окна и 1 в центре; не ноль, чтобы крайние точки записи тоже учитывались
+            self.weights = np.maximum(np.hanning(segment_size), 1e-3).astype(np.float32)
+        elif blend == 'mean':
+            self.weights = np.ones(segment_size, dtype=np.float32)
+        else:
+            raise ValueError(f'Unknown blend mode {blend}')
+        self.stats = {}
+
+    def window_starts(self, n_samples: int) -> np.ndarray:
+        if n_samples <= self.segment_size:
+            return np.zeros(1, dtype=np.int64)
+        starts = np.arange(0, n_samples - self.segment_size + 1, self.step)
+        if starts[-1] + self.segment_size < n_samples:
+            starts = np.append(starts, n_samples - self.segment_size)
+        return starts
+
+    def _batches(self, signals: np.ndarray, scaler, starts: np.ndarray) -> Iterator[tuple]:
+        n_channels, n_samples = signals.shape
+        batch = np.zeros((self.batch_size, self.segment_size, n_channels), dtype=np.float32)
+        for first in range(0, len(starts), self.batch_size):
+            batch_starts = starts[first:first + self.batch_size]
+            for i, start in enumerate(batch_starts):
+                window = signals[:, start:start + self.segment_size].T
+                # Нормированное окно пишется прямо в батч; запись короче окна
+                # дополняется нулями (после нормировки это среднее)
+                scaler.transform(window, start, out=batch[i, :len(window)])
+                batch[i, len(window):] = 0
+            yield batch_starts, batch[:len(batch_starts)]
+
+    # predict возвращает класс int8 для каждой точки signals (n_channels, n_samples);
+    # scaler (StreamingScaler) нормирует каждое окно перед подачей в модель
+    def predict(self, signals: np.ndarray, scaler) -> np.ndarray:
+        n_samples = signals.shape[1]
+        classes = np.zeros(n_samples, dtype=np.int8)
+        if n_samples == 0:
+            return classes
+        starts = self.window_starts(n_samples)
+
+        # Буфер взвешенных сумм вероятностей для точек [buffer_start, buffer_start + segment_size).
+        # Сумма весов в точке положительна и одна на все классы, поэтому argmax суммы
+        # совпадает с argmax среднего и делить на неё не нужно
+        buffer_start = 0
+        probabilities = None
+
+        start_time = time.perf_counter()
+        for batch_starts, batch in self._batches(signals, scaler, starts):
+            predictions = np.asarray(self.model.predict(batch, verbose=0), dtype=np.float32)
+            if probabilities is None:
+                probabilities = np.zeros((self.segment_size, predictions.shape[2]), dtype=np.float32)
+
+            for start, window_probabilities in zip(batch_starts, predictions):
+                # Точки левее начала нового окна больше ни одним окном не накроются
+                done = min(start - buffer_start, self.segment_size)
+                if done > 0:
+                    self._flush(classes, buffer_start, probabilities[:done])
+                    probabilities[:-done] = probabilities[done:]
+                    probabilities[-done:] = 0
+                    buffer_start = start
+                probabilities += window_probabilities * self.weights[:, None]
+
+        self._flush(classes, buffer_start, probabilities)
+
+        elapsed = time.perf_counter() - start_time
+        self.stats = {
+            'samples': n_samples,
+            'windows': len(starts),
+            'batch_size': self.batch_size,
+            'seconds': elapsed,
+            'samples_per_second': n_samples / elapsed if elapsed > 0 else None,
+        }
+        return classes
+
+    @staticmethod
+    def _flush(classes: np.ndarray, start: int, probabilities: np.ndarray) -> None:
+        stop = min(start + len(probabilities), len(classes))
+        if stop > start:
+            classes[start:stop] = np.argmax(probabilities[:stop - start], axis=1)
+
+
+# benchmark_batch_sizes прогоняет разметку для каждого размера батча и возвращает
+# пропускную способность (точек в секунду) и пик выделенной numpy памяти
+def benchmark_batch_sizes(model, signals: np.ndarray, scaler,
+                          batch_sizes=(1, 4, 8, 16, 32), overlap: float = 0.0,
+                          segment_size: int = 12000) -> list:
+    import tracemalloc
+
+    results = []
+    for batch_size in batch_sizes:
+        engine = InferenceEngine(model, segment_size=segment_size, batch_size=batch_size, overlap=overlap)
+        tracemalloc.start()
+        engine.predict(signals, scaler)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({**engine.stats, 'peak_memory_mb': peak / 1024 ** 2})
+    return results
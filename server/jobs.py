@@ -0,0 +1,344 @@
+import os
+import threading
+import time
+import uuid
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Optional
+
+from visual.visual import plot_channel
+from visual.pyramid import build_pyramid, clear_cache as clear_pyramid_cache
+from .ai import get_marked_edf, get_marked_edf_file, model_registry, recording_directory, STATIC_DIRECTORY
+from .cache import ResultCache
+from .artifacts import write_artifact
+from . import metrics
+
+# Число процессов, которые одновременно гоняют пайплайн, и предел очереди ожидающих задач
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "16"))
+# Сколько секунд хранить завершённые задачи
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+
+CHANNELS = [("FrL", 0), ("FrR", 1), ("OcR", 2)]
+
+
+# Всё, что ниже до JobManager, выполняется внутри процессов-воркеров
+_progress_queue = None
+
+
+def _init_worker(progress_queue, model_path: str) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+    if progress_queue is not None:
+        # Замеры этапов уходят в основной процесс, там их отдаёт /metrics
+        metrics.set_sink(lambda record: progress_queue.put(("metrics", metrics.current_trace_id(), record)))
+    # Исключение в initializer ломает весь пул, поэтому ошибку загрузки откладываем до задачи
+    try:
+        model_registry.load(model_path)
+    except Exception as e:
+        metrics.log_event("model_warmup_failed", path=model_path, error=repr(e))
+
+
+def _report(job_id: str, stage: str, progress: float) -> None:
+    if _progress_queue is not None:
+        _progress_queue.put(("progress", job_id, (stage, progress)))
+
+
+def _warm_worker(model_path: str) -> dict:
+    model_registry.ensure(model_path)
+    return {"pid": os.getpid(), **model_registry.stats()}
+
+
+def _write_plot(recording, channel_name: str, channel_index: int, path: str) -> None:
+    write_artifact(path, plot_channel(recording, channel_name, channel_index))
+
+
+def run_pipeline(job_id: str, tmp_filename: str, hash: str, model_path: str,
+                 directory: str = STATIC_DIRECTORY, trace_id: Optional[str] = None,
+                 filename: Optional[str] = None, events_db: Optional[str] = None, offline: bool = False) -> dict:
+    with metrics.tracing(trace_id or job_id):
+        metrics.log_event("job_started", job=job_id, file=tmp_filename)
+        return _run_pipeline(job_id, tmp_filename, hash, model_path, directory, filename, events_db, offline)
+
+
+# offline - разметка без сервера (server.batch): edf собирается сразу,
+# а в манифесте пути к артефактам относительно directory вместо ссылок сервера
+def _run_pipeline(job_id: str, tmp_filename: str, hash: str, model_path: str, directory: str,
+                  filename: Optional[str] = None, events_db: Optional[str] = None, offline: bool = False) -> dict:
+    _report(job_id, "started", 0.0)
+    model_registry.ensure(model_path)
+    progress = lambda stage, fraction: _report(job_id, stage, fraction)
+
+    static = "" if offline else "static/"
+    resp = {
+        "file": f"{hash}_marked.edf" if offline else f"recordings/{hash}/edf",
+        "recording": f"{static}{hash}_rec/header.json",
+        "word": f"{static}{hash}.docx",
+    }
+    # Пирамида и графики каналов идут одновременно с остальными этапами после разметки
+    stages = {"build_pyramid": lambda recording: build_pyramid(recording, recording_directory(hash, directory))}
+    for channel_name, channel_index in CHANNELS:
+        name = channel_name.lower()
+        stages[f"plot_channel {channel_name}"] = partial(_write_plot, channel_name=channel_name, channel_index=channel_index,
+                                                 path=f"{directory}/{hash}_{name}.json")
+        resp[name] = f"{static}{hash}_{name}.json"
+
+    start = time.perf_counter()
+    _, recording = get_marked_edf(tmp_filename, hash, progress=progress, stages=stages, directory=directory,
+                                  filename=filename, events_db=events_db, eager_edf=offline or None)
+
+    # Манифест пишется последним: его наличие означает, что все артефакты готовы
+    ResultCache(directory).store(hash, resp)
+    return {
+        "result": resp,
+        "model": {"pid": os.getpid(), **model_registry.stats()},
+        "samples": recording.n_samples,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class Job:
+    def __init__(self, filename: str, hash: str, trace_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.trace_id = trace_id or self.id
+        self.filename = filename
+        self.hash = hash
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "trace_id": self.trace_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobManager:
+    """
+        Очередь задач /upload. Тяжёлый пайплайн (MNE, TF, EDF, docx, Plotly)
+        идёт в пуле процессов, а event loop только принимает файлы и отдаёт статусы.
+        Воркеры шлют прогресс через multiprocessing.Queue, его разбирает отдельный поток.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_pending: int = MAX_PENDING_JOBS):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.model_path = model_registry.path
+        self.jobs = {}
+        self.worker_stats = {}
+        self.cache = ResultCache(STATIC_DIRECTORY)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._progress_queue = None
+        self._progress_thread = None
+
+    def start(self) -> None:
+        # spawn, а не fork: TensorFlow плохо переживает fork, а главному процессу он не нужен
+        self._progress_queue = mp.get_context("spawn").Queue()
+        self._executor = self._create_executor()
+        self._progress_thread = threading.Thread(target=self._drain_progress, daemon=True)
+        self._progress_thread.start()
+        self.warm()
+        self._evict()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._progress_queue, self.model_path),
+        )
+
+    # _restart пересоздаёт пул, если воркер умер (OOM, падение TF): такой пул (BrokenProcessPool)
+    # больше не принимает задачи. broken - сломанный пул; если его уже заменили, ничего не делается
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._create_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        metrics.log_event("pool_restarted", workers=self.max_workers)
+        self.warm()
+
+    # _submit отправляет задачу в пул, при сломанном пуле пересоздаёт его и повторяет один раз.
+    # Возвращает future и пул, в котором она выполняется
+    def _submit(self, fn, *args, **kwargs):
+        executor = self._executor
+        try:
+            return executor.submit(fn, *args, **kwargs), executor
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            return executor.submit(fn, *args, **kwargs), executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._progress_queue.put(None)
+
+    def warm(self, model_path: Optional[str] = None) -> None:
+        # Поднимаем воркеры сразу, чтобы модель грузилась при старте, а не на первой загрузке
+        if model_path is not None:
+            self.model_path = model_path
+        for _ in range(self.max_workers):
+            future, _ = self._submit(_warm_worker, self.model_path)
+            future.add_done_callback(self._on_warm)
+
+    def _on_warm(self, future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            stats = future.result()
+            with self._lock:
+                self.worker_stats[stats["pid"]] = stats
+
+    def submit(self, tmp_filename: str, filename: str, hash: str, trace_id: Optional[str] = None) -> Job:
+        job = Job(filename, hash, trace_id)
+        with self._lock:
+            self._purge()
+            if self.pending() >= self.max_pending:
+                raise QueueFull()
+            self.jobs[job.id] = job
+        try:
+            future, executor = self._submit(run_pipeline, job.id, tmp_filename, hash, self.model_path,
+                                            trace_id=job.trace_id, filename=filename)
+        except BaseException:
+            with self._lock:
+                del self.jobs[job.id]
+            raise
+        future.add_done_callback(lambda f: self._on_done(job, f, executor))
+        return job
+
+    # export_edf собирает размеченный edf записи hash в пуле воркеров (тяжёлая работа не идёт в event loop).
+    # Возвращает Future с путём к файлу
+    def export_edf(self, hash: str):
+        future, executor = self._submit(get_marked_edf_file, hash)
+        future.add_done_callback(lambda f: self._on_broken(f, executor))
+        return future
+
+    # _on_broken пересоздаёт пул, если задача упала из-за гибели воркера
+    def _on_broken(self, future, executor: ProcessPoolExecutor) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._restart(executor)
+
+    # add_cached регистрирует уже готовый результат как завершённую задачу
+    def add_cached(self, filename: str, hash: str, result: dict, trace_id: Optional[str] = None) -> Job:
+        job = Job(filename, hash, trace_id)
+        job.status = "done"
+        job.stage = "cached"
+        job.progress = 1.0
+        job.started_at = job.finished_at = job.created_at
+        job.result = result
+        with self._lock:
+            self._purge()
+            self.jobs[job.id] = job
+        return job
+
+    # find_active возвращает задачу, которая уже обрабатывает тот же файл
+    def find_active(self, hash: str) -> Optional[Job]:
+        with self._lock:
+            for job in self.jobs.values():
+                if job.hash == hash and job.status in ("queued", "running"):
+                    return job
+        return None
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def pending(self) -> int:
+        return sum(job.status in ("queued", "running") for job in self.jobs.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "done": statuses.count("done"),
+            "failed": statuses.count("failed"),
+        }
+
+    def _on_done(self, job: Job, future, executor: Optional[ProcessPoolExecutor] = None) -> None:
+        with self._lock:
+            job.finished_at = time.time()
+            # Задачи, которые были в пуле, когда умер воркер, завершаются с BrokenProcessPool
+            error = future.exception() if not future.cancelled() else RuntimeError("Job cancelled")
+            if error is not None:
+                job.status = "failed"
+                job.error = repr(error)
+            else:
+                output = future.result()
+                job.status = "done"
+                job.stage = "done"
+                job.progress = 1.0
+                job.result = output["result"]
+                self.worker_stats[output["model"]["pid"]] = output["model"]
+            active = {other.hash for other in self.jobs.values() if other.status in ("queued", "running")}
+        metrics.JOBS.inc(job.status)
+        metrics.JOB_SECONDS.observe(job.finished_at - job.created_at)
+        with metrics.tracing(job.trace_id):
+            metrics.log_event("job_finished", job=job.id, status=job.status, error=job.error,
+                              seconds=job.finished_at - job.created_at)
+        if job.status == "done":
+            self._evict(protected=active)
+        elif executor is not None and isinstance(error, BrokenProcessPool):
+            self._restart(executor)
+
+    # _evict чистит кэш результатов; memmap удалённых записей, открытые /signal, закрываются
+    def _evict(self, protected=()) -> None:
+        if self.cache.evict(protected=protected):
+            clear_pyramid_cache()
+
+    def _drain_progress(self) -> None:
+        while True:
+            event = self._progress_queue.get()
+            if event is None:
+                return
+            kind, job_id, payload = event
+            if kind == "metrics":
+                metrics.observe(payload)
+                continue
+            stage, progress = payload
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is None or job.status in ("done", "failed"):
+                    continue
+                if job.status == "queued":
+                    job.status = "running"
+                    job.started_at = time.time()
+                job.stage = stage
+                job.progress = progress
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at is not None and now - job.finished_at > JOB_TTL
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+job_manager = JobManager()
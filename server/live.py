@@ -0,0 +1,151 @@
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .ai import model_registry, SEGMENT_SIZE, NORMALIZATION, NORMALIZATION_BLOCK
+from .jobs import _init_worker
+from .scaler import StreamingScaler
+
+# Разметка живого сигнала: шаг между окнами в точках (меньше SEGMENT_SIZE - меньше задержка,
+# но у новых точек меньше контекста справа) и число процессов с моделью для живых сессий
+LIVE_HOP = int(os.getenv("LIVE_HOP", str(SEGMENT_SIZE)))
+LIVE_WORKERS = int(os.getenv("LIVE_WORKERS", "1"))
+
+CLASS_NAMES = {1: "swd", 2: "is", 3: "ds"}
+
+
+class LiveSession:
+    """
+        Потоковая разметка сигнала, который приходит блоками (n, n_channels) по мере записи.
+        Хранит только последние segment_size точек, статистики нормировки копит потоково
+        (StreamingScaler) по всему, что уже пришло. Как только набирается очередное окно
+        (каждые hop точек), feed отдаёт его нормированным для модели, а commit по классам
+        окна выдаёт события начала и конца аномалий.
+    """
+
+    def __init__(self, n_channels: int = 3, k: int = 1, segment_size: int = SEGMENT_SIZE,
+                 hop: int = LIVE_HOP, sampling_frequency: int = 400,
+                 mode: str = NORMALIZATION, block_size: int = NORMALIZATION_BLOCK):
+        if not 0 < hop <= segment_size:
+            raise ValueError("hop must be in (0, segment_size]")
+        if not 0 < k <= n_channels:
+            raise ValueError(f"channels must be at least {k}, got {n_channels}")
+        self.n_channels = n_channels
+        self.k = k
+        self.segment_size = segment_size
+        self.hop = hop
+        self.sampling_frequency = sampling_frequency
+        self.scaler = StreamingScaler(k, mode, block_size)
+        self.received = 0
+        # Размечено всё до classified; следующее окно заканчивается на точке due
+        self.classified = 0
+        self.due = segment_size
+        # Последние точки сигнала: buffer[i] - точка buffer_start + i
+        self._buffer = np.zeros((0, k), dtype=np.float32)
+        self._buffer_start = 0
+        # Текущая аномалия: класс и первая точка
+        self._label = 0
+        self._label_start = 0
+
+    # feed принимает блок (n, n_channels) и возвращает готовые окна [(конец окна, окно (segment_size, k))]
+    def feed(self, block: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+        if block.ndim != 2 or block.shape[1] != self.n_channels:
+            raise ValueError(f"Expected blocks of shape (n, {self.n_channels})")
+        block = block[:, :self.k].astype(np.float32)
+        if self.scaler.mode != "window":
+            self.scaler.partial_fit(block)
+        self._buffer = np.concatenate((self._buffer, block))
+        self.received += len(block)
+
+        windows = []
+        while self.received >= self.due:
+            windows.append((self.due, self._window(self.due)))
+            self.due += self.hop
+        self._trim()
+        return windows
+
+    def _window(self, end: int) -> np.ndarray:
+        start = max(end - self.segment_size, 0)
+        window = np.zeros((self.segment_size, self.k), dtype=np.float32)
+        part = self._buffer[start - self._buffer_start:end - self._buffer_start]
+        # Сигнал короче окна дополняется нулями после нормировки, как в InferenceEngine
+        self.scaler.transform(part, start, out=window[:len(part)])
+        return window
+
+    def _trim(self) -> None:
+        # Хватает и на следующее окно, и на окно хвоста в finish
+        keep_from = max(self.received - self.segment_size, 0)
+        if keep_from > self._buffer_start:
+            self._buffer = self._buffer[keep_from - self._buffer_start:]
+            self._buffer_start = keep_from
+
+    # commit принимает классы (segment_size,) окна, заканчивающегося на end, и возвращает события
+    def commit(self, end: int, labels: np.ndarray) -> List[dict]:
+        start = max(end - self.segment_size, 0)
+        new = labels[self.classified - start:min(end, self.received) - start]
+        events = []
+        # Границы отрезков одного класса внутри новых точек
+        changes = np.flatnonzero(np.diff(np.concatenate(([self._label], new)))) + self.classified
+        for position in changes.tolist():
+            events.extend(self._switch(int(labels[position - start]), position))
+        self.classified += len(new)
+        return events
+
+    # finish возвращает окно, выровненное по концу сигнала, если после последнего окна остались
+    # неразмеченные точки; close размечает их классами этого окна и закрывает открытую аномалию
+    def finish(self) -> Optional[Tuple[int, np.ndarray]]:
+        if self.classified >= self.received:
+            return None
+        return self.received, self._window(self.received)
+
+    def close(self, end: Optional[int] = None, labels: Optional[np.ndarray] = None) -> List[dict]:
+        events = self.commit(end, labels) if labels is not None else []
+        return events + self._switch(0, self.classified)
+
+    def _switch(self, label: int, position: int) -> List[dict]:
+        events = []
+        if self._label:
+            start = self._label_start / self.sampling_frequency
+            end = position / self.sampling_frequency
+            events.append({"event": "end", "type": CLASS_NAMES[self._label], "sample": position,
+                           "time": end, "start_time": start, "duration": end - start})
+        if label:
+            events.append({"event": "start", "type": CLASS_NAMES[label], "sample": position,
+                           "time": position / self.sampling_frequency})
+        self._label, self._label_start = label, position
+        return events
+
+
+_live_pool = None
+
+
+def get_live_pool(model_path: str) -> ProcessPoolExecutor:
+    # Модель живых сессий в отдельных процессах: главному процессу tensorflow не нужен,
+    # а задачи /upload не задерживают разметку живого сигнала
+    global _live_pool
+    if _live_pool is None:
+        _live_pool = ProcessPoolExecutor(max_workers=LIVE_WORKERS, mp_context=mp.get_context("spawn"),
+                                         initializer=_init_worker, initargs=(None, model_path))
+    return _live_pool
+
+
+def shutdown_live_pool() -> None:
+    global _live_pool
+    if _live_pool is not None:
+        _live_pool.shutdown(wait=False, cancel_futures=True)
+        _live_pool = None
+
+
+# classify_windows выполняется в процессе пула: классы (n_windows, segment_size) int8
+def classify_windows(model_path: str, windows: np.ndarray) -> np.ndarray:
+    model = model_registry.ensure(model_path)
+    return np.argmax(model.predict(windows, verbose=0), axis=2).astype(np.int8)
+
+
+# latency_ms - задержка от получения блока, на котором закончилось окно
+def latency_ms(received_at: float) -> float:
+    return round((time.perf_counter() - received_at) * 1000, 1)
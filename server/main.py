@@ -1,10 +1,29 @@
-from fastapi import FastAPI, UploadFile
-import hashlib
-from .ai import get_marked_edf
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
+import asyncio
+import os
+import time
+import numpy as np
+from typing import List, Optional
+from .jobs import job_manager, QueueFull
+from .uploads import (UploadWriter, MultipartUpload, UploadSessions, UploadTooLarge, InvalidEdf,
+                      UPLOAD_MAX_BYTES)
+from .cache import cache_key
+from .artifacts import PrecompressedStaticFiles
+from .events import event_index, EVENT_TYPES
+from .live import LiveSession, get_live_pool, shutdown_live_pool, classify_windows, latency_ms
+from .ai import recording_directory, marked_edf_path, STATIC_DIRECTORY
+from . import metrics
+from fastapi.responses import FileResponse, PlainTextResponse
+from visual.pyramid import query_pyramid
 from fastapi.middleware.cors import CORSMiddleware
-import random
-from visual.visual import plot_channel
+import uuid
+import json
+
+MAX_SIGNAL_PX = 10000
+# Наибольшая страница /events
+MAX_EVENTS_PAGE = 1000
+# Запас на границы и заголовки multipart сверх UPLOAD_MAX_BYTES при проверке Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
 
 app = FastAPI()
 
@@ -17,41 +36,340 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/static", StaticFiles(directory="./server/static"), name="static")
+@app.on_event("startup")
+def start_job_manager():
+    # Воркеры поднимаются и прогревают модель до первого запроса
+    job_manager.start()
+
+
+@app.on_event("shutdown")
+def stop_job_manager():
+    job_manager.shutdown()
+    shutdown_live_pool()
+
+
+# Артефакты отдаются заранее сжатыми (если клиент принимает br/gzip) с ETag и Cache-Control
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIRECTORY), name="static")
+
+upload_sessions = UploadSessions()
+
 
 @app.post("/upload")
-async def create_upload_file(file: UploadFile):
-    edfInput = file.file
-    hash = hashlib.md5(file.filename.encode()+ str(random.randint(0, 100000)).encode()).hexdigest()
-    tmp_filename = f"server/static/{hash}.edf"
-    with open(tmp_filename, "wb") as f:
-        f.write(edfInput.read())
-
-    marked_edf_filename, data = get_marked_edf(tmp_filename, hash)
-
-    print("[DEBUG] Marked edf filename:", marked_edf_filename)
-
-    print("[DEBUG] plotting FrL")
-    frl_json = plot_channel(data, "FrL", 0)
-    with open(f"server/static/{hash}_frl.json", "w") as f:
-        f.write(frl_json)
-
-    print("[DEBUG] plotting FrR")
-    frr_json = plot_channel(data, "FrR", 1)
-    with open(f"server/static/{hash}_frr.json", "w") as f:
-        f.write(frr_json)
-    
-    print("[DEBUG] plotting OcR")
-    ocr_json = plot_channel(data, "OcR", 2)
-    with open(f"server/static/{hash}_ocr.json", "w") as f:
-        f.write(ocr_json)
-
-    resp = {
-        "file": marked_edf_filename,
-        "word": f"static/{hash}.docx",
-        "frl": f"static/{hash}_frl.json",
-        "frr": f"static/{hash}_frr.json",
-        "ocr": f"static/{hash}_ocr.json"
+async def create_upload_file(request: Request, response: Response, filename: Optional[str] = None,
+                             x_request_id: Optional[str] = Header(None)):
+    # trace id запроса попадает в логи всех этапов задачи; берётся из X-Request-ID, если он есть
+    trace_id = x_request_id or uuid.uuid4().hex
+    response.headers["X-Trace-Id"] = trace_id
+    with metrics.tracing(trace_id):
+        return await _upload(request, filename, trace_id)
+
+
+async def _upload(request: Request, filename: Optional[str], trace_id: str) -> dict:
+    # Тело читается потоком: multipart/form-data с полем file или сам файл (application/octet-stream,
+    # имя в ?filename=). Куски сразу пишутся на диск и хэшируются, заголовок edf проверяется
+    # по первым байтам, а слишком большой по Content-Length запрос отклоняется до чтения тела
+    content_type = request.headers.get("content-type", "")
+    multipart = content_type.startswith("multipart/form-data")
+    length = request.headers.get("content-length")
+    if length is not None:
+        try:
+            length = int(length)
+        except ValueError:
+            metrics.UPLOADS.inc("invalid")
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if length is not None and length > UPLOAD_MAX_BYTES + (MULTIPART_OVERHEAD if multipart else 0):
+        metrics.UPLOADS.inc("too_large")
+        raise HTTPException(status_code=413, detail=f"File is larger than {UPLOAD_MAX_BYTES} bytes")
+
+    writer = UploadWriter(f"{STATIC_DIRECTORY}/upload_{uuid.uuid4().hex}.part")
+    try:
+        if multipart:
+            form = MultipartUpload(content_type, writer)
+            async for chunk in request.stream():
+                form.feed(chunk)
+            form.finalize()
+            filename = form.filename or filename
+        else:
+            async for chunk in request.stream():
+                writer.write(chunk)
+        digest = writer.finish()
+    except (UploadTooLarge, InvalidEdf) as e:
+        writer.discard()
+        raise _upload_error(e)
+    except BaseException:
+        writer.discard()
+        raise
+    return _submit_upload(writer.path, filename, digest, writer.size, trace_id)
+
+
+def _upload_error(error: Exception) -> HTTPException:
+    if isinstance(error, UploadTooLarge):
+        metrics.UPLOADS.inc("too_large")
+        return HTTPException(status_code=413, detail=str(error))
+    metrics.UPLOADS.inc("invalid")
+    return HTTPException(status_code=422, detail=str(error))
+
+
+# _submit_upload ставит полностью принятый файл в очередь; имя артефактов - хэш содержимого и версии модели
+def _submit_upload(tmp_filename: str, filename: Optional[str], digest: str, size: int, trace_id: str) -> dict:
+    hash = cache_key(digest, job_manager.model_path)
+    metrics.UPLOAD_BYTES.inc(amount=size)
+    metrics.log_event("upload", filename=filename, bytes=size, hash=hash)
+
+    # Тот же файл уже обработан или обрабатывается прямо сейчас
+    result = job_manager.cache.lookup(hash)
+    if result is not None:
+        os.remove(tmp_filename)
+        metrics.UPLOADS.inc("cached")
+        job = job_manager.add_cached(filename, hash, result, trace_id)
+        return {"job": job.id, "status": job.status, "result": job.result}
+    job = job_manager.find_active(hash)
+    if job is not None:
+        os.remove(tmp_filename)
+        metrics.UPLOADS.inc("joined")
+        return {"job": job.id, "status": job.status}
+
+    edf_filename = f"{STATIC_DIRECTORY}/{hash}.edf"
+    os.replace(tmp_filename, edf_filename)
+    try:
+        job = job_manager.submit(edf_filename, filename, hash, trace_id)
+    except QueueFull:
+        os.remove(edf_filename)
+        metrics.UPLOADS.inc("rejected")
+        raise HTTPException(status_code=503, detail="Too many pending jobs, try again later")
+
+    metrics.UPLOADS.inc("queued")
+    return {"job": job.id, "status": job.status}
+
+
+# Докачиваемая загрузка больших записей:
+#   POST /uploads?filename=&size=        -> {"upload": id, "offset": 0}
+#   PATCH /uploads/{id} (Upload-Offset)  -> тело - следующая часть файла, ответ - новое смещение
+#   GET /uploads/{id}                    -> текущее смещение, с него продолжается оборванная часть
+#   POST /uploads/{id}/complete          -> то же, что ответ /upload
+@app.post("/uploads")
+def create_upload_session(filename: Optional[str] = None, size: Optional[int] = None):
+    try:
+        return upload_sessions.create(filename, size).to_dict()
+    except UploadTooLarge as e:
+        raise _upload_error(e)
+
+
+def _get_upload_session(upload_id: str):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@app.get("/uploads/{upload_id}")
+def upload_session_status(upload_id: str):
+    return _get_upload_session(upload_id).to_dict()
+
+
+@app.patch("/uploads/{upload_id}")
+async def append_upload(upload_id: str, request: Request, upload_offset: int = Header(...)):
+    session = _get_upload_session(upload_id)
+    if session.busy or upload_offset != session.offset:
+        raise HTTPException(status_code=409, detail=f"Upload is at offset {session.offset}",
+                            headers={"Upload-Offset": str(session.offset)})
+    session.busy = True
+    try:
+        # Принятые байты остаются в файле и при обрыве запроса - клиент продолжает с нового смещения
+        async for chunk in request.stream():
+            session.writer.write(chunk)
+    except (UploadTooLarge, InvalidEdf) as e:
+        upload_sessions.pop(upload_id)
+        session.writer.discard()
+        raise _upload_error(e)
+    finally:
+        session.busy = False
+    return session.to_dict()
+
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, response: Response, x_request_id: Optional[str] = Header(None)):
+    session = _get_upload_session(upload_id)
+    if session.busy or (session.size is not None and session.offset != session.size):
+        raise HTTPException(status_code=409, detail=f"Upload is at offset {session.offset} of {session.size}")
+    upload_sessions.pop(upload_id)
+    trace_id = x_request_id or uuid.uuid4().hex
+    response.headers["X-Trace-Id"] = trace_id
+    with metrics.tracing(trace_id):
+        try:
+            digest = session.writer.finish()
+        except InvalidEdf as e:
+            session.writer.discard()
+            raise _upload_error(e)
+        return _submit_upload(session.writer.path, session.filename, digest, session.offset, trace_id)
+
+
+@app.delete("/uploads/{upload_id}")
+def cancel_upload(upload_id: str):
+    session = upload_sessions.pop(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    session.writer.discard()
+    return {"upload": upload_id, "status": "cancelled"}
+
+
+# Разметка живого сигнала. Клиент шлёт блоки точек по мере записи: бинарные сообщения -
+# float32 little-endian (n, channels) построчно, или текст {"samples": [[канал 0], [канал 1], ...]}.
+# Сервер отвечает json событиями {"event": "start"|"end", "type": "swd"|"is"|"ds", "time": сек, ...}
+# и {"event": "window", "end": точка, "latency_ms": ...} после каждого размеченного окна.
+# Текст {"command": "finish"} размечает хвост, закрывает открытую аномалию и завершает сессию
+@app.websocket("/live")
+async def live_stream(websocket: WebSocket, channels: int = 3):
+    await websocket.accept()
+    # Число каналов из запроса проверяется до первого блока (channels=0 иначе ломает разбор блоков)
+    try:
+        session = LiveSession(n_channels=channels)
+    except ValueError as e:
+        await websocket.send_json({"event": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+        return
+    model_path = job_manager.model_path
+    pool = get_live_pool(model_path)
+    loop = asyncio.get_running_loop()
+
+    async def classify(windows, received_at):
+        labels = await loop.run_in_executor(pool, classify_windows, model_path, np.stack([w for _, w in windows]))
+        for (end, _), window_labels in zip(windows, labels):
+            for event in session.commit(end, window_labels):
+                await websocket.send_json({**event, "latency_ms": latency_ms(received_at)})
+            await websocket.send_json({"event": "window", "end": end, "latency_ms": latency_ms(received_at)})
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            received_at = time.perf_counter()
+            if message.get("bytes") is not None:
+                if len(message["bytes"]) % (4 * channels):
+                    raise ValueError(f"Block is not a whole number of float32 samples of {channels} channels")
+                block = np.frombuffer(message["bytes"], dtype="<f4").reshape(-1, channels)
+            else:
+                data = json.loads(message["text"])
+                if not isinstance(data, dict):
+                    raise ValueError("Text message must be a JSON object")
+                if data.get("command") == "finish":
+                    break
+                block = np.asarray(data["samples"], dtype=np.float32).T
+            windows = session.feed(block)
+            if windows:
+                await classify(windows, received_at)
+
+        received_at = time.perf_counter()
+        end, labels = None, None
+        tail = session.finish()
+        if tail is not None:
+            end, window = tail
+            labels = (await loop.run_in_executor(pool, classify_windows, model_path, window[None]))[0]
+        for event in session.close(end, labels):
+            await websocket.send_json({**event, "latency_ms": latency_ms(received_at)})
+        await websocket.send_json({"event": "done", "samples": session.received})
+        await websocket.close()
+    except WebSocketDisconnect:
+        return
+    except (ValueError, KeyError, json.JSONDecodeError) as e:
+        await websocket.send_json({"event": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+
+
+@app.get("/metrics")
+def get_metrics():
+    # Замеры этапов (время, CPU, прирост пикового RSS), задачи и загрузки в формате Prometheus
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/signal/{hash}/{channel}")
+def signal_window(hash: str, channel: str, t0: float = 0.0, t1: Optional[float] = None, px: int = 1000):
+    # Точки канала для видимого окна [t0, t1) секунд при ширине графика px пикселей
+    directory = recording_directory(hash)
+    if not os.path.isfile(os.path.join(directory, "pyramid.json")):
+        raise HTTPException(status_code=404, detail="Recording not found")
+    try:
+        return query_pyramid(directory, channel, t0, t1, min(px, MAX_SIGNAL_PX))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Channel {channel} not found")
+
+
+@app.get("/recordings/{hash}/edf")
+async def recording_edf(hash: str):
+    # edf собирается из бинарного формата при первом скачивании - в пуле воркеров, не в процессе API
+    if not os.path.isfile(os.path.join(recording_directory(hash), "header.json")):
+        raise HTTPException(status_code=404, detail="Recording not found")
+    path = marked_edf_path(hash)
+    if not os.path.isfile(path):
+        path = await asyncio.wrap_future(job_manager.export_edf(hash))
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{hash}_marked.edf")
+
+
+@app.get("/recordings/{hash}/summary")
+def recording_summary(hash: str):
+    # Сводка по аномалиям записи из индекса событий, без чтения артефактов
+    summary = event_index.recording_summary(hash)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return summary
+
+
+@app.get("/events")
+def events(type: Optional[List[str]] = Query(None), hash: Optional[str] = None,
+           min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+           since: Optional[float] = None, until: Optional[float] = None, min_peak: Optional[float] = None,
+           min_frequency: Optional[float] = None, max_frequency: Optional[float] = None,
+           limit: int = 100, offset: int = 0):
+    # События всех записей по фильтрам (type можно повторять, since/until - unix время обработки,
+    # min/max_frequency - доминантная частота) и сводка по типам для тех же фильтров
+    unknown = set(type or []) - set(EVENT_TYPES.values())
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown event types: {', '.join(sorted(unknown))}")
+    filters = {"types": type, "hash": hash, "min_duration": min_duration, "max_duration": max_duration,
+               "since": since, "until": until, "min_peak": min_peak,
+               "min_frequency": min_frequency, "max_frequency": max_frequency}
+    limit = max(0, min(limit, MAX_EVENTS_PAGE))
+    return {
+        "summary": event_index.summary(**filters),
+        "limit": limit,
+        "offset": max(offset, 0),
+        "events": event_index.events(limit=limit, offset=max(offset, 0), **filters),
     }
 
-    return resp
+
+@app.get("/jobs")
+def jobs_info():
+    return job_manager.stats()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/progress")
+def job_progress(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": job.status, "stage": job.stage, "progress": job.progress}
+
+
+@app.get("/model")
+def model_info():
+    return {"path": job_manager.model_path, "workers": job_manager.worker_stats}
+
+
+@app.post("/model/reload")
+def reload_model():
+    # Перечитывает текущий файл модели (MODEL_PATH), если он изменился на диске.
+    # Путь не принимается из запроса: эндпоинт открыт, а загрузка модели десериализует файл
+    path = job_manager.model_path
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Model file not found")
+    job_manager.warm()
+    return {"path": path}
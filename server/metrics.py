@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import resource
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional, Sequence
+
+# Замеры этапов пайплайна. При METRICS_ENABLED=0 stage() возвращает общий пустой
+# контекстный менеджер, так что выключенные замеры стоят один вызов функции
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(1024 ** 2 * 4 ** i for i in range(7))
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+# В процессах-воркерах замеры дополнительно отправляются в основной процесс через _sink
+_sink = None
+
+
+def _format_labels(names: Sequence[str], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # {метки: [счётчики по корзинам..., сумма, количество]}
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            series = self.values.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self.values.items()):
+                bounds = [*self.buckets, "+Inf"]
+                for bound, count in zip(bounds, series[:len(self.buckets)] + [series[-1]]):
+                    bucket_labels = _format_labels(self.labels, labels, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        self.metrics.append(Counter(*args, **kwargs))
+        return self.metrics[-1]
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        self.metrics.append(Histogram(*args, **kwargs))
+        return self.metrics[-1]
+
+    # render - текстовый формат Prometheus
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("pipeline_stage_seconds", "Wall time of a pipeline stage", ("stage",))
+STAGE_CPU_SECONDS = REGISTRY.histogram("pipeline_stage_cpu_seconds", "Process CPU time during a pipeline stage",
+                                       ("stage",))
+STAGE_PEAK_MEMORY = REGISTRY.histogram("pipeline_stage_peak_memory_bytes",
+                                       "Growth of the process peak RSS during a pipeline stage",
+                                       ("stage",), buckets=BYTES_BUCKETS)
+STAGE_ERRORS = REGISTRY.counter("pipeline_stage_errors_total", "Pipeline stages that raised", ("stage",))
+JOBS = REGISTRY.counter("pipeline_jobs_total", "Finished upload jobs", ("status",))
+JOB_SECONDS = REGISTRY.histogram("pipeline_job_seconds", "Time from upload to finished job")
+UPLOADS = REGISTRY.counter("uploads_total", "Uploaded files by outcome", ("outcome",))
+UPLOAD_BYTES = REGISTRY.counter("upload_bytes_total", "Bytes received by /upload")
+
+
+def _peak_rss() -> int:
+    # ru_maxrss в Linux - килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# observe учитывает замер этапа в REGISTRY (в том числе пришедший из воркера)
+def observe(record: dict) -> None:
+    STAGE_SECONDS.observe(record["wall_s"], record["stage"])
+    STAGE_CPU_SECONDS.observe(record["cpu_s"], record["stage"])
+    STAGE_PEAK_MEMORY.observe(record["peak_memory_bytes"], record["stage"])
+    if record.get("error"):
+        STAGE_ERRORS.inc(record["stage"])
+
+
+# log_event пишет структурированную строку лога (json) с trace id текущего запроса
+def log_event(event: str, **fields) -> None:
+    if METRICS_ENABLED:
+        print(json.dumps({"ts": round(time.time(), 3), "event": event, "trace_id": _trace_id.get(), **fields}))
+
+
+class _Stage:
+    __slots__ = ("name", "wall", "cpu", "peak")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.peak = _peak_rss()
+        # CPU всего процесса: учитываются потоки BLAS/TF, но у одновременных этапов время пересекается
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record = {
+            "stage": self.name,
+            "wall_s": time.perf_counter() - self.wall,
+            "cpu_s": time.process_time() - self.cpu,
+            "peak_memory_bytes": max(_peak_rss() - self.peak, 0),
+            "error": exc_type.__name__ if exc_type else None,
+        }
+        observe(record)
+        if _sink is not None:
+            _sink(record)
+        log_event("stage", **record)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+# stage(name) - контекстный менеджер замера этапа: время, CPU и прирост пикового RSS
+def stage(name: str):
+    return _Stage(name) if METRICS_ENABLED else _NOOP
+
+
+# tracing(trace_id) привязывает trace id к текущему контексту (и к этапам, запущенным из него)
+@contextmanager
+def tracing(trace_id: Optional[str]):
+    token = _trace_id.set(trace_id)
+    try:
+        yield
+    finally:
+        _trace_id.reset(token)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def set_sink(sink: Optional[Callable]) -> None:
+    global _sink
+    _sink = sink
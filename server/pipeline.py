@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import contextvars
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from parser.parser import Recording, open_edf, read_signals, read_labels
+from .scaler import StreamingScaler
+from . import metrics
+
+# Сколько этапов после разметки (бинарный формат, docx, edf, пирамида, графики) идёт одновременно
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "4"))
+# Сколько процессов читают одну запись по частям (1 - читать в текущем процессе)
+# и длина части в точках (час при 400Гц)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "1"))
+PARSE_SHARD_SIZE = int(os.getenv("PARSE_SHARD_SIZE", str(400 * 3600)))
+
+
+# run_stages выполняет независимые этапы одновременно в пуле потоков.
+# Этапы - функции без аргументов; результат - словари {имя: результат} и {имя: секунды}.
+# Ошибка этапа пробрасывается только после завершения остальных, чтобы ни один
+# этап не продолжал писать файлы, когда задача уже считается упавшей.
+# progress(stage, fraction) вызывается по мере завершения этапов в диапазоне [start, end]
+def run_stages(stages: Dict[str, Callable], progress: Optional[Callable] = None,
+               start: float = 0.0, end: float = 1.0,
+               max_workers: int = STAGE_WORKERS) -> Tuple[dict, dict]:
+    progress = progress or (lambda stage, fraction: None)
+    results, timings, errors = {}, {}, []
+
+    def timed(name, stage):
+        stage_start = time.perf_counter()
+        try:
+            with metrics.stage(name):
+                return stage()
+        finally:
+            timings[name] = time.perf_counter() - stage_start
+
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(stages)), 1)) as executor:
+        # Каждый этап в копии текущего контекста, чтобы в потоке был виден trace id задачи
+        futures = {executor.submit(contextvars.copy_context().run, timed, name, stage): name
+                   for name, stage in stages.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors.append(e)
+                metrics.log_event("stage_failed", stage=name, error=repr(e))
+            progress(name, start + (end - start) * done / len(stages))
+
+    metrics.log_event("stages", seconds={name: round(seconds, 3) for name, seconds in timings.items()})
+    if errors:
+        raise errors[0]
+    return results, timings
+
+
+_shard_pool = None
+
+
+def _get_shard_pool(workers: int) -> ProcessPoolExecutor:
+    global _shard_pool
+    if _shard_pool is None:
+        _shard_pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+    return _shard_pool
+
+
+def _read_shard(file_path: str, start: int, stop: int, scaler_args: tuple) -> tuple:
+    signals = read_signals(file_path, start, stop)
+    scaler = StreamingScaler(*scaler_args)
+    scaler.partial_fit(signals[:scaler.n_channels].T)
+    return start, signals, scaler
+
+
+# read_recording_sharded читает запись частями по shard_size точек в workers процессах;
+# каждый процесс сразу считает статистики нормировки своей части (StreamingScaler(*scaler_args)),
+# они сливаются по порядку записи. Возвращает Recording и готовый StreamingScaler
+def read_recording_sharded(file_path: str, scaler_args: tuple, max_samples: Optional[int] = None,
+                           workers: int = PARSE_WORKERS,
+                           shard_size: int = PARSE_SHARD_SIZE) -> Tuple[Recording, StreamingScaler]:
+    edf = open_edf(file_path)
+    n_samples = edf.n_times
+    if max_samples is not None:
+        n_samples = min(n_samples, max_samples)
+
+    scaler = StreamingScaler(*scaler_args)
+    if scaler.mode == 'rolling':
+        # Блоки статистик не должны разрезаться границами частей
+        shard_size = -(-shard_size // scaler.block_size) * scaler.block_size
+
+    signals = np.empty((len(edf.ch_names), n_samples), dtype=np.float32)
+    shard_scalers = {}
+    pool = _get_shard_pool(workers)
+    futures = [pool.submit(_read_shard, file_path, start, min(start + shard_size, n_samples), scaler_args)
+               for start in range(0, n_samples, shard_size)]
+    for future in as_completed(futures):
+        start, shard, shard_scaler = future.result()
+        signals[:, start:start + shard.shape[1]] = shard
+        shard_scalers[start] = shard_scaler
+    for start in sorted(shard_scalers):
+        scaler.merge(shard_scalers[start])
+
+    recording = Recording(signals, read_labels(edf, n_samples), int(edf.info['sfreq']), edf.ch_names)
+    return recording, scaler
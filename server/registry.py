@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from . import metrics
+
+
+class ModelRegistry:
+    """
+        Держит одну загруженную и прогретую модель на процесс.
+        Модель можно подменить новым файлом (.keras или .npz) без перезапуска сервера:
+        новая модель грузится и прогревается в стороне, а затем ссылка
+        атомарно переключается под замком, так что идущие запросы
+        дорабатывают на старой модели.
+    """
+
+    def __init__(self, path: str, loader: Callable, k: int = 1, segment_size: int = 12000):
+        self.path = path
+        self.k = k
+        self.segment_size = segment_size
+        self._loader = loader
+        self._model = None
+        # _lock защищает только ссылку на модель, _load_lock не даёт грузить две модели одновременно
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.load_time = None
+        self.warmup_time = None
+        self.loaded_at = None
+        self.mtime = None
+        self.swaps = 0
+
+    def load(self, path: Optional[str] = None) -> dict:
+        with self._load_lock:
+            path = path or self.path
+
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            start = time.perf_counter()
+            model = self._loader(path)
+            load_time = time.perf_counter() - start
+
+            # Прогоняем пустой батч, чтобы граф построился до первого реального запроса
+            start = time.perf_counter()
+            model.predict(np.zeros((1, self.segment_size, self.k), dtype=np.float32), verbose=0)
+            warmup_time = time.perf_counter() - start
+
+            with self._lock:
+                if self._model is not None:
+                    self.swaps += 1
+                self._model = model
+                self.path = path
+                self.load_time = load_time
+                self.warmup_time = warmup_time
+                self.loaded_at = time.time()
+                self.mtime = mtime
+
+        metrics.log_event("model_loaded", path=path, load_seconds=round(load_time, 3),
+                          warmup_seconds=round(warmup_time, 3))
+        return self.stats()
+
+    def ensure(self, path: str):
+        # Воркер мог прогреть другую модель (или старую версию файла) до горячей подмены
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if not self.loaded or self.path != path or self.mtime != mtime:
+            self.load(path)
+        return self.get()
+
+    def get(self):
+        with self._lock:
+            model = self._model
+        if model is None:
+            self.load()
+            with self._lock:
+                model = self._model
+        return model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "loaded": self._model is not None,
+                "loaded_at": self.loaded_at,
+                "load_time": self.load_time,
+                "warmup_time": self.warmup_time,
+                "swaps": self.swaps,
+            }
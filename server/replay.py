@@ -0,0 +1,136 @@
+# Проигрывание edf файла в /live быстрее реального времени - проверка живой разметки без установки.
+# Без --url сервер поднимается в этом же процессе (TestClient), с --url нужен пакет websockets.
+# Печатает события, задержки разметки окон и сводку в json.
+# Запуск из корня репозитория:
+#   python -m server.replay <файл.edf> [--speed 20] [--block 400] [--url ws://localhost:8000/live]
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+import threading
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parser.parser import open_edf, read_signals
+
+
+class _RemoteSocket:
+    def __init__(self, url: str):
+        from websockets.sync.client import connect
+        self._socket = connect(url, max_size=None)
+
+    def send_bytes(self, data: bytes) -> None:
+        self._socket.send(data)
+
+    def send_json(self, data: dict) -> None:
+        self._socket.send(json.dumps(data))
+
+    def receive_json(self) -> dict:
+        return json.loads(self._socket.recv())
+
+    def close(self) -> None:
+        self._socket.close()
+
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    return {name: round(float(np.percentile(values, q)), 1) for name, q in (("p50", 50), ("p95", 95), ("max", 100))}
+
+
+# replay отправляет запись блоками по block точек со скоростью speed от реального времени
+# (0 - без пауз) и собирает ответы сервера
+def replay(socket, path: str, speed: float = 20.0, block: int = 400, chunk_size: int = 400 * 60,
+           verbose: bool = True) -> dict:
+    edf = open_edf(path)
+    sampling_frequency = int(edf.info["sfreq"])
+    n_samples = int(edf.n_times)
+    messages = []
+    # Время отправки блока, который заканчивается на точке sent_ends[i]
+    sent_ends, sent_times = [], []
+
+    def receive():
+        while True:
+            message = socket.receive_json()
+            message["received_at"] = time.perf_counter()
+            messages.append(message)
+            if verbose and message["event"] not in ("window", "done"):
+                print(json.dumps({key: value for key, value in message.items() if key != "received_at"}))
+            if message["event"] in ("done", "error"):
+                return
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+
+    start = time.perf_counter()
+    for chunk_start in range(0, n_samples, chunk_size):
+        signals = read_signals(edf, chunk_start, min(chunk_start + chunk_size, n_samples))
+        for offset in range(0, signals.shape[1], block):
+            samples = signals[:, offset:offset + block]
+            end = chunk_start + offset + samples.shape[1]
+            if speed > 0:
+                # Блок уходит не раньше, чем он был бы записан при ускорении speed
+                delay = start + end / sampling_frequency / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            socket.send_bytes(np.ascontiguousarray(samples.T, dtype="<f4").tobytes())
+            sent_ends.append(end)
+            sent_times.append(time.perf_counter())
+    socket.send_json({"command": "finish"})
+    receiver.join()
+    elapsed = time.perf_counter() - start
+
+    windows = [message for message in messages if message["event"] == "window"]
+    # Задержка с точки зрения клиента: от отправки блока, закрывшего окно, до ответа
+    client_latency = [(message["received_at"] - sent_times[bisect.bisect_left(sent_ends, message["end"])]) * 1000
+                      for message in windows]
+    counts = {}
+    for message in messages:
+        if message["event"] == "start":
+            counts[message["type"]] = counts.get(message["type"], 0) + 1
+    errors = [message["detail"] for message in messages if message["event"] == "error"]
+    return {
+        "file": path,
+        "samples": n_samples,
+        "seconds": elapsed,
+        "realtime_factor": n_samples / sampling_frequency / elapsed if elapsed > 0 else None,
+        "windows": len(windows),
+        "anomalies": counts,
+        "server_latency_ms": _percentiles([message["latency_ms"] for message in windows]),
+        "client_latency_ms": _percentiles(client_latency),
+        "errors": errors,
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Проигрывание edf в /live быстрее реального времени")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=20.0, help="ускорение относительно записи (0 - без пауз)")
+    parser.add_argument("--block", type=int, default=400, help="точек в одном сообщении")
+    parser.add_argument("--url", default=None, help="адрес /live (по умолчанию сервер в этом процессе)")
+    parser.add_argument("--quiet", action="store_true", help="не печатать события")
+    args = parser.parse_args(argv)
+
+    n_channels = len(open_edf(args.path).ch_names)
+    if args.url:
+        separator = "&" if "?" in args.url else "?"
+        socket = _RemoteSocket(f"{args.url}{separator}channels={n_channels}")
+        try:
+            summary = replay(socket, args.path, args.speed, args.block, verbose=not args.quiet)
+        finally:
+            socket.close()
+    else:
+        from fastapi.testclient import TestClient
+        from .main import app
+        with TestClient(app) as client, client.websocket_connect(f"/live?channels={n_channels}") as socket:
+            summary = replay(socket, args.path, args.speed, args.block, verbose=not args.quiet)
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+if __name__ == "__main__":
+    summary = main()
+    sys.exit(1 if summary["errors"] else 0)
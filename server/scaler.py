@@ -0,0 +1,149 @@
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+SCALER_MODES = ('global', 'window', 'rolling')
+
+
+class StreamingScaler:
+    """
+        Нормировка каналов как у StandardScaler, но статистики считаются потоково:
+        partial_fit принимает куски (n, n_channels) по порядку записи и сливает их
+        среднее и сумму квадратов отклонений по формуле Чана (Welford для кусков),
+        так что запись не нужно держать целиком, а точность не хуже двухпроходной.
+        Режимы:
+        - global  : одно среднее и отклонение на всю запись;
+        - window  : статистики каждого окна по нему самому (fit не нужен);
+        - rolling : статистики блоков по block_size точек, окно нормируется
+                    статистиками блока, в который попадает его середина.
+        Последние два режима держат модель в рабочем диапазоне на длинных записях
+        с дрейфом амплитуды.
+    """
+
+    def __init__(self, n_channels: int = 1, mode: str = 'global', block_size: int = 400 * 600):
+        if mode not in SCALER_MODES:
+            raise ValueError(f'Unknown scaler mode {mode}')
+        self.n_channels = n_channels
+        self.mode = mode
+        self.block_size = block_size
+        self.count = 0
+        self._mean = np.zeros(n_channels)
+        self._m2 = np.zeros(n_channels)
+        # Накопитель текущего блока и статистики законченных блоков (режим rolling)
+        self._block = (0, np.zeros(n_channels), np.zeros(n_channels))
+        self._blocks = []
+        self._block_stats = None
+
+    @staticmethod
+    def _merge(a: tuple, b: tuple) -> tuple:
+        count_a, mean_a, m2_a = a
+        count_b, mean_b, m2_b = b
+        count = count_a + count_b
+        if count == 0:
+            return a
+        delta = mean_b - mean_a
+        mean = mean_a + delta * (count_b / count)
+        m2 = m2_a + m2_b + delta ** 2 * (count_a * count_b / count)
+        return count, mean, m2
+
+    @staticmethod
+    def _chunk_stats(chunk: np.ndarray) -> tuple:
+        mean = chunk.mean(axis=0, dtype=np.float64)
+        m2 = np.square(chunk - mean).sum(axis=0)
+        return len(chunk), mean, m2
+
+    def partial_fit(self, chunk: np.ndarray) -> 'StreamingScaler':
+        if len(chunk) == 0:
+            return self
+        self._block_stats = None
+        if self.mode != 'rolling':
+            self.count, self._mean, self._m2 = self._merge((self.count, self._mean, self._m2),
+                                                           self._chunk_stats(chunk))
+            return self
+
+        # Кусок режется по границам блоков, статистики записи сливаются из статистик блоков
+        position = 0
+        while position < len(chunk):
+            filled = self._block[0]
+            piece = chunk[position:position + self.block_size - filled]
+            self._block = self._merge(self._block, self._chunk_stats(piece))
+            position += len(piece)
+            if self._block[0] == self.block_size:
+                self._close_block()
+        return self
+
+    def _close_block(self) -> None:
+        self._blocks.append(self._block)
+        self.count, self._mean, self._m2 = self._merge((self.count, self._mean, self._m2), self._block)
+        self._block = (0, np.zeros(self.n_channels), np.zeros(self.n_channels))
+
+    # merge добавляет статистики следующего по записи отрезка, посчитанные отдельно
+    # (например, в другом процессе). Для rolling отрезок должен начинаться на границе блока
+    def merge(self, other: 'StreamingScaler') -> 'StreamingScaler':
+        if self.mode == 'rolling':
+            if self._block[0]:
+                raise ValueError('Rolling statistics can only be merged on block boundaries')
+            self._blocks.extend(other._blocks)
+            self._block = other._block
+        self.count, self._mean, self._m2 = self._merge((self.count, self._mean, self._m2),
+                                                       (other.count, other._mean, other._m2))
+        self._block_stats = None
+        return self
+
+    def fit(self, chunks: Iterable[np.ndarray]) -> 'StreamingScaler':
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+
+    @staticmethod
+    def _finalize(count: int, mean: np.ndarray, m2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        std = np.sqrt(m2 / count) if count else np.ones_like(m2)
+        std[std == 0] = 1.0
+        return mean.astype(np.float32), std.astype(np.float32)
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.global_stats()[0]
+
+    @property
+    def std(self) -> np.ndarray:
+        return self.global_stats()[1]
+
+    def global_stats(self) -> Tuple[np.ndarray, np.ndarray]:
+        count, mean, m2 = self._merge((self.count, self._mean, self._m2), self._block)
+        return self._finalize(count, mean, m2)
+
+    def _rolling_stats(self) -> list:
+        if self._block_stats is None:
+            blocks = list(self._blocks)
+            if self._block[0]:
+                # Неполный последний блок короче половины сливается с предыдущим,
+                # чтобы хвост не нормировался по горстке точек
+                if blocks and self._block[0] < self.block_size // 2:
+                    blocks[-1] = self._merge(blocks[-1], self._block)
+                else:
+                    blocks.append(self._block)
+            self._block_stats = [self._finalize(*block) for block in blocks]
+        return self._block_stats
+
+    # stats возвращает среднее и отклонение (float32 по каналам) для окна [start, start + len(window))
+    def stats(self, window: np.ndarray, start: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        if self.mode == 'window':
+            return self._finalize(*self._chunk_stats(window))
+        if self.mode == 'rolling':
+            blocks = self._rolling_stats()
+            if blocks:
+                index = min((start + len(window) // 2) // self.block_size, len(blocks) - 1)
+                return blocks[index]
+        return self.global_stats()
+
+    # transform нормирует окно (n, n_channels), начинающееся с точки start записи.
+    # По умолчанию на месте (окно должно быть float32 и доступно на запись),
+    # иначе результат пишется в out без промежуточных копий
+    def transform(self, window: np.ndarray, start: int = 0, out: Optional[np.ndarray] = None) -> np.ndarray:
+        mean, std = self.stats(window, start)
+        if out is None:
+            out = window
+        np.subtract(window, mean, out=out)
+        np.divide(out, std, out=out)
+        return out
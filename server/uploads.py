@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import uuid
+import hashlib
+import threading
+from typing import Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from parser.parser import CHANNEL_NAMES
+
+# Предел размера загружаемого файла и время жизни незавершённой докачиваемой загрузки
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+UPLOAD_DIRECTORY = os.getenv("STATIC_DIRECTORY", "server/static")
+
+EDF_SAMPLING_FREQUENCY = 400
+EDF_FIXED_HEADER = 256
+EDF_SIGNAL_HEADER = 256
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidEdf(Exception):
+    pass
+
+
+# check_edf_header проверяет заголовок edf: размер, частоту дискретизации и число каналов.
+# Возвращает None, если байт пока не хватает, иначе {размер заголовка, каналы, частота}
+def check_edf_header(header: bytes) -> Optional[dict]:
+    if len(header) < EDF_FIXED_HEADER:
+        return None
+    try:
+        if header[:8].decode("ascii").strip() != "0":
+            raise InvalidEdf("Not an EDF file")
+        n_signals = int(header[252:256].decode("ascii"))
+        record_duration = float(header[244:252].decode("ascii"))
+    except (UnicodeDecodeError, ValueError):
+        raise InvalidEdf("Not an EDF file")
+    if n_signals <= 0 or record_duration <= 0:
+        raise InvalidEdf("Not an EDF file")
+
+    size = EDF_FIXED_HEADER + EDF_SIGNAL_HEADER * n_signals
+    if len(header) < size:
+        return None
+    signals = header[EDF_FIXED_HEADER:size]
+    labels = [signals[16 * i:16 * (i + 1)].decode("ascii", "replace").strip() for i in range(n_signals)]
+    # Поле "число отсчётов в записи" идёт после 16+80+8+8+8+8+8+80 байт на каждый сигнал
+    offset = 216 * n_signals
+    try:
+        samples = [int(signals[offset + 8 * i:offset + 8 * (i + 1)].decode("ascii")) for i in range(n_signals)]
+    except (UnicodeDecodeError, ValueError):
+        raise InvalidEdf("Corrupted EDF signal header")
+
+    channels = [label for label in labels if label != "EDF Annotations"]
+    rates = [count / record_duration for label, count in zip(labels, samples) if label != "EDF Annotations"]
+    if len(channels) < len(CHANNEL_NAMES):
+        raise InvalidEdf(f"Expected at least {len(CHANNEL_NAMES)} channels, got {len(channels)}")
+    # mne приводит все каналы к наибольшей частоте, её же проверяет парсер
+    if max(rates) != EDF_SAMPLING_FREQUENCY:
+        raise InvalidEdf(f"Sampling frequency is not {EDF_SAMPLING_FREQUENCY}Hz")
+    return {"header_bytes": size, "channels": channels, "sampling_frequency": max(rates)}
+
+
+class UploadWriter:
+    """
+        Запись загружаемого файла на диск кусками. Содержимое хэшируется по мере записи,
+        размер ограничен max_bytes, а заголовок edf проверяется, как только придёт целиком,
+        так что неподходящий файл отклоняется до получения всего тела запроса.
+    """
+
+    def __init__(self, path: str, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.header = None
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._file = open(path, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        if self.size + len(chunk) > self.max_bytes:
+            raise UploadTooLarge(f"File is larger than {self.max_bytes} bytes")
+        if self.header is None:
+            self._head += chunk
+            self.header = check_edf_header(self._head)
+            if self.header is not None:
+                self._head = b""
+        self._digest.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    # finish закрывает файл и возвращает sha256 содержимого
+    def finish(self) -> str:
+        self._file.close()
+        if self.header is None:
+            raise InvalidEdf("Truncated EDF header")
+        return self._digest.hexdigest()
+
+    def discard(self) -> None:
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MultipartUpload:
+    """
+        Потоковый разбор multipart/form-data: данные поля field сразу уходят в UploadWriter,
+        остальные поля пропускаются.
+    """
+
+    def __init__(self, content_type: str, writer: UploadWriter, field: str = "file"):
+        _, params = parse_options_header(content_type)
+        if b"boundary" not in params:
+            raise InvalidEdf("Missing multipart boundary")
+        self.writer = writer
+        self.field = field.encode()
+        self.filename = None
+        self.found = False
+        self._active = False
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def feed(self, chunk: bytes) -> None:
+        self._parser.write(chunk)
+
+    def finalize(self) -> None:
+        self._parser.finalize()
+        if not self.found:
+            raise InvalidEdf(f"Missing form field '{self.field.decode()}'")
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._active = params.get(b"name") == self.field and not self.found
+        if self._active:
+            self.found = True
+            self.filename = params.get(b"filename", b"").decode("utf-8", "replace") or None
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._active:
+            self.writer.write(data[start:end])
+
+    def _on_part_end(self) -> None:
+        self._active = False
+
+
+class UploadSession:
+    def __init__(self, filename: Optional[str], size: Optional[int], max_bytes: int, directory: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.size = size
+        self.writer = UploadWriter(os.path.join(directory, f"upload_{self.id}.part"),
+                                   min(size, max_bytes) if size is not None else max_bytes)
+        self.busy = False
+        self.updated_at = time.time()
+
+    @property
+    def offset(self) -> int:
+        return self.writer.size
+
+    def to_dict(self) -> dict:
+        return {"upload": self.id, "filename": self.filename, "offset": self.offset, "size": self.size}
+
+
+class UploadSessions:
+    """
+        Докачиваемые загрузки: файл присылается частями по порядку, каждая часть - со смещением,
+        с которого она начинается. Оборванную часть можно продолжить с текущего смещения.
+        Сессии хранятся в памяти процесса и удаляются через UPLOAD_SESSION_TTL без обращений.
+    """
+
+    def __init__(self, directory: str = UPLOAD_DIRECTORY, max_bytes: int = UPLOAD_MAX_BYTES,
+                 ttl: int = UPLOAD_SESSION_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename: Optional[str] = None, size: Optional[int] = None) -> UploadSession:
+        if size is not None and size > self.max_bytes:
+            raise UploadTooLarge(f"File is larger than {self.max_bytes} bytes")
+        session = UploadSession(filename, size, self.max_bytes, self.directory)
+        with self._lock:
+            self._purge()
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        with self._lock:
+            session = self.sessions.get(upload_id)
+        if session is not None:
+            session.updated_at = time.time()
+        return session
+
+    # pop убирает сессию из списка; файл остаётся у вызывающего (завершение или отмена)
+    def pop(self, upload_id: str) -> Optional[UploadSession]:
+        with self._lock:
+            return self.sessions.pop(upload_id, None)
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [upload_id for upload_id, session in self.sessions.items()
+                   if not session.busy and now - session.updated_at > self.ttl]
+        for upload_id in expired:
+            self.sessions.pop(upload_id).writer.discard()
@@ -2,22 +2,106 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from parser.parser import Analytics
+import numpy as np
+
+from parser.parser import Analytics, CHANNEL_NAMES
 
 from docx import Document
-from docx.shared import Pt
-from docx.oxml.ns import nsdecls
-from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.oxml import parse_xml, OxmlElement
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.enum.table import WD_ALIGN_VERTICAL
 
-def save_analytics_to_word(analytics: Analytics, output_file: str) -> None:
-    print("[DEBUG] Saving analytics to word")
+from . import metrics
+
+# Сколько аномалий попадает в таблицу деталей (0 - все). Сводка по типам считается по всем аномалиям
+WORD_MAX_ROWS = int(os.getenv("WORD_MAX_ROWS", "10000"))
+
+ANOMALY_NAMES = {1: 'SWD', 2: 'IS', 3: 'DS'}
+ROW_FILLS = ("D3D3D3", "FFFFFF")
+HEADER_FILL = "BFBFBF"
+
+# Шаблон ячейки строки: выравнивание, заливка и шрифт 10pt (w:sz в полупунктах) заданы прямо в xml,
+# так что строка собирается форматированием строки, а не отдельными вызовами python-docx на каждую ячейку
+_CELL = ('<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/><w:shd w:val="clear" w:color="auto" w:fill="{fill}"/>'
+         '<w:vAlign w:val="center"/></w:tcPr><w:p><w:pPr><w:jc w:val="center"/></w:pPr>'
+         '<w:r><w:rPr><w:sz w:val="20"/></w:rPr><w:t>{text}</w:t></w:r></w:p></w:tc>')
+
+
+def _add_table(doc: Document, headers: list):
+    table = doc.add_table(rows=1, cols=len(headers))
+    table.style = 'Table Grid'
+    hdr_cells = table.rows[0].cells
+    for i, header in enumerate(headers):
+        hdr_cells[i].text = header
+        hdr_cells[i].paragraphs[0].runs[0].font.bold = True
+        hdr_cells[i].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+        hdr_cells[i].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+        hdr_cells[i]._element.get_or_add_tcPr().append(
+            parse_xml(r'<w:shd {} w:val="clear" w:color="auto" w:fill="{}"/>'.format(nsdecls('w'), HEADER_FILL)))
+    # Шапка повторяется на каждой странице длинной таблицы
+    table.rows[0]._tr.get_or_add_trPr().append(OxmlElement('w:tblHeader'))
+    return table
+
+
+# _append_rows добавляет строки (списки строк текста) в таблицу разбором xml пачками по batch_size строк
+# вместо add_row и parse_xml на каждую ячейку
+def _append_rows(table, rows: list, batch_size: int = 1000) -> None:
+    widths = [int(cell.width.twips) if cell.width else 0 for cell in table.rows[0].cells]
+    for batch_start in range(0, len(rows), batch_size):
+        xml = []
+        for i, row in enumerate(rows[batch_start:batch_start + batch_size], batch_start):
+            fill = ROW_FILLS[i % 2]
+            xml.append('<w:tr>')
+            xml.extend(_CELL.format(width=width, fill=fill, text=text) for width, text in zip(widths, row))
+            xml.append('</w:tr>')
+        body = parse_xml('<w:tbl {}>{}</w:tbl>'.format(nsdecls('w'), ''.join(xml)))
+        table._tbl.extend(body.findall(qn('w:tr')))
+
+
+# Признаки аномалий в таблицах отчёта: ключ в analytics.features и заголовок столбца
+FEATURE_COLUMNS = [('dominant_frequency', 'Доминантная частота (Гц)'), ('swd_power', 'Мощность 5-9 Гц')]
+
+
+# _known - массив длины n из значений values, недостающие (не посчитанные) - nan
+def _known(values: list, n: int) -> np.ndarray:
+    result = np.full(n, np.nan)
+    known = np.asarray(values, dtype=np.float64)[:n]
+    result[:len(known)] = known
+    return result
+
+
+# _sorted_anomalies - все аномалии по времени начала: {столбец: массив} с типами, началами, концами,
+# пиковыми амплитудами и признаками (analytics.features)
+def _sorted_anomalies(analytics: Analytics) -> dict:
+    names = ['peak'] + [key for key, _ in FEATURE_COLUMNS] + [f'{channel.lower()}_rms' for channel in CHANNEL_NAMES]
+    columns = {name: [] for name in ['label', 'start', 'end'] + names}
+    for anomaly_type, intervals in analytics.anomalies_by_type.items():
+        bounds = np.asarray(intervals, dtype=np.float64).reshape(-1, 2)
+        columns['label'].append(np.full(len(bounds), anomaly_type))
+        columns['start'].append(bounds[:, 0])
+        columns['end'].append(bounds[:, 1])
+        # Если пиковые амплитуды или признаки не считались, в отчёте будет nan
+        columns['peak'].append(_known(analytics.peak_amplitudes[anomaly_type], len(bounds)))
+        features = analytics.features.get(anomaly_type, {})
+        for name in names[1:]:
+            columns[name].append(_known(features.get(name, []), len(bounds)))
+    columns = {name: np.concatenate(values) for name, values in columns.items()}
+    order = np.argsort(columns['start'], kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+def _mean(values: np.ndarray, fmt: str) -> str:
+    values = values[~np.isnan(values)]
+    return format(values.mean(), fmt) if len(values) else '-'
+
+
+def save_analytics_to_word(analytics: Analytics, output_file: str, max_rows: int = WORD_MAX_ROWS) -> None:
     doc = Document()
-    
+
     # Заголовок отчета
     doc.add_heading('Отчет по анализу кортикограмм', level=1)
-    
+
     # Общая аналитическая информация
     doc.add_paragraph(f'Общее количество аномалий: {analytics.anomaly_count}')
     doc.add_paragraph(f'Общая продолжительность записи (сек): {analytics.total_time:.2f}')
@@ -25,54 +109,45 @@ def save_analytics_to_word(analytics: Analytics, output_file: str) -> None:
     doc.add_paragraph(f'Средняя длительность аномалии (сек): {analytics.average_duration:.2f}')
     doc.add_paragraph(f'Процент времени с аномалиями: {analytics.time_with_anomalies:.2f}%')
     doc.add_paragraph(f'Средний интервал между аномалиями (сек): {analytics.average_interval:.2f}')
-    
+
+    anomalies = _sorted_anomalies(analytics)
+    labels, starts, ends, peaks = (anomalies[name] for name in ('label', 'start', 'end', 'peak'))
+    durations = ends - starts
+
+    # Сводка по типам аномалий, признаки - средние по аномалиям типа
+    doc.add_heading('Сводка по типам аномалий', level=2)
+    table = _add_table(doc, ['Тип аномалии', 'Количество', 'Общая длительность (сек)',
+                             'Средняя длительность (сек)', 'Пиковая амплитуда']
+                       + [f'{title}, среднее' for _, title in FEATURE_COLUMNS])
+    summary = []
+    for anomaly_type, name in ANOMALY_NAMES.items():
+        mask = labels == anomaly_type
+        count = int(mask.sum())
+        summary.append([name, str(count), f'{durations[mask].sum():.2f}',
+                        f'{durations[mask].mean():.2f}' if count else '-',
+                        f'{peaks[mask].max():.10e}' if count else '-',
+                        _mean(anomalies['dominant_frequency'][mask], '.2f'),
+                        _mean(anomalies['swd_power'][mask], '.3e')])
+    _append_rows(table, summary)
+
     # Заголовок таблицы
     # Аномалии в таблице указаны только если их длительность больше 5 секунд
     #doc.add_paragraph('В таблице указаны только аномалии, длительность которых больше 5 секунд')
     doc.add_heading('Детали аномалий', level=2)
-    
-    # Создаем таблицу
-    table = doc.add_table(rows=1, cols=4)
-    table.style = 'Table Grid'
-
-    # Заголовок таблицы
-    hdr_cells = table.rows[0].cells
-    headers = ['Тип аномалии', 'Начало (сек)', 'Конец (сек)', 'Пиковая амплитуда']
-    for i, header in enumerate(headers):
-        hdr_cells[i].text = header
-        hdr_cells[i].paragraphs[0].runs[0].font.bold = True
-        hdr_cells[i].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-        hdr_cells[i].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-        hdr_cells[i]._element.get_or_add_tcPr().append(parse_xml(r'<w:shd {} w:fill="BFBFBF"/>'.format(nsdecls('w'))))
+    shown = len(starts) if max_rows <= 0 else min(len(starts), max_rows)
+    if shown < len(starts):
+        doc.add_paragraph(f'Показаны первые {shown} из {len(starts)} аномалий, '
+                          f'полная разметка - в размеченном edf файле')
 
-    # Объединяем и сортируем все аномалии по времени начала
-    sorted_anomalies = []
-    for anomaly_type, intervals in analytics.anomalies_by_type.items():
-        for i, (start, end) in enumerate(intervals):
-            anomaly_name = 'SWD' if anomaly_type == 1 else 'IS' if anomaly_type == 2 else 'DS'
-            peak_amplitude = analytics.peak_amplitudes[anomaly_type][i]
-            sorted_anomalies.append((anomaly_name, start, end, peak_amplitude))
-
-    sorted_anomalies.sort(key=lambda x: x[1]) 
-    
-    for i, (anomaly_name, start, end, peak_amplitude) in enumerate(sorted_anomalies):
-        # если меньше 5 секунд то не добавляем
-        #if end - start < 5:
-        #    continue
-        row_cells = table.add_row().cells
-        row_cells[0].text = anomaly_name
-        row_cells[1].text = f'{start:.2f}'
-        row_cells[2].text = f'{end:.2f}'
-        row_cells[3].text = f'{peak_amplitude:.10e}'
-
-        for cell in row_cells:
-            cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            for run in cell.paragraphs[0].runs:
-                run.font.size = Pt(10)
-
-        shading_color = "D3D3D3" if i % 2 == 0 else "FFFFFF"
-        for cell in row_cells:
-            cell._element.get_or_add_tcPr().append(parse_xml(r'<w:shd {} w:fill="{}"/>'.format(nsdecls('w'), shading_color)))
+    table = _add_table(doc, ['Тип аномалии', 'Начало (сек)', 'Конец (сек)', 'Пиковая амплитуда']
+                       + [title for _, title in FEATURE_COLUMNS] + [f'RMS {channel}' for channel in CHANNEL_NAMES])
+    names = [ANOMALY_NAMES[label] for label in labels[:shown].tolist()]
+    features = zip(*(anomalies[key][:shown].tolist() for key, _ in FEATURE_COLUMNS))
+    rms = zip(*(anomalies[f'{channel.lower()}_rms'][:shown].tolist() for channel in CHANNEL_NAMES))
+    _append_rows(table, [[name, f'{start:.2f}', f'{end:.2f}', f'{peak:.10e}', f'{frequency:.2f}', f'{power:.3e}']
+                         + [f'{value:.3e}' for value in channel_rms]
+                         for name, start, end, peak, (frequency, power), channel_rms
+                         in zip(names, starts[:shown].tolist(), ends[:shown].tolist(), peaks[:shown].tolist(),
+                                features, rms)])
     doc.save(output_file)
-    print ("[DEBUG] Word file saved to", output_file)
+    metrics.log_event("word_saved", path=output_file)
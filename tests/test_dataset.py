@@ -0,0 +1,43 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+import numpy as np
+
+from parser.dataset import Dataset, build_dataset, segment_offsets
+from parser.parser import open_edf, read_signals, read_labels
+from synthetic import make_edf
+
+
+# Маленькие шарды и окна с перекрытием: часть окон начинается у конца шарда и заходит в следующий
+def test_windows_across_shard_boundaries_are_kept(tmp_path):
+    path = make_edf(str(tmp_path / 'a.edf'), 95.5, n_events=6, seed=1)
+    header = build_dataset([path], str(tmp_path / 'dataset'), segment_size=1000, stride=400, shard_size=4000)
+    dataset = Dataset(str(tmp_path / 'dataset'))
+
+    edf = open_edf(path)
+    n_samples = int(edf.n_times)
+    signals = read_signals(edf, 0, n_samples).T
+    labels = read_labels(edf, n_samples)
+    offsets = segment_offsets(n_samples, 1000, 400)
+    assert len(header['shards']) > 1
+    assert len(dataset) == len(offsets)
+
+    x, y = dataset.batch(np.arange(len(dataset)), channels=(0, 1, 2), normalize=False)
+    starts = np.array([shard['start'] for shard in dataset.shards])[dataset.segments['shard']]
+    assert np.array_equal(starts + dataset.segments['offset'], offsets)
+    for window, window_labels, offset in zip(x, y, offsets):
+        assert np.array_equal(window, signals[offset:offset + 1000])
+        assert np.array_equal(window_labels, labels[offset:offset + 1000])
+
+
+def test_normalization_stats_match_whole_recording(tmp_path):
+    path = make_edf(str(tmp_path / 'a.edf'), 60, n_events=4, seed=2)
+    build_dataset([path], str(tmp_path / 'dataset'), segment_size=1000, shard_size=7000)
+    file = Dataset(str(tmp_path / 'dataset')).files[0]
+
+    edf = open_edf(path)
+    signals = read_signals(edf, 0, int(edf.n_times)).astype(np.float64)
+    assert np.allclose(file['mean'], signals.mean(axis=1), rtol=1e-5, atol=1e-12)
+    assert np.allclose(file['std'], signals.std(axis=1), rtol=1e-5)
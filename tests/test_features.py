@@ -0,0 +1,42 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from docx import Document
+
+from parser.parser import CHANNEL_NAMES, Recording, compute_analytics
+from server.word import save_analytics_to_word
+
+
+# Запись с одной аномалией SWD 7 Гц и своими метками каналов (не FrL/FrR/OcR)
+def labelled_recording(ch_names):
+    rng = np.random.default_rng(0)
+    signals = rng.normal(0, 1e-5, (3, 400 * 60)).astype(np.float32)
+    labels = np.zeros(signals.shape[1], dtype=np.int8)
+    t = np.arange(4000) / 400
+    signals[:, 8000:12000] += (1e-4 * np.sin(2 * np.pi * 7 * t)).astype(np.float32)
+    labels[8000:12000] = 1
+    return Recording(signals, labels, 400, ch_names)
+
+
+def test_rms_features_do_not_depend_on_edf_channel_labels():
+    default = compute_analytics(labelled_recording(None))
+    custom = compute_analytics(labelled_recording(['EEG 1', 'EEG 2', 'EEG 3']))
+    for channel in CHANNEL_NAMES:
+        key = f'{channel.lower()}_rms'
+        assert not np.isnan(custom.features[1][key]).any()
+        assert custom.features[1][key] == default.features[1][key]
+
+
+def test_word_report_has_rms_for_custom_channel_labels(tmp_path):
+    analytics = compute_analytics(labelled_recording(['EEG 1', 'EEG 2', 'EEG 3']))
+    path = str(tmp_path / 'report.docx')
+    save_analytics_to_word(analytics, path)
+    detail = Document(path).tables[-1]
+    header = [cell.text for cell in detail.rows[0].cells]
+    row = [cell.text for cell in detail.rows[1].cells]
+    for channel in CHANNEL_NAMES:
+        value = row[header.index(f'RMS {channel}')]
+        assert value not in ('nan', '-')
+        assert float(value) > 0
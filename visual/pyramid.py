@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+from functools import lru_cache
+from typing import Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from parser.parser import Recording, load_bin
+
+# Каждый следующий уровень пирамиды в PYRAMID_FACTOR раз грубее предыдущего
+PYRAMID_FACTOR = 4
+# Последний уровень строится, когда в нём остаётся не больше MIN_LEVEL_SIZE точек
+MIN_LEVEL_SIZE = 1024
+
+
+# build_pyramid сохраняет для каждого канала многоуровневое min/max прореживание:
+# - {канал}_L.npy : матрица (n, 2) минимумов и максимумов блоков по PYRAMID_FACTOR**L точек
+# Нулевой уровень - сам сигнал, он берётся из бинарного формата записи (save_to_bin)
+# в том же каталоге.
+# Уровень L считается из уровня L-1, поэтому вся пирамида строится за один проход по сигналу,
+# а уровни начиная с первого вместе занимают около 2/3 от размера исходного канала.
+def build_pyramid(recording: Recording, directory: str) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    levels = 0
+    for name, signal in zip(recording.ch_names, recording.signals):
+        name = name.lower()
+        n_blocks = len(signal) // PYRAMID_FACTOR
+        level = np.empty((n_blocks, 2), dtype=np.float32)
+        blocks = signal[:n_blocks * PYRAMID_FACTOR].reshape(-1, PYRAMID_FACTOR)
+        blocks.min(axis=1, out=level[:, 0])
+        blocks.max(axis=1, out=level[:, 1])
+
+        index = 1
+        while True:
+            np.save(os.path.join(directory, f'{name}_{index}.npy'), level)
+            if len(level) <= MIN_LEVEL_SIZE:
+                break
+            n_blocks = len(level) // PYRAMID_FACTOR
+            blocks = level[:n_blocks * PYRAMID_FACTOR].reshape(-1, PYRAMID_FACTOR, 2)
+            level = np.column_stack((blocks[:, :, 0].min(axis=1), blocks[:, :, 1].max(axis=1)))
+            index += 1
+        levels = index
+
+    header = {
+        'factor': PYRAMID_FACTOR,
+        'levels': levels,
+        'sampling_frequency': recording.sampling_frequency,
+        'n_samples': recording.n_samples,
+        'channels': [name.lower() for name in recording.ch_names],
+    }
+    with open(os.path.join(directory, 'pyramid.json'), 'w') as f:
+        json.dump(header, f)
+    return header
+
+
+@lru_cache(maxsize=32)
+def read_header(directory: str) -> dict:
+    with open(os.path.join(directory, 'pyramid.json')) as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=256)
+def _level(directory: str, channel: str, index: int) -> np.ndarray:
+    if index == 0:
+        return load_bin(directory).channel(read_header(directory)['channels'].index(channel))
+    return np.load(os.path.join(directory, f'{channel}_{index}.npy'), mmap_mode='r')
+
+
+# clear_cache закрывает закэшированные заголовки и memmap уровней пирамиды:
+# пока они открыты, место удалённых файлов записи не освобождается
+def clear_cache() -> None:
+    _level.cache_clear()
+    read_header.cache_clear()
+
+
+# query_pyramid возвращает точки для окна [t0, t1) секунд при ширине графика px пикселей.
+# Если исходных точек в окне не больше 2*px, отдаётся сам сигнал. Иначе берётся самый
+# грубый уровень, блок которого не больше одного пикселя, и для каждого пикселя
+# отдаются минимум и максимум (x повторяется дважды), так что пики не сглаживаются.
+def query_pyramid(directory: str, channel: str, t0: float = 0.0, t1: Optional[float] = None, px: int = 1000) -> dict:
+    header = read_header(directory)
+    channel = channel.lower()
+    if channel not in header['channels']:
+        raise KeyError(channel)
+
+    sampling_frequency = header['sampling_frequency']
+    n_samples = header['n_samples']
+    start = min(max(int(t0 * sampling_frequency), 0), n_samples)
+    stop = n_samples if t1 is None else min(max(int(np.ceil(t1 * sampling_frequency)), start), n_samples)
+    px = max(int(px), 1)
+
+    if stop - start <= 2 * px:
+        signal = _level(directory, channel, 0)[start:stop]
+        return {
+            'level': 0,
+            'x': ((np.arange(start, stop)) / sampling_frequency).tolist(),
+            'y': np.asarray(signal, dtype=np.float64).tolist(),
+        }
+
+    samples_per_pixel = (stop - start) / px
+    factor = header['factor']
+    index = min(int(np.log(samples_per_pixel) / np.log(factor) + 1e-9), header['levels'])
+    index = max(index, 1)
+    block = factor ** index
+
+    level = _level(directory, channel, index)
+    first, last = start // block, min(-(-stop // block), len(level))
+    bins = np.asarray(level[first:last])
+    # Разбиваем блоки окна на px групп и сворачиваем каждую группу в min/max
+    edges = np.unique(np.linspace(0, len(bins), px + 1).astype(np.int64)[:-1])
+    mins = np.minimum.reduceat(bins[:, 0], edges)
+    maxs = np.maximum.reduceat(bins[:, 1], edges)
+    centers = ((first + edges) * block + np.diff(np.append(edges, len(bins))) * block / 2) / sampling_frequency
+
+    return {
+        'level': index,
+        'x': np.repeat(centers, 2).tolist(),
+        'y': np.column_stack((mins, maxs)).ravel().astype(np.float64).tolist(),
+    }
@@ -1,21 +1,84 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import numpy as np
 import plotly.graph_objects as go
 import json
-import plotly
+import base64
+from typing import Optional
+
+from parser.parser import Recording, as_recording
+
+# Как массивы numpy попадают в json графика: base64 - типизированный массив {"dtype", "bdata"},
+# который plotly.js (начиная с 2.28) разбирает без парсинга чисел, list - обычный список чисел
+PLOT_ARRAY_ENCODING = os.getenv("PLOT_ARRAY_ENCODING", "base64")
+
+# Типы numpy, для которых в plotly.js есть типизированные массивы
+TYPED_ARRAY_DTYPES = {
+    np.dtype('float64'): 'f8', np.dtype('float32'): 'f4',
+    np.dtype('int32'): 'i4', np.dtype('int16'): 'i2', np.dtype('int8'): 'i1',
+    np.dtype('uint32'): 'u4', np.dtype('uint16'): 'u2', np.dtype('uint8'): 'u1',
+}
+
+
+def _encode_array(array: np.ndarray, encoding: str):
+    dtype = TYPED_ARRAY_DTYPES.get(array.dtype.newbyteorder('='))
+    if encoding == 'base64' and dtype is not None and array.ndim == 1:
+        data = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+        return {'dtype': dtype, 'bdata': base64.b64encode(data).decode('ascii')}
+    values = array.tolist()
+    # NaN в json записывается как null (как у PlotlyJSONEncoder)
+    if array.dtype.kind == 'f' and array.ndim == 1 and np.isnan(array).any():
+        values = [None if value != value else value for value in values]
+    return values
+
+
+# figure_to_json сериализует график за один проход json.dumps: массивы numpy кодируются целиком
+# (_encode_array), без поэлементного обхода и повторного разбора результата, как в PlotlyJSONEncoder
+def figure_to_json(fig: go.Figure, encoding: Optional[str] = None) -> str:
+    encoding = encoding or PLOT_ARRAY_ENCODING
+
+    def default(value):
+        if isinstance(value, np.ndarray):
+            return _encode_array(value, encoding)
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    return json.dumps(fig.to_plotly_json(), default=default, separators=(',', ':'))
+
+
+# decode_array - массив numpy из значения json графика: типизированного массива или списка (null - NaN)
+def decode_array(value) -> np.ndarray:
+    if isinstance(value, dict):
+        dtype = {code: dtype for dtype, code in TYPED_ARRAY_DTYPES.items()}[value['dtype']]
+        return np.frombuffer(base64.b64decode(value['bdata']), dtype=dtype.newbyteorder('<'))
+    return np.array([np.nan if item is None else item for item in value])
 
-def plot_channel(data_with_classes: np.ndarray, channel_name: str, channel_index: int, resample_factor: int = 400) -> str:
-    channel_data = data_with_classes[:, channel_index]
-    classes = data_with_classes[:, -1]
-    time_axis = np.arange(len(channel_data)) / 400  
-    
-    if resample_factor > 1:
-        channel_data = channel_data[:len(channel_data) // resample_factor * resample_factor]
-        time_axis = time_axis[:len(time_axis) // resample_factor * resample_factor]
-        classes = classes[:len(classes) // resample_factor * resample_factor]
-        
-        channel_data = channel_data.reshape(-1, resample_factor).mean(axis=1)
-        time_axis = time_axis.reshape(-1, resample_factor).mean(axis=1)
-        classes = classes.reshape(-1, resample_factor).max(axis=1) 
+
+# downsample усредняет канал блоками по resample_factor точек и берёт максимум класса в блоке.
+# Ось времени считается сразу для центров блоков, без полного массива на каждую точку
+def downsample(recording: Recording, channel_index: int, resample_factor: int):
+    channel_data = recording.channel(channel_index)
+    classes = recording.labels
+    sampling_frequency = recording.sampling_frequency
+    if resample_factor <= 1:
+        return channel_data, np.arange(len(channel_data)) / sampling_frequency, classes
+
+    n_blocks = len(channel_data) // resample_factor
+    channel_data = channel_data[:n_blocks * resample_factor].reshape(-1, resample_factor).mean(axis=1, dtype=np.float64)
+    classes = classes[:n_blocks * resample_factor].reshape(-1, resample_factor).max(axis=1)
+    time_axis = (np.arange(n_blocks) * resample_factor + (resample_factor - 1) / 2) / sampling_frequency
+    return channel_data, time_axis, classes
+
+def plot_channel(recording: Recording, channel_name: str, channel_index: int, resample_factor: int = 400) -> str:
+    return figure_to_json(channel_figure(recording, channel_name, channel_index, resample_factor))
+
+
+# channel_figure строит график канала: сигнал и пунктирные границы аномалий по слою на класс
+def channel_figure(recording: Recording, channel_name: str, channel_index: int, resample_factor: int = 400) -> go.Figure:
+    channel_data, time_axis, classes = downsample(as_recording(recording), channel_index, resample_factor)
 
     fig = go.Figure()
 
@@ -45,55 +108,29 @@ def plot_channel(data_with_classes: np.ndarray, channel_name: str, channel_index
         3: 'DS'
     }
 
-    class_exists = {
-        0: False,
-        1: False,
-        2: False,
-        3: False
-    }
-    end_count = 0
-    start_count = 0
-    for i in range(1, len(classes)):
-        if classes[i] != classes[i-1]: 
-            if classes[i-1] != 0:
-                class_exists[classes[i]] = True
-                fig.add_trace(go.Scatter(
-                    x=[time_axis[i], time_axis[i]],
-                    y=[min(channel_data), max(channel_data)],
-                    mode='lines',
-                    line=dict(color=class_colors[classes[i-1]], dash='dot'),
-                    showlegend=True,
-                    legendgroup=class_labels[classes[i-1]],
-                    name=class_labels[classes[i-1] ]
-                )
-                )
-                end_count += 1
-
-            if classes[i] != 0:
-                class_exists[classes[i]] = True
-                fig.add_trace(go.Scatter(
-                    x=[time_axis[i], time_axis[i]],
-                    y=[min(channel_data), max(channel_data)],
-                    mode='lines',
-                    line=dict(color=class_colors[classes[i]], dash='dot'),
-                    showlegend=True,
-                    name=class_labels[classes[i]],
-                    legendgroup=class_labels[classes[i]]
-                ))
-                start_count += 1
-
-    print("START COUNT", start_count)
-    print("END COUNT", end_count)
+    # Границы аномалий - точки, где класс меняется. Для каждого класса все его
+    # вертикальные линии начала и конца собираются в одну трассу, разделённую NaN.
+    # Запись короче resample_factor даёт пустой канал - тогда границ нет
+    change = np.flatnonzero(classes[1:] != classes[:-1]) + 1
+    previous, current = classes[change - 1], classes[change]
+    y_min, y_max = (float(channel_data.min()), float(channel_data.max())) if len(channel_data) else (0.0, 0.0)
+
     for class_type in class_labels:
-        if class_exists[class_type]:
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None], 
-                mode='markers',
-                marker=dict(color=class_colors[class_type], size=10),
-                name=class_labels[class_type],
-                showlegend=True,
-                legendgroup=class_labels[classes[i]]
-            ))
+        if class_type == 0 or len(channel_data) == 0:
+            continue
+        boundaries = np.sort(np.concatenate((change[previous == class_type], change[current == class_type])))
+        if len(boundaries) == 0:
+            continue
+        times = time_axis[boundaries]
+        fig.add_trace(go.Scatter(
+            x=np.column_stack((times, times, np.full(len(times), np.nan))).ravel(),
+            y=np.tile([y_min, y_max, np.nan], len(times)),
+            mode='lines',
+            line=dict(color=class_colors[class_type], dash='dot'),
+            showlegend=True,
+            name=class_labels[class_type],
+            legendgroup=class_labels[class_type]
+        ))
 
     # Настройки осей и заголовок
     fig.update_layout(
@@ -102,25 +139,11 @@ def plot_channel(data_with_classes: np.ndarray, channel_name: str, channel_index
         yaxis_title="Амплитуда",
         legend_title="Тип аномалии"
     )
+    return fig
 
-    fig_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
-    return fig_json
-
-
-def simple_plot_channel(data_with_classes: np.ndarray, channel_name: str, channel_index: int, resample_factor: int = 4) -> str:
-    channel_data = data_with_classes[:, channel_index]
-    classes = data_with_classes[:, -1]
-    time_axis = np.arange(len(channel_data)) / 400  
-    
 
-    if resample_factor > 1:
-        channel_data = channel_data[:len(channel_data) // resample_factor * resample_factor] 
-        time_axis = time_axis[:len(time_axis) // resample_factor * resample_factor]
-        classes = classes[:len(classes) // resample_factor * resample_factor]
-        
-        channel_data = channel_data.reshape(-1, resample_factor).mean(axis=1)
-        time_axis = time_axis.reshape(-1, resample_factor).mean(axis=1)
-        classes = classes.reshape(-1, resample_factor).max(axis=1)
+def simple_plot_channel(recording: Recording, channel_name: str, channel_index: int, resample_factor: int = 4) -> str:
+    channel_data, time_axis, classes = downsample(as_recording(recording), channel_index, resample_factor)
     
     fig = go.Figure()
 
@@ -153,5 +176,4 @@ def simple_plot_channel(data_with_classes: np.ndarray, channel_name: str, channe
         legend_title="Тип аномалии"
     )
 
-    fig_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
-    return fig_json
+    return figure_to_json(fig)